@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Benchmark: aircraft.json latency under concurrent pollers.
+
+Usage:
+    python3 bench/bench_http.py [--pollers 50] [--seconds 20] [--aircraft 3000]
+                                [--interval 1.0] [--slow 1] [--server threaded|single]
+
+A server process publishes a synthetic snapshot and serves it with either
+MergerHTTPServer (threaded, keep-alive) or the old single-threaded
+HTTPServer. Poller threads in a second process each fetch aircraft.json
+every --interval seconds (gzip, If-None-Match like the dashboard map) and
+record request latency; --slow clients trickle their request headers and
+then read the identity body at 16 KiB/s, like a remote consumer on a bad
+link. Reports p50/p99/max
+per server. Without --server both are run.
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import merge  # noqa: E402
+import merge_table  # noqa: E402
+
+
+def synthetic_aircraft(n):
+    rnd = random.Random(1)
+    out = []
+    for i in range(n):
+        out.append({
+            "hex": f"{0xA00000 + i:06x}", "flight": f"TST{i:04d} ", "alt_baro": rnd.randrange(0, 40000),
+            "gs": rnd.uniform(0, 500), "track": rnd.uniform(0, 360), "lat": rnd.uniform(30, 45),
+            "lon": rnd.uniform(-125, -100), "squawk": f"{rnd.randrange(0, 7777):04d}", "seen": 0.5,
+            "seen_pos": 0.7, "rssi": -20.0, "messages": rnd.randrange(1, 10000),
+        })
+    return out
+
+
+class _SingleHandler(merge.Handler):
+    # The pre-threading behaviour: one connection per request
+    protocol_version = "HTTP/1.0"
+
+
+def _serve(kind, n_aircraft, port_q):
+    aircraft = synthetic_aircraft(n_aircraft)
+    table = merge_table.MergeTable(merge.STALE_SECONDS)
+    table.commit(table.update_local(aircraft))
+    merge._publish(table.aircraft(), time.time(), 0, merge_table.Changeset(table.version, {}, {}, []))
+    if kind == "single":
+        from http.server import HTTPServer
+        server = HTTPServer(("127.0.0.1", 0), _SingleHandler)
+    else:
+        server = merge.MergerHTTPServer(("127.0.0.1", 0), merge.Handler)
+    port_q.put(server.server_address[1])
+
+    def republish():
+        while True:
+            time.sleep(1.5)
+            for ac in aircraft[::10]:
+                ac["seen"] = round(random.uniform(0, 2), 1)
+            changes = table.commit(table.update_local([dict(ac) for ac in aircraft]))
+            merge._publish(table.aircraft(), time.time(), 0, changes)
+
+    threading.Thread(target=republish, daemon=True).start()
+    server.serve_forever()
+
+
+def _poller(port, stop_at, interval, latencies, errors):
+    conn = None
+    etag = None
+    time.sleep(random.uniform(0, interval))
+    while time.time() < stop_at:
+        t0 = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            headers = {"Accept-Encoding": "gzip"}
+            if etag:
+                headers["If-None-Match"] = etag
+            conn.request("GET", "/data/aircraft.json", headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            etag = resp.getheader("ETag") or etag
+            if resp.will_close:
+                conn.close()
+                conn = None
+            latencies.append(time.perf_counter() - t0)
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            if conn is not None:
+                conn.close()
+            conn = None
+        time.sleep(max(0.0, interval - (time.perf_counter() - t0)))
+
+
+_SLOW_REQUEST = b"GET /data/aircraft.json HTTP/1.1\r\nHost: bench\r\nUser-Agent: slow-link\r\n\r\n"
+
+
+def _slow_client(port, stop_at):
+    while time.time() < stop_at:
+        try:
+            sock = socket.create_connection(("127.0.0.1", port), timeout=30)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            for i in range(0, len(_SLOW_REQUEST), 4):
+                if time.time() >= stop_at:
+                    break
+                sock.sendall(_SLOW_REQUEST[i:i + 4])
+                time.sleep(0.05)
+            while time.time() < stop_at:
+                if not sock.recv(4096):
+                    break
+                time.sleep(0.25)
+            sock.close()
+        except OSError:
+            time.sleep(0.5)
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def run(kind, args):
+    port_q = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(kind, args.aircraft, port_q), daemon=True)
+    server.start()
+    port = port_q.get()
+    time.sleep(0.3)
+    stop_at = time.time() + args.seconds
+    latencies, errors = [], []
+    threads = [threading.Thread(target=_slow_client, args=(port, stop_at), daemon=True)
+               for _ in range(args.slow)]
+    threads += [threading.Thread(target=_poller, args=(port, stop_at, args.interval, latencies, errors))
+                for _ in range(args.pollers)]
+    for t in threads:
+        t.start()
+    for t in threads[args.slow:]:
+        t.join()
+    server.terminate()
+    lat = sorted(latencies)
+    print(f"{kind:>8}: {len(lat)} requests, {len(errors)} errors, "
+          f"p50 {_percentile(lat, 50) * 1000:.1f} ms, p99 {_percentile(lat, 99) * 1000:.1f} ms, "
+          f"max {(lat[-1] if lat else float('nan')) * 1000:.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pollers", type=int, default=50)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--aircraft", type=int, default=3000)
+    ap.add_argument("--interval", type=float, default=1.0)
+    ap.add_argument("--slow", type=int, default=1)
+    ap.add_argument("--server", choices=("threaded", "single"))
+    args = ap.parse_args()
+    print(f"{args.pollers} pollers every {args.interval}s, {args.slow} slow client(s), "
+          f"{args.aircraft} aircraft, {args.seconds}s")
+    for kind in ([args.server] if args.server else ["single", "threaded"]):
+        run(kind, args)
+
+
+if __name__ == "__main__":
+    main()
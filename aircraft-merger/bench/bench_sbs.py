@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Benchmark: ADSBHub SBS ingestion CPU cost, old loop vs sbs.LineBuffer/SbsTable.
+
+Usage:
+    python3 bench/bench_sbs.py [--messages 500000] [--aircraft 8000] [--rate 20000]
+
+A synthetic SBS stream (MSG,1/3/4 mix over --aircraft hexes) is fed in
+64 KiB recv-sized chunks, including the merge loop draining changes every
+1.5 s worth of messages. "before" is the previous _run_sbs_client() body
+(bytes += chunk, partition per line, per-field try blocks, full dict copy
+per recv). CPU per message is converted to a share of one core at --rate
+messages per second.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import sbs  # noqa: E402
+
+
+def synthetic_stream(n_messages, n_aircraft):
+    rnd = random.Random(7)
+    hexes = [f"{rnd.randrange(0x100000, 0xFFFFFF):06X}" for _ in range(n_aircraft)]
+    lines = []
+    for i in range(n_messages):
+        h = hexes[rnd.randrange(n_aircraft)]
+        kind = rnd.choice((1, 3, 3, 3, 4, 4))
+        head = f"MSG,{kind},1,1,{h},1,2024/01/01,12:00:00.000,2024/01/01,12:00:00.000"
+        if kind == 1:
+            rest = f",TST{i % 1000:04d},,,,,,,,,,,"
+        elif kind == 3:
+            rest = (f",,{rnd.randrange(0, 40000)},,,{rnd.uniform(30, 45):.5f},"
+                    f"{rnd.uniform(-125, -100):.5f},,,0,0,0,0")
+        else:
+            rest = f",,,{rnd.randrange(0, 500)},{rnd.uniform(0, 360):.1f},,,{rnd.randrange(-40, 40) * 64},,,,,"
+        lines.append(head + rest)
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def _chunks(data, size=65536):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def before(data, drain_every):
+    """The previous implementation, kept here for comparison."""
+
+    def parse(line):
+        line = line.strip()
+        if not line or not line.startswith("MSG,"):
+            return None
+        parts = line.split(",")
+        if len(parts) < 17:
+            return None
+        hex_ = (parts[4] or "").strip().upper()
+        if not hex_ or len(hex_) != 6:
+            return None
+        out = {"hex": hex_, "source": "adsbhub"}
+        if len(parts) > 10 and (parts[10] or "").strip():
+            out["flight"] = (parts[10] or "").strip()[:8]
+        for idx, key, conv in ((11, "alt_baro", lambda v: int(float(v))), (12, "gs", lambda v: int(float(v))),
+                               (13, "track", lambda v: int(float(v))), (14, "lat", float), (15, "lon", float),
+                               (16, "baro_rate", lambda v: int(float(v)) * 64),
+                               (17, "squawk", lambda v: str(int(float(v))).zfill(4)),
+                               (18, "on_ground", lambda v: bool(int(float(v))))):
+            if len(parts) > idx and parts[idx]:
+                try:
+                    out[key] = conv(parts[idx])
+                except (ValueError, TypeError):
+                    pass
+        return out
+
+    table, last_seen, shared = {}, {}, {}
+    buf = b""
+    parsed = 0
+    for chunk in _chunks(data):
+        buf += chunk
+        while b"\n" in buf or b"\r" in buf:
+            line, _, buf = buf.partition(b"\n")
+            if b"\r" in line:
+                line = line.split(b"\r")[0]
+            rec = parse(line.decode("utf-8", errors="ignore"))
+            if rec:
+                hex_ = rec["hex"]
+                base = table.get(hex_, {"hex": hex_, "source": "adsbhub"})
+                for k, v in rec.items():
+                    if k != "hex" and v is not None:
+                        base[k] = v
+                table[hex_] = base
+                last_seen[hex_] = time.time()
+                parsed += 1
+        shared = dict(table)
+    return parsed, len(shared)
+
+
+def after(data, drain_every):
+    table = sbs.SbsTable()
+    buf = sbs.LineBuffer()
+    mirror = {}
+    parsed = 0
+    since_drain = 0
+
+    class _Sock:
+        def __init__(self, data):
+            self._data = memoryview(data)
+            self._pos = 0
+
+        def recv_into(self, view):
+            chunk = self._data[self._pos:self._pos + min(len(view), 65536)]
+            view[:len(chunk)] = chunk
+            self._pos += len(chunk)
+            return len(chunk)
+
+    sock = _Sock(data)
+    while buf.recv_from(sock):
+        lines = buf.lines()
+        if lines:
+            n = table.apply(lines)
+            parsed += n
+            since_drain += n
+            if since_drain >= drain_every:
+                mirror.update(table.take_changes()[1])
+                since_drain = 0
+    mirror.update(table.take_changes()[1])
+    return parsed, len(mirror)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=500000)
+    ap.add_argument("--aircraft", type=int, default=8000)
+    ap.add_argument("--rate", type=float, default=20000, help="firehose messages per second")
+    args = ap.parse_args()
+    data = synthetic_stream(args.messages, args.aircraft)
+    drain_every = int(args.rate * 1.5)
+    print(f"{args.messages} messages, {len(data) / 1e6:.1f} MB, {args.aircraft} aircraft")
+    for name, fn in (("before", before), ("after", after)):
+        t0 = time.process_time()
+        parsed, hexes = fn(data, drain_every)
+        cpu = time.process_time() - t0
+        per_msg = cpu / max(parsed, 1)
+        print(f"{name:>7}: {parsed} parsed, {hexes} hexes, {cpu:.2f}s CPU, {per_msg * 1e6:.2f} us/msg, "
+              f"{per_msg * args.rate * 100:.1f}% of a core at {args.rate:.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
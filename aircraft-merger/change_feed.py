@@ -0,0 +1,104 @@
+"""Change feed — per-cycle aircraft deltas for streaming consumers.
+
+Instead of polling the full aircraft.json, a consumer holds one connection to
+/data/stream and receives:
+
+  * a snapshot event on connect (the current aircraft.json body, unchanged),
+  * one delta event per merge cycle that changed the output:
+        {"type": "delta", "cursor": ..., "version": N, "now": ...,
+         "added": [aircraft...], "updated": [aircraft...], "removed": [hex...]}
+  * a heartbeat when nothing changed for MERGER_FEED_HEARTBEAT seconds.
+
+Every event carries a cursor "<epoch>.<version>"; the epoch is the merger's
+start time, so cursors from before a restart are not mistaken for current
+ones. Reconnecting with ?since=<cursor> (or the SSE Last-Event-ID header)
+resumes with the deltas after that cursor while they are still among the
+last MERGER_FEED_HISTORY cycles, and falls back to a snapshot otherwise.
+
+Each event is serialized once when the merge loop publishes it; subscriber
+threads only write the shared bytes. Output is NDJSON by default, or
+Server-Sent Events for clients that send Accept: text/event-stream or
+?format=sse.
+"""
+
+import collections
+import json
+import threading
+import time
+
+
+class ChangeFeed:
+    def __init__(self, history):
+        self.epoch = int(time.time())
+        self._cond = threading.Condition()
+        self._deltas = collections.deque(maxlen=max(1, history))  # (version, event json bytes)
+        self._snapshot = None  # (version, event json bytes)
+        self.version = None
+
+    def cursor(self, version):
+        return f"{self.epoch}.{version}"
+
+    def parse_cursor(self, value):
+        """Version from a cursor of this run, or None (missing, malformed or from another run)."""
+        if not value:
+            return None
+        epoch, _, version = value.strip().partition(".")
+        if epoch != str(self.epoch):
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def publish(self, version, body, changes, now_ts):
+        """Record a published snapshot. body: the aircraft.json bytes; changes: its Changeset."""
+        cursor = self.cursor(version).encode()
+        snapshot = (b'{"type": "snapshot", "cursor": "' + cursor + b'", "version": '
+                    + str(version).encode() + b', "data": ' + body + b"}")
+        if not changes and version == self.version:
+            # Same aircraft, new header: refresh the snapshot only; deltas and waiters are unaffected
+            with self._cond:
+                self._snapshot = (version, snapshot)
+            return
+        delta = None
+        if changes and self.version is not None and version == self.version + 1:
+            delta = json.dumps({
+                "type": "delta",
+                "cursor": cursor.decode(),
+                "version": version,
+                "now": now_ts,
+                "added": list(changes.added.values()),
+                "updated": list(changes.updated.values()),
+                "removed": changes.removed,
+            }).encode()
+        with self._cond:
+            if delta is None:
+                # Not a continuation of the previous version: resuming across it needs a snapshot
+                self._deltas.clear()
+            else:
+                self._deltas.append((version, delta))
+            self._snapshot = (version, snapshot)
+            self.version = version
+            self._cond.notify_all()
+
+    def catch_up(self, since):
+        """(snapshot or None, [deltas], current version) for a subscriber at `since`.
+
+        The snapshot and each delta are (version, event json bytes).
+        """
+        with self._cond:
+            current = self.version
+            if current is None:
+                return None, [], None
+            if since is not None and since == current:
+                return None, [], current
+            oldest = self._deltas[0][0] if self._deltas else None
+            if since is None or oldest is None or since < oldest - 1 or since > current:
+                return self._snapshot, [], current
+            return None, [d for d in self._deltas if d[0] > since], current
+
+    def wait(self, version, timeout):
+        """Block until a version newer than `version` is published. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version != version, timeout)
+
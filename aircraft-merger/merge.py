@@ -3,91 +3,177 @@
 Aircraft merger: combine local (tar1090) and ADSBHub SBS feed.
 Dedupe by ICAO hex — prefer local (direct feeders) for accuracy; use ADSBHub when we don't have the aircraft.
 Serves aircraft.json in tar1090 format so map and REST API work unchanged.
+
+The merge loop keeps a persistent per-hex table (merge_table.MergeTable)
+and publishes every cycle, so "now" and "messages" stay current; the table's
+version only moves when a cycle changed the aircraft. The cycle's changeset
+(added / updated / removed hexes) is served at /data/changes.json, and
+streamed with the changed records at /data/stream (see change_feed.py).
+Each published snapshot is serialized once; its gzip (and brotli, when the
+module is installed) variants are built by the first request that asks for
+them and shared by the rest. A snapshot has two versions:
+
+  * the snapshot version moves whenever the body bytes change, including
+    cycles that only moved "now", "messages" or an aircraft's seen/rssi
+    counters; the weak ETag and X-Snapshot-Version are taken from it, so a
+    304 Not Modified always means the client's copy is byte-for-byte current;
+  * the aircraft version is the merge table's version, which only moves
+    when a cycle added, removed or changed an aircraft; it is sent as
+    X-Aircraft-Version and is what change-feed cursors count.
+
+A cycle whose body is identical to the previous one keeps the previous
+snapshot, compressed variants included.
+
+HTTP is served by MergerHTTPServer: one thread per connection with HTTP/1.1
+keep-alive, capped at MERGER_MAX_CONNECTIONS (extra connections get a 503
+and are closed). A /data/stream client moves its connection out of that cap
+into a separate one of MERGER_MAX_STREAMS, so long-lived streams can never
+lock out aircraft.json polling. An idle keep-alive connection is closed after
+MERGER_KEEPALIVE_TIMEOUT, and a response that cannot be written within
+MERGER_WRITE_TIMEOUT drops the connection, so a slow reader only ever holds
+up itself.
 """
 
+import gzip
 import json
 import os
 import socket
+import sys
 import threading
 import time
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 from urllib.request import urlopen
 
+import change_feed
+import merge_table
+import sbs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 TAR1090_URL = os.environ.get("TAR1090_URL", "http://tar1090:80/data/aircraft.json")
 ADSBHUB_HOST = os.environ.get("ADSBHUB_HOST", "data.adsbhub.org")
 ADSBHUB_PORT = int(os.environ.get("ADSBHUB_PORT", "5002"))
 POLL_INTERVAL = float(os.environ.get("MERGER_POLL_MS", "1500")) / 1000.0  # local fetch
-SBS_BUFFER_SIZE = 65536
 STATUS_DIR = os.environ.get("ADSBHUB_STATUS_DIR", "/status")
 STALE_SECONDS = float(os.environ.get("MERGER_STALE_SECONDS", "10"))
+# ADSBHub fields (e.g. callsign) are kept this long after an aircraft's last message
+ADSBHUB_RETAIN_SECONDS = float(os.environ.get("ADSBHUB_RETAIN_SECONDS", "600"))
+GZIP_LEVEL = int(os.environ.get("MERGER_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("MERGER_BROTLI_QUALITY", "5"))
+MAX_CONNECTIONS = int(os.environ.get("MERGER_MAX_CONNECTIONS", "256"))
+MAX_STREAMS = int(os.environ.get("MERGER_MAX_STREAMS", "64"))  # /data/stream clients, on top of MAX_CONNECTIONS
+KEEPALIVE_TIMEOUT = float(os.environ.get("MERGER_KEEPALIVE_TIMEOUT", "15"))  # idle between requests
+WRITE_TIMEOUT = float(os.environ.get("MERGER_WRITE_TIMEOUT", "10"))  # sending one response
+FEED_HISTORY = int(os.environ.get("MERGER_FEED_HISTORY", "200"))  # merge cycles a stream can resume across
+FEED_HEARTBEAT = float(os.environ.get("MERGER_FEED_HEARTBEAT", "15"))
 
-# Shared state: merged aircraft list, now, messages (updated by merger thread)
-_state = {"aircraft": [], "now": 0, "messages": 0}
+# Shared state: merged aircraft list, now, messages, the serialized snapshot and the
+# changeset that produced it (updated by merger thread)
+_state = {"aircraft": [], "now": 0, "messages": 0, "snapshot": None, "changes": None}
 _lock = threading.Lock()
-# ADSBHub: last time we got an update per hex (for 10s staleness purge)
-_adsbhub_last_seen = {}
-
-
-def _parse_sbs_line(line):
-    """Parse one SBS (30003) line; return dict with hex, lat, lon, etc. or None."""
-    line = line.strip()
-    if not line or not line.startswith("MSG,"):
-        return None
-    parts = line.split(",")
-    if len(parts) < 17:
-        return None
-    try:
-        hex_ = (parts[4] or "").strip().upper()
-        if not hex_ or len(hex_) != 6:
-            return None
-        out = {"hex": hex_, "source": "adsbhub"}
-        # parts: 0=MSG, 1=type, 2=session, 3=aircraft_id, 4=hex, 5=flightid, 6=date, 7=time, 8=date_log, 9=time_log
-        # 10=callsign, 11=altitude, 12=groundspeed, 13=track, 14=lat, 15=lon, 16=vert_rate, 17=squawk
-        if len(parts) > 10 and (parts[10] or "").strip():
-            out["flight"] = (parts[10] or "").strip()[:8]
-        if len(parts) > 11 and parts[11]:
-            try:
-                out["alt_baro"] = int(float(parts[11]))
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 12 and parts[12]:
-            try:
-                out["gs"] = int(float(parts[12]))
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 13 and parts[13]:
-            try:
-                out["track"] = int(float(parts[13]))
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 14 and parts[14]:
-            try:
-                out["lat"] = float(parts[14])
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 15 and parts[15]:
-            try:
-                out["lon"] = float(parts[15])
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 16 and parts[16]:
-            try:
-                out["baro_rate"] = int(float(parts[16])) * 64  # 64 ft resolution
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 17 and parts[17]:
-            try:
-                out["squawk"] = str(int(float(parts[17]))).zfill(4)
-            except (ValueError, TypeError):
-                pass
-        if len(parts) > 18 and parts[18]:
+# ADSBHub records, written by the SBS thread and drained by the merge loop as changesets
+_adsbhub = sbs.SbsTable()
+# Snapshot + per-cycle deltas for /data/stream subscribers
+_feed = change_feed.ChangeFeed(FEED_HISTORY)
+
+
+# ETags carry the process start, so versions from a previous run never match
+_EPOCH = f"{int(time.time()):x}"
+ENCODINGS = ("br", "gzip", "identity") if brotli is not None else ("gzip", "identity")
+
+
+class Snapshot:
+    """One serialized aircraft.json: identity body plus lazily compressed variants.
+
+    version counts body changes (ETag); aircraft_version is the merge table's.
+    """
+
+    __slots__ = ("version", "aircraft_version", "etag", "bodies", "_lock")
+
+    def __init__(self, version, aircraft_version, body):
+        self.version = version
+        self.aircraft_version = aircraft_version
+        self.etag = f'W/"{_EPOCH}-v{version}"'
+        # Content-Encoding -> bytes; identity is always present
+        self.bodies = {"identity": body}
+        self._lock = threading.Lock()
+
+    def body(self, encoding):
+        """The body in `encoding`, compressing it on first use."""
+        body = self.bodies.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self.bodies.get(encoding)
+                if body is None:
+                    identity = self.bodies["identity"]
+                    if encoding == "br":
+                        body = brotli.compress(identity, quality=BROTLI_QUALITY)
+                    else:
+                        body = gzip.compress(identity, GZIP_LEVEL, mtime=0)
+                    self.bodies[encoding] = body
+        return body
+
+
+def _publish(aircraft, now_ts, messages, changes):
+    """Serialize the merged state once and swap it in; a new body gets a new snapshot version."""
+    body = json.dumps({"aircraft": aircraft, "now": now_ts, "messages": messages}).encode()
+    with _lock:
+        previous = _state["snapshot"]
+    if previous is None:
+        snapshot = Snapshot(1, changes.version, body)
+    elif previous.aircraft_version == changes.version and previous.bodies["identity"] == body:
+        snapshot = previous
+    else:
+        snapshot = Snapshot(previous.version + 1, changes.version, body)
+    with _lock:
+        _state["aircraft"] = aircraft
+        _state["now"] = now_ts
+        _state["messages"] = messages
+        _state["snapshot"] = snapshot
+        _state["changes"] = changes
+    _feed.publish(snapshot.aircraft_version, body, changes, now_ts)
+
+
+def _pick_encoding(accept_encoding, available):
+    """Best Content-Encoding from an Accept-Encoding header among `available` (br, gzip, identity)."""
+    if not accept_encoding:
+        return "identity"
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
             try:
-                out["on_ground"] = bool(int(float(parts[18])))
-            except (ValueError, TypeError):
-                pass
-        return out
-    except (IndexError, ValueError, TypeError):
-        return None
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if coding in available and q > 0:
+            return coding
+    return "identity"
+
+
+def _etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against our ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
 
 
 def _fetch_local():
@@ -129,8 +215,7 @@ def _is_receive_enabled():
 
 
 def _run_sbs_client():
-    """Connect to ADSBHub:5002, parse SBS, update shared adsbhub_by_hex."""
-    adsbhub_by_hex = {}
+    """Connect to ADSBHub:5002, parse SBS, apply each recv's lines to _adsbhub."""
     reconnect_delay = 5
     while True:
         sock = None
@@ -140,33 +225,11 @@ def _run_sbs_client():
             sock.connect((ADSBHUB_HOST, ADSBHUB_PORT))
             _write_receive_status(True)
             sock.settimeout(300)
-            buf = b""
-            while True:
-                chunk = sock.recv(SBS_BUFFER_SIZE)
-                if not chunk:
-                    break
-                buf += chunk
-                while b"\n" in buf or b"\r" in buf:
-                    line, _, buf = buf.partition(b"\n")
-                    if b"\r" in line:
-                        line = line.split(b"\r")[0]
-                    try:
-                        s = line.decode("utf-8", errors="ignore")
-                    except Exception:
-                        continue
-                    rec = _parse_sbs_line(s)
-                    if rec:
-                        hex_ = rec.get("hex")
-                        if hex_:
-                            # Merge into existing record (ADSBHub sends MSG,1 / MSG,3 / MSG,4 separately)
-                            base = adsbhub_by_hex.get(hex_, {"hex": hex_, "source": "adsbhub"})
-                            for k, v in rec.items():
-                                if k != "hex" and v is not None:
-                                    base[k] = v
-                            adsbhub_by_hex[hex_] = base
-                            _adsbhub_last_seen[hex_] = time.time()
-                with _lock:
-                    _state["_adsbhub"] = dict(adsbhub_by_hex)
+            buf = sbs.LineBuffer()
+            while buf.recv_from(sock):
+                lines = buf.lines()
+                if lines:
+                    _adsbhub.apply(lines)
         except (socket.error, OSError, Exception):
             pass
         _write_receive_status(False)
@@ -178,77 +241,225 @@ def _run_sbs_client():
         time.sleep(reconnect_delay)
 
 
-def _merge_loop():
+def _merge_cycle(table):
+    """One poll: fetch local, apply ADSBHub changes and expiry, publish."""
+    local_aircraft, now_ts, messages = _fetch_local()
+    touched = table.update_local(local_aircraft)
+    if _is_receive_enabled():
+        _, changes = _adsbhub.take_changes()
+        touched += table.update_hub(changes)
+        now = time.time()
+        touched += table.expire_hub(now)
+        _adsbhub.expire(now - ADSBHUB_RETAIN_SECONDS)
+    elif table.hub_size():
+        _adsbhub.clear()
+        touched += table.clear_hub()
+    changes = table.commit(touched)
+    # Even with no aircraft changes: the header (now, messages) moves every poll
+    _publish(table.aircraft(), now_ts, messages, changes)
+    return changes
+
+
+def _merge_loop(table):
     """Periodically fetch local, merge with ADSBHub state (prefer local), purge stale > STALE_SECONDS, update _state."""
-    now_ts = time.time()
     while True:
-        local_aircraft, now_ts, messages = _fetch_local()
-        receive_on = _is_receive_enabled()
-        with _lock:
-            adsbhub = (_state.get("_adsbhub") or {}).copy() if receive_on else {}
-            if not receive_on:
-                _state["_adsbhub"] = {}
-                _adsbhub_last_seen.clear()
-        # Staleness: drop local aircraft with seen > STALE_SECONDS (seen = seconds ago)
-        fresh_local = []
-        for ac in local_aircraft:
-            seen = ac.get("seen")
-            if seen is not None:
-                try:
-                    if float(seen) > STALE_SECONDS:
-                        continue
-                except (TypeError, ValueError):
-                    pass
-            fresh_local.append(ac)
-        merged = []
-        seen_hex = set()
-        # Prefer local: add all local first (already filtered stale)
-        for ac in fresh_local:
-            hex_ = str(ac.get("hex", "")).strip().upper().lstrip("~")
-            if hex_ and hex_ not in seen_hex:
-                seen_hex.add(hex_)
-                merged.append(ac)
-        # Fill in from ADSBHub where we don't have local; drop if stale > STALE_SECONDS
-        cutoff = time.time() - STALE_SECONDS
-        for hex_, ac in list(adsbhub.items()):
-            if hex_ in seen_hex:
-                continue
-            if _adsbhub_last_seen.get(hex_, 0) < cutoff:
-                continue
-            seen_hex.add(hex_)
-            merged.append(ac)
-        # Purge old entries from _adsbhub_last_seen to avoid unbounded growth
-        for hex_ in list(_adsbhub_last_seen.keys()):
-            if _adsbhub_last_seen[hex_] < cutoff:
-                del _adsbhub_last_seen[hex_]
-        with _lock:
-            _state["aircraft"] = merged
-            _state["now"] = now_ts
-            _state["messages"] = messages
         time.sleep(POLL_INTERVAL)
+        _merge_cycle(table)
 
 
 class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        # Waiting for the next request on a keep-alive connection
+        self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        super().handle_one_request()
+
+    def send_response(self, code, message=None):
+        # Request is in: from here on only writes, bounded by the write timeout
+        self.connection.settimeout(WRITE_TIMEOUT)
+        super().send_response(code, message)
+
     def do_GET(self):
         path = self.path.split("?")[0].rstrip("/")
         if path == "/data/aircraft.json" or path == "/aircraft.json" or path == "":
             with _lock:
-                out = {"aircraft": _state["aircraft"], "now": _state["now"], "messages": _state["messages"]}
-            body = json.dumps(out).encode()
+                snapshot = _state["snapshot"]
+            if _etag_matches(self.headers.get("If-None-Match"), snapshot.etag):
+                self.send_response(304)
+                self._send_snapshot_headers(snapshot)
+                self.end_headers()
+                return
+            encoding = _pick_encoding(self.headers.get("Accept-Encoding"), ENCODINGS)
+            body = snapshot.body(encoding)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", len(body))
+            if encoding != "identity":
+                self.send_header("Content-Encoding", encoding)
+            self._send_snapshot_headers(snapshot)
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == "/data/stream":
+            self._stream(parse_qs(self.path.partition("?")[2]))
+        elif path == "/data/changes.json":
+            with _lock:
+                changes = _state["changes"]
+            body = json.dumps(changes.summary()).encode()
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.send_header("Content-Length", len(body))
+            self.send_header("Cache-Control", "no-cache")
             self.send_header("Access-Control-Allow-Origin", "*")
             self.end_headers()
             self.wfile.write(body)
         else:
             self.send_response(404)
+            self.send_header("Content-Length", "0")
             self.end_headers()
 
+    def _stream(self, params):
+        """Snapshot, then one delta per changed merge cycle, until the client goes away."""
+        sse = (params.get("format", [""])[0] == "sse"
+               or "text/event-stream" in (self.headers.get("Accept") or ""))
+        since = params.get("since", [None])[0] or self.headers.get("Last-Event-ID")
+        version = _feed.parse_cursor(since)
+        if not self.server.claim_stream():
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.send_header("Retry-After", "5")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            return
+        try:
+            self._send_stream(sse, version)
+        finally:
+            self.server.release_stream()
+
+    def _send_stream(self, sse, version):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.close_connection = True
+        while True:
+            snapshot, deltas, current = _feed.catch_up(version)
+            out = []
+            if snapshot is not None:
+                out.append(_feed_event(sse, "snapshot", snapshot))
+            out.extend(_feed_event(sse, "delta", d) for d in deltas)
+            if out:
+                self.wfile.write(b"".join(out))
+            version = current
+            if not _feed.wait(version, FEED_HEARTBEAT):
+                if sse:
+                    self.wfile.write(b": heartbeat\n\n")
+                else:
+                    self.wfile.write(b'{"type": "heartbeat", "cursor": "%s"}\n' % _feed.cursor(version).encode())
+
+    def _send_snapshot_headers(self, snapshot):
+        self.send_header("ETag", snapshot.etag)
+        self.send_header("X-Snapshot-Version", str(snapshot.version))
+        self.send_header("X-Aircraft-Version", str(snapshot.aircraft_version))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "ETag, X-Snapshot-Version, X-Aircraft-Version")
+
     def log_message(self, format, *args):
         pass
 
 
+def _feed_event(sse, kind, item):
+    """One change-feed event as NDJSON or Server-Sent Events bytes."""
+    version, payload = item
+    if not sse:
+        return payload + b"\n"
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (_feed.cursor(version).encode(), kind.encode(), payload)
+
+
+class MergerHTTPServer(ThreadingHTTPServer):
+    """Thread per connection, at most MAX_CONNECTIONS at a time.
+
+    Change-feed streams are counted against their own MAX_STREAMS limit
+    instead (see claim_stream), so they cannot use up the polling slots.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_connections=MAX_CONNECTIONS,
+                 max_streams=MAX_STREAMS):
+        self.max_connections = max_connections
+        self.max_streams = max_streams
+        self._active = 0
+        self._streams = 0
+        self._active_lock = threading.Lock()
+        self.rejected = 0
+        self.rejected_streams = 0
+        super().__init__(server_address, handler_class)
+
+    def claim_stream(self):
+        """Move the calling connection from the connection cap to the stream cap.
+
+        Returns False (and leaves the connection where it is) if every stream slot is taken.
+        """
+        with self._active_lock:
+            if self._streams >= self.max_streams:
+                self.rejected_streams += 1
+                return False
+            self._streams += 1
+            self._active -= 1
+            return True
+
+    def release_stream(self):
+        """Undo claim_stream(); the connection's own slot is released when its thread ends."""
+        with self._active_lock:
+            self._streams -= 1
+            self._active += 1
+
+    def process_request(self, request, client_address):
+        with self._active_lock:
+            full = self._active >= self.max_connections
+            if not full:
+                self._active += 1
+        if full:
+            self.rejected += 1
+            try:
+                request.settimeout(1)
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                                b"Retry-After: 1\r\nConnection: close\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._active_lock:
+            self._active -= 1
+
+    def handle_error(self, request, client_address):
+        # Timeouts and resets from slow or vanished clients are routine
+        exc = sys.exc_info()[1]
+        if isinstance(exc, OSError):
+            return
+        super().handle_error(request, client_address)
+
+
 def _write_receive_enabled_file(enabled):
     """Write receive_enabled flag only if file does not exist (dashboard is source of truth after first save)."""
     try:
@@ -263,26 +474,22 @@ def _write_receive_enabled_file(enabled):
 
 def main():
     # Initial fetch so first request has data
-    local_aircraft, now_ts, messages = _fetch_local()
-    with _lock:
-        _state["aircraft"] = local_aircraft
-        _state["now"] = now_ts
-        _state["messages"] = messages
+    table = merge_table.MergeTable(STALE_SECONDS)
+    _merge_cycle(table)
     # Use enable file if present (dashboard is source of truth); else env at startup
     receive_enabled = _is_receive_enabled()
     _write_receive_enabled_file(receive_enabled)
     if not receive_enabled:
         # Pass-through only: keep fetching local
-        t = threading.Thread(target=_merge_loop, daemon=True)
+        t = threading.Thread(target=_merge_loop, args=(table,), daemon=True)
         t.start()
     else:
-        _state["_adsbhub"] = {}
         t1 = threading.Thread(target=_run_sbs_client, daemon=True)
         t1.start()
-        t2 = threading.Thread(target=_merge_loop, daemon=True)
+        t2 = threading.Thread(target=_merge_loop, args=(table,), daemon=True)
         t2.start()
     port = int(os.environ.get("MERGER_PORT", "8090"))
-    server = HTTPServer(("0.0.0.0", port), Handler)
+    server = MergerHTTPServer(("0.0.0.0", port), Handler)
     server.serve_forever()
 
 
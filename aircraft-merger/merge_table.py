@@ -0,0 +1,185 @@
+"""Persistent per-hex merge of local (tar1090) and ADSBHub aircraft.
+
+MergeTable keeps the merged output between polls instead of rebuilding it:
+
+  * local aircraft come as a full tar1090 list every poll; each is compared
+    with the previous poll's record for the same hex, ignoring the counters
+    tar1090 moves on every poll (seen, seen_pos, rssi, messages), and only
+    hexes that appeared, changed or disappeared are touched; the others
+    just have their output record refreshed;
+  * ADSBHub records arrive as changesets from sbs.SbsTable.take_changes();
+    each update pushes (last message + STALE_SECONDS, hex) onto a heap, and
+    expiry pops only the entries that are due (an entry superseded by a
+    later message is skipped when popped) instead of scanning every hex;
+  * for each touched hex the output record is re-resolved — local wins,
+    ADSBHub fills in — and the differences form the cycle's Changeset.
+
+The aircraft list is rebuilt only when something changed or was refreshed.
+
+MergeTable.version counts aircraft changes only: it is the change-feed cursor,
+and a refreshed-only cycle (new seen/rssi/messages, same aircraft) does not
+move it even though the served body changes. Nothing that validates the body
+may use it; merge.Snapshot versions the serialized body itself.
+"""
+
+import heapq
+
+# Per-poll counters: a difference in these alone is not a change of the aircraft
+_VOLATILE = frozenset(("seen", "seen_pos", "rssi", "messages"))
+
+
+class Changeset:
+    """What one merge cycle changed in the output, keyed by normalized hex."""
+
+    __slots__ = ("version", "added", "updated", "removed")
+
+    def __init__(self, version, added, updated, removed):
+        self.version = version
+        self.added = added        # hex -> record
+        self.updated = updated    # hex -> record
+        self.removed = removed    # [hex]
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.removed)
+
+    def summary(self):
+        """JSON-ready hex lists."""
+        return {
+            "version": self.version,
+            "added": list(self.added),
+            "updated": list(self.updated),
+            "removed": list(self.removed),
+        }
+
+
+def same_aircraft(a, b):
+    """True if two records differ at most in the per-poll counters."""
+    if a is b:
+        return True
+    if a.keys() == b.keys():
+        keys = a.keys()
+    else:
+        keys = a.keys() | b.keys()
+    return all(k in _VOLATILE or a.get(k) == b.get(k) for k in keys)
+
+
+def normalize_hex(value):
+    """ICAO hex as used for de-duplication: upper case, without tar1090's '~' (non-ICAO) prefix."""
+    return str(value or "").strip().upper().lstrip("~")
+
+
+class MergeTable:
+    def __init__(self, stale_seconds):
+        self.stale_seconds = stale_seconds
+        self._local = {}      # hex -> latest fresh local record
+        self._hub = {}        # hex -> latest ADSBHub record
+        self._hub_seen = {}   # hex -> time of its last ADSBHub message
+        self._expiry = []     # heap of (expires_at, hex)
+        self._out = {}        # hex -> record in the merged output
+        self._refreshed = []  # local hexes whose latest record differs only in per-poll counters
+        self._aircraft = []
+        self.version = 0
+
+    def update_local(self, aircraft):
+        """Replace the local set with a tar1090 poll. Returns the hexes that changed.
+
+        Hexes whose record differs only in the per-poll counters are not
+        returned; commit() still puts their latest record in the output.
+        """
+        stale = self.stale_seconds
+        fresh = {}
+        for ac in aircraft:
+            # Staleness: drop local aircraft with seen > STALE_SECONDS (seen = seconds ago)
+            seen = ac.get("seen")
+            if seen is not None:
+                try:
+                    if float(seen) > stale:
+                        continue
+                except (TypeError, ValueError):
+                    pass
+            hex_ = normalize_hex(ac.get("hex"))
+            if hex_ and hex_ not in fresh:
+                fresh[hex_] = ac
+        previous = self._local
+        touched = [h for h in previous if h not in fresh]
+        refreshed = []
+        for h, ac in fresh.items():
+            prev = previous.get(h)
+            if prev is None or not same_aircraft(prev, ac):
+                touched.append(h)
+            else:
+                refreshed.append(h)
+        self._local = fresh
+        self._refreshed = refreshed
+        return touched
+
+    def update_hub(self, changes):
+        """Apply {hex: (record, last seen)} from SbsTable.take_changes(). Returns the hexes given."""
+        push = heapq.heappush
+        for hex_, (ac, seen_at) in changes.items():
+            self._hub[hex_] = ac
+            self._hub_seen[hex_] = seen_at
+            push(self._expiry, (seen_at + self.stale_seconds, hex_))
+        return list(changes)
+
+    def expire_hub(self, now):
+        """Drop ADSBHub records not updated within STALE_SECONDS. Returns the expired hexes."""
+        expired = []
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            _, hex_ = heapq.heappop(heap)
+            seen_at = self._hub_seen.get(hex_)
+            if seen_at is not None and seen_at + self.stale_seconds <= now:
+                del self._hub_seen[hex_]
+                del self._hub[hex_]
+                expired.append(hex_)
+        return expired
+
+    def clear_hub(self):
+        """Forget all ADSBHub records (receive disabled). Returns the hexes dropped."""
+        dropped = list(self._hub)
+        self._hub.clear()
+        self._hub_seen.clear()
+        self._expiry.clear()
+        return dropped
+
+    def commit(self, touched):
+        """Re-resolve the touched hexes; returns the cycle's Changeset (empty if nothing changed)."""
+        added, updated, removed = {}, {}, []
+        out = self._out
+        refreshed, self._refreshed = self._refreshed, []
+        for hex_ in refreshed:
+            # Local wins, so an unchanged local hex is already in the output
+            out[hex_] = self._local[hex_]
+        for hex_ in set(touched):
+            # Prefer local (direct feeders); ADSBHub only where we don't have the aircraft
+            ac = self._local.get(hex_)
+            if ac is None:
+                ac = self._hub.get(hex_)
+            current = out.get(hex_)
+            if ac is None:
+                if current is not None:
+                    del out[hex_]
+                    removed.append(hex_)
+            elif current is None:
+                out[hex_] = ac
+                added[hex_] = ac
+            elif not same_aircraft(current, ac):
+                out[hex_] = ac
+                updated[hex_] = ac
+            else:
+                out[hex_] = ac
+        changes = Changeset(self.version, added, updated, removed)
+        if changes:
+            self.version += 1
+            changes.version = self.version
+        if changes or refreshed:
+            self._aircraft = list(out.values())
+        return changes
+
+    def aircraft(self):
+        """The merged list (shared; rebuilt only by a commit that changed or refreshed something)."""
+        return self._aircraft
+
+    def hub_size(self):
+        return len(self._hub)
@@ -0,0 +1,255 @@
+"""SBS (BaseStation, port 30003) ingestion for the ADSBHub feed.
+
+LineBuffer receives straight into a preallocated bytearray and keeps a read
+offset into it: each recv hands back every complete line at once (one slice,
+one decode, one splitlines), and the partial tail stays where it is until the
+buffer fills up and it is moved to the front. Nothing is re-copied per line.
+
+parse_sbs_line() converts the non-empty fields directly inside one try block
+(int() for integer fields, no float() round trip); only a line with a field
+that does not convert is re-parsed field by field. A line with fewer than the
+17 fields up to vertical rate is rejected: it would still count as a message
+and keep its record alive under ADSBHUB_RETAIN_SECONDS without carrying data.
+
+SbsTable holds the per-hex records. The SBS thread coalesces a whole recv's
+worth of lines per hex, applies them under one short lock and marks the
+hexes it touched; the merge
+loop calls take_changes(), which swaps the dirty set for an empty one and
+copies only the records that changed since the previous call, together with
+a version that increases with every applied batch. There is no full-table
+copy on either side.
+
+Records are kept for ADSBHUB_RETAIN_SECONDS after an aircraft's last message
+(so a callsign heard once survives short gaps) and then dropped by expire(),
+which walks a coarse timing wheel: each batch adds its hexes to the bucket
+for the current minute, and only buckets older than the cutoff are visited.
+"""
+
+import collections
+import threading
+import time
+
+_BUCKET_SECONDS = 60
+
+# ADSBHub sends MSG,1 / MSG,3 / MSG,4 ... separately; fields are merged per hex
+# parts: 0=MSG, 1=type, 2=session, 3=aircraft_id, 4=hex, 5=flightid, 6=date, 7=time, 8=date_log, 9=time_log
+# 10=callsign, 11=altitude, 12=groundspeed, 13=track, 14=lat, 15=lon, 16=vert_rate, 17=squawk
+
+
+def _int(s):
+    """int of an SBS numeric field ("35000", "451.5", " 12 "), or None."""
+    try:
+        return int(s)
+    except ValueError:
+        pass
+    try:
+        return int(float(s))
+    except ValueError:
+        return None
+
+
+def _float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+# (index, key, converter) for the tolerant path
+_FIELDS = (
+    (11, "alt_baro", _int),
+    (12, "gs", _int),
+    (13, "track", _int),
+    (14, "lat", _float),
+    (15, "lon", _float),
+    (16, "baro_rate", _int),
+    (17, "squawk", _int),
+    (18, "on_ground", _int),
+)
+
+
+def _parse_fields_tolerant(parts, out):
+    """Field by field; a malformed field is skipped instead of dropping the message."""
+    n = len(parts)
+    for index, key, conv in _FIELDS:
+        if index < n and parts[index]:
+            v = conv(parts[index])
+            if v is not None:
+                out[key] = v
+    if "baro_rate" in out:
+        out["baro_rate"] *= 64
+    if "squawk" in out:
+        out["squawk"] = str(out["squawk"]).zfill(4)
+    if "on_ground" in out:
+        out["on_ground"] = bool(out["on_ground"])
+
+
+def parse_sbs_line(line):
+    """Parse one SBS (30003) line; return dict with hex, lat, lon, etc. or None."""
+    if not line.startswith("MSG,"):
+        return None
+    parts = line.split(",")
+    n = len(parts)
+    if n < 17:
+        return None
+    hex_ = parts[4].strip().upper()
+    if len(hex_) != 6:
+        return None
+    out = {"hex": hex_, "source": "adsbhub"}
+    v = parts[10].strip()
+    if v:
+        out["flight"] = v[:8]
+    # Fast path: well-formed fields convert directly (integers as int, no float round trip);
+    # the first one that does not falls back to the tolerant per-field parse
+    try:
+        v = parts[11]
+        if v:
+            out["alt_baro"] = int(v)
+        v = parts[12]
+        if v:
+            out["gs"] = int(v)
+        v = parts[13]
+        if v:
+            out["track"] = int(v)
+        v = parts[14]
+        if v:
+            out["lat"] = float(v)
+        v = parts[15]
+        if v:
+            out["lon"] = float(v)
+        v = parts[16]
+        if v:
+            out["baro_rate"] = int(v) * 64  # 64 ft resolution
+        if n > 17:
+            v = parts[17]
+            if v:
+                out["squawk"] = str(int(v)).zfill(4)
+            if n > 18:
+                v = parts[18]
+                if v:
+                    out["on_ground"] = bool(int(v))
+    except ValueError:
+        _parse_fields_tolerant(parts, out)
+    return out
+
+
+class LineBuffer:
+    """Receive buffer with a moving read offset; yields complete lines in bulk."""
+
+    def __init__(self, size=262144):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unconsumed byte
+        self._end = 0    # end of received data
+
+    def recv_from(self, sock):
+        """recv_into the free space; returns the byte count (0 at EOF)."""
+        if self._end == len(self._buf):
+            self._make_room()
+        n = sock.recv_into(self._view[self._end:])
+        self._end += n
+        return n
+
+    def _make_room(self):
+        if self._start == 0:
+            # A whole buffer without a newline is not SBS: drop it
+            self._end = 0
+            return
+        pending = self._end - self._start
+        self._buf[:pending] = self._buf[self._start:self._end]
+        self._start, self._end = 0, pending
+
+    def lines(self):
+        """All complete lines received so far, decoded, without line terminators."""
+        last = self._buf.rfind(b"\n", self._start, self._end)
+        if last < 0:
+            return []
+        block = self._buf[self._start:last]
+        self._start = last + 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        return block.decode("utf-8", errors="ignore").splitlines()
+
+
+class SbsTable:
+    """Per-hex ADSBHub records, written by the SBS thread and read as changesets."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}   # hex -> merged record
+        self._seen = {}      # hex -> unix time of the last message
+        self._dirty = set()  # hexes updated since the last take_changes()
+        self._wheel = collections.deque()  # [(bucket start, set of hexes)], oldest first
+        self.version = 0
+        self.messages = 0
+
+    def apply(self, lines, now=None):
+        """Parse and merge a batch of SBS lines. Returns the number of messages used."""
+        if now is None:
+            now = time.time()
+        # Coalesce the batch per hex first, so the locked part is one update per aircraft
+        batch = {}
+        used = 0
+        parse = parse_sbs_line
+        for line in lines:
+            rec = parse(line)
+            if rec is None:
+                continue
+            used += 1
+            prev = batch.get(rec["hex"])
+            if prev is None:
+                batch[rec["hex"]] = rec
+            else:
+                prev.update(rec)
+        if not batch:
+            return 0
+        with self._lock:
+            records = self._records
+            for hex_, rec in batch.items():
+                base = records.get(hex_)
+                if base is None:
+                    records[hex_] = rec
+                else:
+                    base.update(rec)
+            self._seen.update(dict.fromkeys(batch, now))
+            self._dirty.update(batch)
+            bucket = int(now // _BUCKET_SECONDS) * _BUCKET_SECONDS
+            if not self._wheel or self._wheel[-1][0] != bucket:
+                self._wheel.append((bucket, set()))
+            self._wheel[-1][1].update(batch)
+            self.version += 1
+            self.messages += used
+        return used
+
+    def take_changes(self):
+        """(version, {hex: (record copy, last seen)}) for hexes updated since the last call."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            records, seen = self._records, self._seen
+            changes = {hex_: (dict(records[hex_]), seen[hex_]) for hex_ in dirty if hex_ in records}
+            return self.version, changes
+
+    def expire(self, cutoff):
+        """Drop records with no message since `cutoff`. Returns the number dropped."""
+        dropped = 0
+        with self._lock:
+            wheel = self._wheel
+            while wheel and wheel[0][0] + _BUCKET_SECONDS <= cutoff:
+                _, hexes = wheel.popleft()
+                for hex_ in hexes:
+                    # Heard again later: it is in a newer bucket too
+                    seen_at = self._seen.get(hex_)
+                    if seen_at is not None and seen_at < cutoff:
+                        del self._seen[hex_]
+                        del self._records[hex_]
+                        self._dirty.discard(hex_)
+                        dropped += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._seen.clear()
+            self._dirty.clear()
+            self._wheel.clear()
+            self.version += 1
@@ -0,0 +1,84 @@
+import http.client
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import merge  # noqa: E402
+import merge_table  # noqa: E402
+
+
+def _aircraft(**extra):
+    return [{"hex": "a00001", "flight": "TST0001 ", "alt_baro": 12000, "seen": 0.5, "rssi": -20.1, **extra}]
+
+
+class SnapshotEtagTest(unittest.TestCase):
+    def setUp(self):
+        merge._state["snapshot"] = None
+        self.table = merge_table.MergeTable(merge.STALE_SECONDS)
+        self.server = merge.MergerHTTPServer(("127.0.0.1", 0), merge.Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _cycle(self, aircraft, now_ts, messages):
+        changes = self.table.commit(self.table.update_local(aircraft))
+        merge._publish(self.table.aircraft(), now_ts, messages, changes)
+
+    def _get(self, etag=None):
+        conn = http.client.HTTPConnection(*self.server.server_address, timeout=5)
+        conn.request("GET", "/data/aircraft.json", headers={"If-None-Match": etag} if etag else {})
+        resp = conn.getresponse()
+        result = resp.status, resp.read(), resp.getheader("ETag")
+        conn.close()
+        return result
+
+    def _assert_304_only_for_same_body(self, cycles):
+        """Replay cycles, revalidating after each one against a plain GET."""
+        _, body, etag = self._get()
+        for cycle in cycles:
+            self._cycle(*cycle)
+            status, _, new_etag = self._get(etag)
+            _, plain, plain_etag = self._get()
+            self.assertEqual(new_etag, plain_etag)
+            if status == 304:
+                self.assertEqual(plain, body)
+            else:
+                self.assertEqual(status, 200)
+                self.assertNotEqual(plain, body)
+            body, etag = plain, plain_etag
+
+    def test_header_only_cycle_changes_the_etag(self):
+        self._cycle(_aircraft(), 1000.0, 10)
+        self._assert_304_only_for_same_body([
+            (_aircraft(), 1001.5, 12),    # now/messages only
+            (_aircraft(), 1001.5, 12),    # nothing
+            (_aircraft(), 1003.0, 12),    # now only
+        ])
+
+    def test_refreshed_only_cycle_changes_the_etag(self):
+        self._cycle(_aircraft(), 1000.0, 10)
+        version = self.table.version
+        self._assert_304_only_for_same_body([
+            (_aircraft(seen=1.5, rssi=-19.0), 1000.0, 10),    # per-poll counters only
+            (_aircraft(seen=1.5, rssi=-19.0), 1000.0, 10),    # nothing
+            (_aircraft(messages=42), 1000.0, 10),
+        ])
+        # The aircraft version (change-feed cursor) did not move for any of these
+        self.assertEqual(self.table.version, version)
+        self.assertEqual(merge._state["snapshot"].aircraft_version, version)
+
+    def test_unchanged_cycle_keeps_the_snapshot(self):
+        self._cycle(_aircraft(), 1000.0, 10)
+        first = merge._state["snapshot"]
+        self._cycle(_aircraft(), 1000.0, 10)
+        self.assertIs(merge._state["snapshot"], first)
+        self.assertEqual(self._get(first.etag)[0], 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
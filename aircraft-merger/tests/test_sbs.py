@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sbs  # noqa: E402
+
+FULL = "MSG,3,1,1,4CA2D6,1,2026/10/16,12:00:00.000,2026/10/16,12:00:00.000,RYR1AB  ,36000,450,90,53.1,-6.2,-64,7000,0,0"
+
+
+class ParseSbsLineTest(unittest.TestCase):
+    def test_full_line(self):
+        rec = sbs.parse_sbs_line(FULL)
+        self.assertEqual(rec["hex"], "4CA2D6")
+        self.assertEqual(rec["flight"], "RYR1AB")
+        self.assertEqual((rec["alt_baro"], rec["lat"], rec["lon"]), (36000, 53.1, -6.2))
+        self.assertEqual(rec["baro_rate"], -64 * 64)
+
+    def test_short_lines_are_rejected(self):
+        parts = FULL.split(",")
+        for n in (5, 11, 16):
+            self.assertIsNone(sbs.parse_sbs_line(",".join(parts[:n])), n)
+        self.assertIsNotNone(sbs.parse_sbs_line(",".join(parts[:17])))
+
+    def test_short_lines_do_not_keep_a_record_alive(self):
+        table = sbs.SbsTable()
+        table.apply([",".join(FULL.split(",")[:11])], now=1000.0)
+        self.assertEqual(table.take_changes()[1], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+"""Beast fan-out — one shared ring buffer feeding every Beast output client.
+
+The readsb reader appends each chunk once; every client keeps only an
+absolute read cursor into the ring. A client's writer task wakes when new
+data exists, writes everything between its cursor and the head as one batch
+(capped at OUTPUT_MAX_BATCH), and waits for drain() before the next batch —
+so per-chunk work no longer scales with the number of clients and memory is
+bounded by the ring.
+
+New clients start on a frame boundary: the ring remembers where the first
+frame of each appended chunk starts (and when it arrived), so a subscriber's
+first write begins at a 0x1a <type> byte pair — never mid-frame. With a
+replay window, a new client instead starts at the oldest frame boundary
+within the last N seconds that is still in the ring, so a reconnecting
+consumer catches up without a gap.
+
+A client that falls more than a ring's worth behind is handled by its lag
+policy:
+    drop-oldest  continue from the oldest frame start still in the ring
+    resync       skip to the newest Beast frame boundary (back to live)
+    disconnect   close the client
+"""
+
+import asyncio
+import collections
+import time
+
+from beast_frames import BeastFrameScanner, first_frame_start
+
+LAG_POLICIES = ("drop-oldest", "resync", "disconnect")
+
+# Upper bound on bytes handed to one client's transport per wakeup
+OUTPUT_MAX_BATCH = 256 * 1024
+
+
+class BeastRing:
+    """Single-writer byte ring with absolute positions and frame-boundary checkpoints."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self.head = 0  # absolute position of the next byte to be written
+        self.frames = 0
+        self._scanner = BeastFrameScanner()
+        # (absolute position, arrival time) of the first frame start in each appended chunk
+        self._boundaries = collections.deque()
+        self._waiter = None
+
+    @property
+    def oldest(self):
+        return max(0, self.head - self.capacity)
+
+    def restart(self):
+        """The upstream stream restarted (readsb reconnect): reset escape state."""
+        self._scanner = BeastFrameScanner()
+
+    def append(self, data, now=None):
+        n = len(data)
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            self.head += n - self.capacity
+            n = self.capacity
+        view = memoryview(data)
+        pos = self.head % self.capacity
+        first = min(n, self.capacity - pos)
+        self._buf[pos:pos + first] = view[:first]
+        if first < n:
+            self._buf[0:n - first] = view[first:]
+
+        pending = self._scanner.escape_pending
+        start = first_frame_start(data, pending)
+        self.frames += self._scanner.feed(data)[0]
+        if start is not None:
+            self._boundaries.append((self.head + start, time.time() if now is None else now))
+        self.head += n
+
+        oldest = self.oldest
+        while self._boundaries and self._boundaries[0][0] < oldest:
+            self._boundaries.popleft()
+
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def latest_boundary(self):
+        """Newest known frame start still in the ring, or None."""
+        return self._boundaries[-1][0] if self._boundaries else None
+
+    def boundary_at_or_after(self, pos):
+        """First known frame start >= pos, or None. Scans from the newest end."""
+        found = None
+        for bpos, _ in reversed(self._boundaries):
+            if bpos < pos:
+                break
+            found = bpos
+        return found
+
+    def boundary_since(self, t):
+        """Oldest frame start still in the ring that arrived at or after time t, or None."""
+        oldest = self.oldest
+        found = None
+        for bpos, bt in reversed(self._boundaries):
+            if bt < t or bpos < oldest:
+                break
+            found = bpos
+        return found
+
+    def read(self, cursor, limit):
+        """Bytes from absolute cursor up to head (at most limit), as 1–2 pieces."""
+        end = min(self.head, cursor + limit)
+        if end <= cursor:
+            return []
+        cap = self.capacity
+        a = cursor % cap
+        b = end % cap
+        if a < b or b == 0:
+            return [bytes(self._buf[a:b or cap])]
+        return [bytes(self._buf[a:]), bytes(self._buf[:b])]
+
+    def wait(self):
+        """Future resolved on the next append (shared by all waiting clients)."""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        return self._waiter
+
+
+class OutputClient:
+    """One Beast output connection reading from a BeastRing."""
+
+    def __init__(self, ring, writer, policy="resync", label="", replay_seconds=0):
+        self.ring = ring
+        self.writer = writer
+        self.policy = policy if policy in LAG_POLICIES else "resync"
+        self.label = label
+        self.connected_at = time.time()
+        start = ring.boundary_since(self.connected_at - replay_seconds) if replay_seconds > 0 else None
+        # Until aligned, the cursor is only a lower bound for the first frame start
+        self.aligned = start is not None
+        self.cursor = start if start is not None else ring.head
+        self.replayed_bytes = ring.head - self.cursor
+        self.task = None
+        self.dropped = False
+        self.bytes_sent = 0
+        self.overruns = 0
+        self.skipped_bytes = 0
+
+    @property
+    def lag_bytes(self):
+        """Bytes the client is behind: unread ring data plus its transport buffer."""
+        buffered = 0
+        transport = self.writer.transport
+        if transport is not None and not transport.is_closing():
+            buffered = transport.get_write_buffer_size()
+        return (self.ring.head - self.cursor) + buffered
+
+    def _handle_overrun(self):
+        """Apply the lag policy; returns False if the client must disconnect."""
+        ring = self.ring
+        self.overruns += 1
+        if self.policy == "disconnect":
+            print(f"[output] {self.label} fell {ring.head - self.cursor} bytes behind — disconnecting")
+            return False
+        if self.policy == "resync":
+            target = ring.latest_boundary()
+            if target is not None and target < ring.oldest:
+                target = None
+        else:
+            # The oldest byte still buffered is usually mid-frame; resume at the next frame start
+            target = ring.boundary_at_or_after(ring.oldest)
+        if target is None:
+            # No frame start left in the ring: wait for the next one in new data
+            target = ring.head
+            self.aligned = False
+        self.skipped_bytes += target - self.cursor
+        self.cursor = target
+        return True
+
+    async def wait_for_data(self):
+        ring = self.ring
+        while ring.head == self.cursor:
+            await asyncio.shield(ring.wait())
+
+    def start(self):
+        """Start streaming in its own task; returns the task."""
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def drop(self):
+        """Stop streaming now (e.g. key regenerated). Idle clients cost nothing until this."""
+        self.dropped = True
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        """Stream ring data to the client until it disconnects or is cancelled."""
+        ring = self.ring
+        writer = self.writer
+        while True:
+            await self.wait_for_data()
+            if self.cursor < ring.oldest and not self._handle_overrun():
+                return
+            if not self.aligned:
+                start = ring.boundary_at_or_after(self.cursor)
+                if start is None:
+                    # No frame starts in the new data yet — skip it
+                    self.cursor = ring.head
+                    continue
+                self.cursor = start
+                self.aligned = True
+            pieces = ring.read(self.cursor, OUTPUT_MAX_BATCH)
+            if not pieces:
+                continue
+            n = sum(len(p) for p in pieces)
+            self.cursor += n
+            self.bytes_sent += n
+            writer.writelines(pieces)
+            await writer.drain()
+
+    def stats(self):
+        return {
+            "label": self.label,
+            "lag_bytes": self.lag_bytes,
+            "bytes_sent": self.bytes_sent,
+            "overruns": self.overruns,
+            "skipped_bytes": self.skipped_bytes,
+            "replayed_bytes": self.replayed_bytes,
+            "policy": self.policy,
+        }
@@ -0,0 +1,344 @@
+"""Beast frame scanning — fast frame/position accounting for inbound feeder streams.
+
+Beast framing: 0x1a <type> <payload>, where any 0x1a inside the payload is
+doubled (0x1a 0x1a). Frames are located with bulk C-level searches
+(bytes.replace / bytes.count) instead of a per-byte Python loop, and the
+scanner carries an unpaired trailing 0x1a across reads so frames and escape
+pairs split between two chunks are counted exactly once.
+
+BeastDecoder builds on the scanner: it keeps the scanner's frame count and
+adds per-connection DF / ADS-B type-code histograms, signal level and real
+airborne-position counts, taken by regex passes so per-frame Python work is
+limited to the few frames whose header bytes are escaped.
+"""
+
+import collections
+import re
+
+BEAST_ESCAPE = 0x1A
+BEAST_TYPES = {0x31, 0x32, 0x33, 0x34, 0x35}
+BEAST_LONG = {0x33, 0x35}  # Mode-S long messages (contain ADS-B/DF17)
+
+_ESC = b"\x1a"
+_ESC_PAIR = b"\x1a\x1a"
+# Most frequent frame types first so _count_markers can usually stop early
+_TYPE_ORDER = (0x33, 0x32, 0x31, 0x34, 0x35)
+_TYPE_MARKERS = tuple((bytes([BEAST_ESCAPE, t]), t in BEAST_LONG) for t in _TYPE_ORDER)
+
+
+def _count_markers(data):
+    """Count frame starts in data that contains no 0x1a 0x1a pairs.
+
+    Every remaining 0x1a is a frame start (or a trailing half-marker), so
+    once the per-type counts account for all of them the other passes are
+    skipped.
+    """
+    remaining = data.count(_ESC)
+    if data[-1] == BEAST_ESCAPE:
+        remaining -= 1
+    msgs = 0
+    positions = 0
+    for marker, is_long in _TYPE_MARKERS:
+        if remaining <= 0:
+            break
+        n = data.count(marker)
+        if n:
+            msgs += n
+            remaining -= n
+            if is_long:
+                positions += n
+    return msgs, positions
+
+
+class BeastFrameScanner:
+    """Incremental Beast frame counter for one stream.
+
+    feed() returns (messages, positions) for the bytes it is given, where
+    positions are Mode-S long frames (DF17-capable). A 0x1a at the end of one
+    chunk is resolved against the first byte of the next.
+    """
+
+    __slots__ = ("escape_pending",)
+
+    def __init__(self):
+        self.escape_pending = False
+
+    def feed(self, data):
+        if not data:
+            return 0, 0
+        msgs = 0
+        positions = 0
+        if self.escape_pending:
+            self.escape_pending = False
+            first = data[0]
+            if first == BEAST_ESCAPE:
+                # Second half of an escaped 0x1a pair split across reads
+                data = data[1:]
+            elif first in BEAST_TYPES:
+                msgs += 1
+                if first in BEAST_LONG:
+                    positions += 1
+            if not data:
+                return msgs, positions
+
+        if _ESC_PAIR in data:
+            # Greedy left-to-right pair removal matches the wire escaping rules;
+            # at most one unpaired 0x1a survives per run, next to a non-0x1a byte.
+            data = data.replace(_ESC_PAIR, b"")
+            if not data:
+                return msgs, positions
+
+        m, p = _count_markers(data)
+        msgs += m
+        positions += p
+        if data[-1] == BEAST_ESCAPE:
+            self.escape_pending = True
+        return msgs, positions
+
+
+def first_frame_start(data, escape_pending=False):
+    """Index of the first Beast frame start in data, or None.
+
+    escape_pending is the scanner state before data (an unpaired 0x1a ended
+    the previous chunk); a frame whose 0x1a was that last byte returns -1.
+    """
+    n = len(data)
+    i = 0
+    if escape_pending and n:
+        if data[0] in BEAST_TYPES:
+            return -1
+        if data[0] == BEAST_ESCAPE:
+            i = 1
+    find = data.find
+    while True:
+        j = find(_ESC, i)
+        if j < 0 or j + 1 >= n:
+            return None
+        nxt = data[j + 1]
+        if nxt == BEAST_ESCAPE:
+            i = j + 2
+        elif nxt in BEAST_TYPES:
+            return j
+        else:
+            i = j + 1
+
+
+# ── Streaming decoder ─────────────────────────────────────────────────────────
+# Logical (unescaped) body length after the type byte. Mode-AC/Mode-S frames
+# carry a 6-byte 12 MHz timestamp and a 1-byte signal level before the
+# payload; 0xe3 is readsb's receiver-ID frame (8-byte id, no timestamp).
+BEAST_RECEIVER_ID = 0xE3
+FRAME_BODY_LEN = {
+    0x31: 6 + 1 + 2,    # Mode-AC
+    0x32: 6 + 1 + 7,    # Mode-S short
+    0x33: 6 + 1 + 14,   # Mode-S long
+    0x34: 6 + 1 + 14,   # status
+    0x35: 6 + 1 + 14,
+    BEAST_RECEIVER_ID: 8,
+}
+
+# Downlink formats and ADS-B type codes reported in histograms
+DF_NAMES = {4: "DF4", 5: "DF5", 11: "DF11", 17: "DF17", 18: "DF18", 20: "DF20", 21: "DF21"}
+TC_CLASSES = (
+    ("identification", range(1, 5)),
+    ("surface_position", range(5, 9)),
+    ("airborne_position", range(9, 19)),
+    ("velocity", range(19, 20)),
+    ("airborne_position_gnss", range(20, 23)),
+    ("aircraft_status", range(28, 29)),
+    ("target_state", range(29, 30)),
+    ("operational_status", range(31, 32)),
+)
+
+# Escaped pairs are masked as 0x1a 0x00 (same length, never a frame marker), so in the
+# masked buffer every "0x1a <type>" is a real frame start and offsets match the original.
+_PAIR_MASK = b"\x1a\x00"
+# Mode-S frames whose first 12 body bytes (timestamp, signal, DF byte, address, ME type)
+# are unescaped: captures signal + DF byte
+_MODES_RE = re.compile(rb"\x1a[\x32\x33][^\x1a]{6}([^\x1a]{2})[^\x1a]{4}")
+# DF17/DF18 long frames among them: captures the ME type-code byte
+_ADSB_RE = re.compile(rb"\x1a\x33[^\x1a]{7}[\x88-\x97][^\x1a]{3}([^\x1a])")
+# Mode-S frames with an escaped byte (or a cut) among those 12, decoded one by one
+_ESCAPED_MODES_RE = re.compile(rb"\x1a([\x32\x33])(?=[^\x1a]{0,11}\x1a)")
+# DF / type-code byte -> its top five bits, applied with bytes.translate before counting
+_TOP5 = bytes(b >> 3 for b in range(256))
+# A frame start in the masked buffer (0x1a not followed by the pair mask's 0x00)
+_MARKER_RE = re.compile(rb"\x1a[^\x00]")
+
+
+def _unescape_body(buf, start, length):
+    """Collect `length` logical bytes from buf[start:], collapsing 0x1a pairs.
+
+    Returns (body, next_index). body is None when the frame is incomplete
+    (next_index -1) or a lone 0x1a interrupts it (next_index = that 0x1a).
+    """
+    out = bytearray()
+    k = start
+    n = len(buf)
+    while len(out) < length:
+        if k >= n:
+            return None, -1
+        b = buf[k]
+        if b == BEAST_ESCAPE:
+            if k + 1 >= n:
+                return None, -1
+            if buf[k + 1] != BEAST_ESCAPE:
+                return None, k
+            k += 2
+        else:
+            k += 1
+        out.append(b)
+    return out, k
+
+
+def _incomplete_frame_start(buf):
+    """Index of the trailing incomplete frame in buf, or len(buf) if the last frame is whole.
+
+    buf must start at a frame boundary (not inside an escaped pair).
+    """
+    n = len(buf)
+    whole = n
+    j = n
+    while True:
+        j = buf.rfind(_ESC, 0, j)
+        if j < 0:
+            return whole
+        k = j
+        while k and buf[k - 1] == BEAST_ESCAPE:
+            k -= 1
+        if (j - k) % 2 == 0:
+            if j + 1 == n:
+                # A final lone 0x1a starts a frame or half an escaped pair; the frame before decides
+                whole = j
+            else:
+                blen = FRAME_BODY_LEN.get(buf[j + 1])
+                if blen is not None:
+                    end = j + 2 + blen
+                    if end <= n and buf.find(_ESC, j + 2, end) < 0:
+                        return whole
+                    _, nxt = _unescape_body(buf, j + 2, blen)
+                    return j if nxt < 0 else whole
+        j = k
+
+
+class BeastDecoder:
+    """Incremental Beast decoder for one feeder connection.
+
+    feed() is given the exact chunks forwarded to readsb and returns
+    (messages, positions): all Beast message frames, counted by a
+    BeastFrameScanner, and DF17/DF18 airborne-position squitters (TC 9–18).
+
+    Complete frames are also classified for histogram(): frame type, DF of
+    every Mode-S frame, ADS-B type code of DF17/18, signal level, and the
+    12 MHz timestamp and signal of the newest frame. Classification runs as
+    regex passes over a pair-masked copy of each read; only Mode-S frames with
+    an escaped byte in their first 12 body bytes are unescaped in Python. The
+    forwarded chunks themselves are never modified. An incomplete trailing
+    frame (< 50 bytes) is kept between reads; its length is tail_len.
+    """
+
+    __slots__ = (
+        "_scanner", "_tail", "frames", "positions", "type_counts", "df_counts", "tc_counts",
+        "signal_sum", "signal_count", "last_timestamp", "last_signal",
+    )
+
+    def __init__(self):
+        self._scanner = BeastFrameScanner()
+        self._tail = b""
+        self.frames = 0
+        self.positions = 0
+        self.type_counts = [0] * 256
+        self.df_counts = [0] * 32
+        self.tc_counts = [0] * 32
+        self.signal_sum = 0
+        self.signal_count = 0
+        self.last_timestamp = None
+        self.last_signal = None
+
+    @property
+    def tail_len(self):
+        """Bytes at the end of the stream fed so far that do not yet form a complete frame."""
+        return len(self._tail)
+
+    def feed(self, data):
+        msgs = self._scanner.feed(data)[0]
+        buf = self._tail + data if self._tail else data
+        cut = _incomplete_frame_start(buf)
+        positions = self._classify(buf, cut) if cut else 0
+        self._tail = buf[cut:]
+        self.frames += msgs
+        self.positions += positions
+        return msgs, positions
+
+    def _classify(self, buf, end):
+        """Tally the complete frames in buf[:end]; returns their airborne-position count."""
+        masked = buf.replace(_ESC_PAIR, _PAIR_MASK) if _ESC_PAIR in buf else buf
+        types = self.type_counts
+        for marker, _ in _TYPE_MARKERS:
+            types[marker[1]] += masked.count(marker, 0, end)
+
+        # Bulk path: signal and DF bytes interleaved, one pair per Mode-S frame
+        heads = b"".join(_MODES_RE.findall(masked, 0, end))
+        signals = heads[0::2]
+        self.signal_sum += sum(signals)
+        self.signal_count += len(signals)
+        dfs = self.df_counts
+        for df, n in collections.Counter(heads[1::2].translate(_TOP5)).items():
+            dfs[df] += n
+        tcs = self.tc_counts
+        positions = 0
+        for tc, n in collections.Counter(b"".join(_ADSB_RE.findall(masked, 0, end)).translate(_TOP5)).items():
+            tcs[tc] += n
+            if 9 <= tc <= 18:
+                positions += n
+
+        for m in _ESCAPED_MODES_RE.finditer(masked, 0, end):
+            start = m.end()
+            # 12 logical bytes are at most 24 raw ones; stop at the next frame start
+            nxt = _MARKER_RE.search(masked, start, start + 26)
+            body = buf[start:nxt.start() if nxt else start + 26].replace(_ESC_PAIR, _ESC)
+            if len(body) < 12:
+                continue  # cut short by the next frame
+            self.signal_sum += body[6]
+            self.signal_count += 1
+            df = body[7] >> 3
+            dfs[df] += 1
+            if m.group(1) == b"\x33" and (df == 17 or df == 18):
+                tc = body[11] >> 3
+                tcs[tc] += 1
+                if 9 <= tc <= 18:
+                    positions += 1
+
+        # Newest timestamped frame (the last marker may be a receiver-ID frame)
+        k = masked.rfind(_ESC, 0, end)
+        while k >= 0 and masked[k + 1] not in BEAST_TYPES:
+            k = masked.rfind(_ESC, 0, k)
+        if k >= 0:
+            body, _ = _unescape_body(buf, k + 2, 7)
+            if body is not None:
+                self.last_timestamp = int.from_bytes(body[:6], "big")
+                self.last_signal = body[6]
+        return positions
+
+    def histogram(self):
+        """Per-connection message-type breakdown (JSON-serialisable)."""
+        tc = self.tc_counts
+        df = self.df_counts
+        df_out = {name: df[n] for n, name in DF_NAMES.items()}
+        df_out["other"] = sum(df) - sum(df_out.values())
+        adsb = {name: sum(tc[c] for c in codes) for name, codes in TC_CLASSES}
+        adsb["other"] = sum(tc) - sum(adsb.values())
+        types = self.type_counts
+        return {
+            "frames": self.frames,
+            "positions": self.positions,
+            "mode_ac": types[0x31],
+            "mode_s_short": types[0x32],
+            "mode_s_long": types[0x33],
+            "status": types[0x34] + types[0x35],
+            "df": df_out,
+            "adsb": adsb,
+            "avg_signal": round(self.signal_sum / self.signal_count, 1) if self.signal_count else None,
+            "last_timestamp": self.last_timestamp,
+            "last_signal": self.last_signal,
+        }
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Microbenchmark: legacy per-byte Beast frame counter vs BeastFrameScanner / BeastDecoder.
+
+Usage:
+    python3 bench/bench_frame_scan.py [capture.bin ...]
+
+Each capture is a raw Beast stream (e.g. `nc feeder 30005 > capture.bin`).
+Without arguments a synthetic capture is generated. Captures are replayed
+in 8 KiB reads, as forward_stream() sees them, and throughput is reported in
+MB/s together with the frame counts from both implementations.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from beast_frames import BEAST_ESCAPE, BEAST_LONG, BEAST_TYPES, BeastDecoder, BeastFrameScanner  # noqa: E402
+
+CHUNK = 8192
+
+
+def legacy_count_beast_frames(data):
+    """The original per-chunk byte loop from proxy.py (pre-scanner)."""
+    msgs = 0
+    positions = 0
+    i = 0
+    length = len(data)
+    while i < length - 1:
+        if data[i] == BEAST_ESCAPE:
+            next_byte = data[i + 1]
+            if next_byte == BEAST_ESCAPE:
+                i += 2
+                continue
+            if next_byte in BEAST_TYPES:
+                msgs += 1
+                if next_byte in BEAST_LONG:
+                    positions += 1
+                i += 2
+                continue
+        i += 1
+    return msgs, positions
+
+
+def reference_count(data):
+    """Whole-stream byte loop (no chunk splits) — ground truth for frame counts."""
+    return legacy_count_beast_frames(data)
+
+
+def synthetic_capture(size_mb=8, seed=1090):
+    """Build a plausible Beast stream: mostly long frames, some short/Mode-AC."""
+    rnd = random.Random(seed)
+    out = bytearray()
+    target = size_mb * 1024 * 1024
+    while len(out) < target:
+        kind = rnd.random()
+        if kind < 0.65:
+            ftype, plen = 0x33, 14
+        elif kind < 0.95:
+            ftype, plen = 0x32, 7
+        else:
+            ftype, plen = 0x31, 2
+        body = bytes(rnd.getrandbits(8) for _ in range(7 + plen))
+        out += bytes([BEAST_ESCAPE, ftype])
+        out += body.replace(b"\x1a", b"\x1a\x1a")
+    return bytes(out)
+
+
+def _chunks(data):
+    return [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+
+
+def _run(label, chunks, total_bytes, fn):
+    t0 = time.perf_counter()
+    msgs = positions = 0
+    for chunk in chunks:
+        m, p = fn(chunk)
+        msgs += m
+        positions += p
+    elapsed = time.perf_counter() - t0
+    mbps = total_bytes / (1024 * 1024) / elapsed if elapsed else float("inf")
+    print(f"  {label:<10} {mbps:10.1f} MB/s   msgs={msgs:<9} positions={positions}")
+    return mbps, (msgs, positions)
+
+
+def bench(name, data):
+    chunks = _chunks(data)
+    print(f"{name}: {len(data) / (1024 * 1024):.1f} MiB in {len(chunks)} reads")
+    expected = reference_count(data)
+    legacy_mbps, legacy_counts = _run("legacy", chunks, len(data), legacy_count_beast_frames)
+    scanner = BeastFrameScanner()
+    new_mbps, new_counts = _run("scanner", chunks, len(data), scanner.feed)
+    print(f"  speedup    {new_mbps / legacy_mbps:10.1f}x")
+    decoder = BeastDecoder()
+    _run("decoder", chunks, len(data), decoder.feed)
+    print(f"  expected   msgs={expected[0]} positions={expected[1]}")
+    print(f"  legacy {'exact' if legacy_counts == expected else 'MISCOUNTS'}, "
+          f"scanner {'exact' if new_counts == expected else 'MISCOUNTS'}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Beast frame counter throughput on raw Beast captures.")
+    ap.add_argument("captures", nargs="*", help="raw Beast capture files (default: a synthetic capture)")
+    args = ap.parse_args()
+    if args.captures:
+        for path in args.captures:
+            with open(path, "rb") as f:
+                bench(os.path.basename(path), f.read())
+    else:
+        bench("synthetic", synthetic_capture())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Benchmark: inbound relay CPU cost, forward_stream() vs splice relay.
+
+Usage:
+    python3 bench/bench_relay.py [--mb 64] [--raw] [capture.bin]
+
+A feeder process pushes a Beast stream (capture file or synthetic) through
+an in-process relay into a fake readsb sink process. The relay runs once
+with the asyncio stream path and once with RELAY_MODE=splice; CPU time of
+the relay process is reported per MiB forwarded. --raw skips Beast
+accounting to show the pure forwarding cost.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import proxy  # noqa: E402
+import splice_relay  # noqa: E402
+from bench_frame_scan import synthetic_capture  # noqa: E402
+
+
+def _sink(port_q, result_q):
+    srv = socket.socket()
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+    port_q.put(srv.getsockname()[1])
+    conn, _ = srv.accept()
+    total = 0
+    while True:
+        chunk = conn.recv(1 << 20)
+        if not chunk:
+            break
+        total += len(chunk)
+    result_q.put(total)
+
+
+def _feeder(port, data, total_bytes):
+    sock = socket.create_connection(("127.0.0.1", port))
+    view = memoryview(data)
+    sent = 0
+    while sent < total_bytes:
+        chunk = view[:total_bytes - sent]
+        sock.sendall(chunk)
+        sent += len(chunk)
+    sock.close()
+
+
+def _cpu():
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+async def _relay_once(mode, data, total_bytes, raw):
+    port_q = multiprocessing.Queue()
+    result_q = multiprocessing.Queue()
+    sink = multiprocessing.Process(target=_sink, args=(port_q, result_q))
+    sink.start()
+    sink_port = port_q.get()
+    done = asyncio.Event()
+    stats = {}
+
+    async def handle(reader, writer):
+        readsb_reader, readsb_writer = await asyncio.open_connection("127.0.0.1", sink_port)
+        conn_info = proxy.new_conn_info("127.0.0.1", writer)
+        cpu0, t0 = _cpu(), time.perf_counter()
+        if mode == "splice":
+            relay = splice_relay.SpliceRelay(
+                reader, writer, readsb_writer,
+                (lambda d: None) if raw else (lambda d: proxy.account_inbound(conn_info, d)),
+            )
+            await relay.run()
+        elif raw:
+            while True:
+                chunk = await reader.read(8192)
+                if not chunk:
+                    break
+                readsb_writer.write(chunk)
+                await readsb_writer.drain()
+        else:
+            await proxy.forward_stream(reader, readsb_writer, conn_info, "inbound")
+        readsb_writer.close()
+        await readsb_writer.wait_closed()
+        stats["cpu"] = _cpu() - cpu0
+        stats["wall"] = time.perf_counter() - t0
+        stats["messages"] = conn_info["messages"]
+        writer.close()
+        done.set()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    feeder = multiprocessing.Process(target=_feeder, args=(port, data, total_bytes))
+    feeder.start()
+    await done.wait()
+    feeder.join()
+    sink.join()
+    received = result_q.get()
+    server.close()
+    return stats, received
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("capture", nargs="?", help="raw Beast capture file (default: synthetic)")
+    ap.add_argument("--mb", type=int, default=64, help="MiB to push per run")
+    ap.add_argument("--raw", action="store_true", help="skip Beast accounting")
+    args = ap.parse_args()
+    if args.mb < 1:
+        ap.error("--mb must be at least 1")
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_capture(min(4, args.mb))
+    total = args.mb * 1024 * 1024
+    mib = total / (1024 * 1024)
+
+    modes = ["stream"] + (["splice"] if splice_relay.SPLICE_AVAILABLE else [])
+    print(f"relay benchmark: {mib:.0f} MiB per run, accounting {'off' if args.raw else 'on'}")
+    results = {}
+    for mode in modes:
+        stats, received = asyncio.run(_relay_once(mode, data, total, args.raw))
+        results[mode] = stats["cpu"]
+        ok = "ok" if received == total else f"SHORT ({received} bytes)"
+        print(f"  {mode:<7} cpu {stats['cpu']:6.2f}s  ({stats['cpu'] * 1000 / mib:6.2f} ms/MiB)  "
+              f"wall {mib / stats['wall']:7.1f} MiB/s  msgs={stats['messages']}  sink {ok}")
+    if "splice" in results and results["splice"]:
+        print(f"  splice uses {results['stream'] / results['splice']:.1f}x less CPU than stream")
+
+
+if __name__ == "__main__":
+    main()
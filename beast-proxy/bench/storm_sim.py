@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Reconnect-storm simulator: N fake feeders against beast-proxy.
+
+Usage:
+    python3 bench/storm_sim.py --inproc [--feeders 500] [--restart] [--down 5]
+    python3 bench/storm_sim.py --port 30004 --sink-port 30006 [--feeders 500]
+
+A fake readsb sink accepts the proxy's upstream connections and decodes the
+Beast frames it receives. Every fake feeder sends its own ICAO address in a
+DF17 squitter every --interval seconds, so the sink sees exactly when each
+feeder's traffic is flowing again. The simulator reports time until all
+feeders are forwarding (p50/p90/max per feeder).
+
+--inproc runs beast-proxy in this process with its DB, control socket and
+/data state files in a throwaway directory, and READSB_* pointing at the
+sink (the sink port must match READSB_PORT when targeting an external
+proxy). --restart then simulates a readsb restart: the sink drops every
+connection and refuses new ones for --down seconds; feeders reconnect with
+jitter like real clients, and recovery is timed from the moment the sink
+is back.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _icaos(n):
+    """n distinct 24-bit addresses with no 0x1a byte (frames need no escaping)."""
+    out = []
+    addr = 0x3C0000
+    while len(out) < n:
+        if 0x1A not in addr.to_bytes(3, "big"):
+            out.append(addr)
+        addr += 1
+    return out
+
+
+def _frame(icao):
+    # 0x1a '3' + 6-byte timestamp + signal + DF17 (TC 11) with zero CRC
+    payload = bytes([0x8D]) + icao.to_bytes(3, "big") + bytes([11 << 3]) + bytes(9)
+    return b"\x1a\x33" + bytes(6) + b"\x80" + payload
+
+
+class Sink:
+    """Fake readsb Beast input: records when each ICAO was last seen."""
+
+    def __init__(self, port):
+        self.port = port
+        self.first_seen = {}  # icao -> time first seen since mark()
+        self._server = None
+        self._writers = set()
+
+    def mark(self):
+        self.first_seen.clear()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+
+    async def stop(self):
+        """Refuse new connections and drop every open one (readsb going away)."""
+        self._server.close()
+        await self._server.wait_closed()
+        for w in list(self._writers):
+            w.close()
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        buf = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buf += data
+                now = time.monotonic()
+                i = buf.find(b"\x1a\x33")
+                while i >= 0 and i + 23 <= len(buf):
+                    icao = int.from_bytes(buf[i + 10:i + 13], "big")
+                    self.first_seen.setdefault(icao, now)
+                    i = buf.find(b"\x1a\x33", i + 23)
+                buf = buf[i:] if i >= 0 else b""
+        except (ConnectionResetError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+async def feeder(host, port, icao, interval, stop):
+    """One feeder: UUID line, then a squitter every interval; reconnect with jitter."""
+    prefix = f"TAKNET_FEEDER_UUID {uuid.UUID(int=icao)}\n".encode()
+    frame = _frame(icao)
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(random.uniform(0.5, 2.0))
+            continue
+        try:
+            writer.write(prefix)
+            while not stop.is_set():
+                writer.write(frame)
+                await writer.drain()
+                await asyncio.sleep(interval)
+        except (ConnectionResetError, BrokenPipeError, OSError):
+            pass
+        finally:
+            writer.close()
+        await asyncio.sleep(random.uniform(0.5, 2.0))
+
+
+def _report(label, sink, icaos, t0, timeout):
+    seen = [sink.first_seen[i] - t0 for i in icaos if i in sink.first_seen]
+    seen.sort()
+    n = len(icaos)
+    if not seen:
+        print(f"{label}: no feeder forwarding after {timeout:.0f}s")
+        return
+    p = lambda q: seen[min(len(seen) - 1, int(q * len(seen)))]  # noqa: E731
+    status = "all" if len(seen) == n else f"only {len(seen)}/{n}"
+    print(f"{label}: {status} feeders forwarding — p50 {p(0.5):.2f}s  p90 {p(0.9):.2f}s  max {seen[-1]:.2f}s")
+
+
+async def _wait_all(sink, icaos, timeout):
+    deadline = time.monotonic() + timeout
+    want = set(icaos)
+    while time.monotonic() < deadline:
+        if want.issubset(sink.first_seen):
+            return
+        await asyncio.sleep(0.05)
+
+
+async def main_async(args):
+    proxy = None
+    if args.inproc:
+        tmp = tempfile.mkdtemp(prefix="storm-sim-")
+        args.port = _free_port()
+        args.sink_port = _free_port()
+        os.environ.update({
+            "DB_PATH": os.path.join(tmp, "aggregator.db"),
+            "LISTEN_PORT": str(args.port),
+            "OUTPUT_LISTEN_PORT": str(_free_port()),
+            "READSB_HOST": "127.0.0.1",
+            "READSB_PORT": str(args.sink_port),
+            "METRICS_PORT": "0",
+            "BEAST_PROXY_CONTROL_SOCKET": os.path.join(tmp, "beast-proxy.sock"),
+            "MLAT_CLIENTS_PATH": os.path.join(tmp, "none.json"),
+            "TIMESERIES_PATH": os.path.join(tmp, "feeder-timeseries.bin"),
+            "LIVE_STATE_PATH": os.path.join(tmp, "live-feeders.bin"),
+            "TAR1090_URL": "http://127.0.0.1:1/none",
+        })
+        import proxy  # noqa: E402 — reads its env at import
+
+    sink = Sink(args.sink_port)
+    await sink.start()
+    proxy_task = None
+    if proxy is not None:
+        if args.quiet:
+            sys.stdout = open(os.devnull, "w")
+        proxy_task = asyncio.create_task(proxy.main())
+        await asyncio.sleep(0.5)
+
+    icaos = _icaos(args.feeders)
+    stop = asyncio.Event()
+    out = sys.__stdout__
+
+    sink.mark()
+    t0 = time.monotonic()
+    tasks = [asyncio.create_task(feeder(args.host, args.port, icao, args.interval, stop)) for icao in icaos]
+    await _wait_all(sink, icaos, args.timeout)
+    sys.stdout, saved = out, sys.stdout
+    _report(f"storm ({args.feeders} feeders connecting at once)", sink, icaos, t0, args.timeout)
+    if proxy is not None:
+        adm = proxy._admission
+        print(f"  proxy: {adm['storms']} storm(s) detected, {adm['waiting']} still queued for enrichment")
+    sys.stdout = saved
+
+    if args.restart:
+        await sink.stop()
+        await asyncio.sleep(args.down)
+        await sink.start()
+        sink.mark()
+        t0 = time.monotonic()
+        await _wait_all(sink, icaos, args.timeout)
+        sys.stdout, saved = out, sys.stdout
+        _report(f"readsb restart (down {args.down:.0f}s)", sink, icaos, t0, args.timeout)
+        sys.stdout = saved
+
+    stop.set()
+    for t in tasks:
+        t.cancel()
+    if proxy_task is not None:
+        proxy_task.cancel()
+        try:
+            await proxy_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--feeders", type=int, default=500)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=30004, help="beast-proxy feeder port")
+    ap.add_argument("--sink-port", type=int, default=30006, help="fake readsb port (proxy's READSB_PORT)")
+    ap.add_argument("--inproc", action="store_true", help="run beast-proxy in this process")
+    ap.add_argument("--interval", type=float, default=0.2, help="seconds between squitters per feeder")
+    ap.add_argument("--restart", action="store_true", help="then simulate a readsb restart")
+    ap.add_argument("--down", type=float, default=5.0, help="readsb downtime for --restart")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--quiet", action="store_true", help="silence in-process proxy logging")
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
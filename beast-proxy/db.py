@@ -255,23 +255,75 @@ def upsert_feeder(ip_address, hostname, conn_type, location=None, lat=None, lon=
     return feeder_id
 
 
-def log_connection(feeder_id, ip_address):
-    """Log a new connection event. Returns connection ID."""
+def update_feeder_seen_many(rows):
+    """Apply cached-identity reconnects: (feeder_id, changes, conn_type) per row.
+
+    Writes only the changed identity columns plus last_seen/status, and fills
+    the NetBird map/stats URLs like upsert_feeder(). Does not commit.
+    Returns the feeder IDs that no longer exist.
+    """
+    conn = _get_conn()
+    ts = now_utc()
+    missing = []
+    for feeder_id, changes, conn_type in rows:
+        sets = [f"{col} = ?" for col in changes]
+        values = list(changes.values())
+        sets += ["last_seen = ?", "status = 'active'", "updated_at = ?"]
+        values += [ts, ts]
+        if conn_type == "netbird":
+            # SET expressions see the old row, so take a changed IP from the params
+            sets += [
+                "tar1090_url = CASE WHEN (tar1090_url IS NULL OR tar1090_url = '') "
+                "THEN 'http://' || COALESCE(?, ip_address) || ':8080' ELSE tar1090_url END",
+                "graphs1090_url = CASE WHEN (graphs1090_url IS NULL OR graphs1090_url = '') "
+                "THEN 'http://' || COALESCE(?, ip_address) || ':8080/graphs1090/' ELSE graphs1090_url END",
+            ]
+            values += [changes.get("ip_address")] * 2
+        cur = conn.execute(
+            f"UPDATE feeders SET {', '.join(sets)} WHERE id = ?", (*values, feeder_id)
+        )
+        if cur.rowcount == 0:
+            missing.append(feeder_id)
+    return missing
+
+
+def _log_activity(event_type, feeder_id, message, ts, deferred):
+    if deferred is not None:
+        deferred.append((ts, event_type, feeder_id, message))
+        return
+    _get_conn().execute(
+        "INSERT INTO activity_log (event_type, feeder_id, message) VALUES (?, ?, ?)",
+        (event_type, feeder_id, message),
+    )
+
+
+def insert_activity_many(rows):
+    """Insert deferred activity rows (timestamp, event_type, feeder_id, message). Does not commit."""
+    _get_conn().executemany(
+        "INSERT INTO activity_log (timestamp, event_type, feeder_id, message) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+def log_connection(feeder_id, ip_address, commit=True, deferred_activity=None):
+    """Log a new connection event. Returns connection ID.
+
+    With deferred_activity (a list), the activity_log row is appended there
+    instead of inserted; see insert_activity_many().
+    """
     conn = _get_conn()
     ts = now_utc()
     cursor = conn.execute(
         "INSERT INTO connections (feeder_id, ip_address, connected_at) VALUES (?, ?, ?)",
         (feeder_id, ip_address, ts),
     )
-    conn.execute(
-        "INSERT INTO activity_log (event_type, feeder_id, message) VALUES (?, ?, ?)",
-        ("feeder_connected", feeder_id, f"Feeder connected from {ip_address}"),
-    )
-    conn.commit()
+    _log_activity("feeder_connected", feeder_id, f"Feeder connected from {ip_address}", ts, deferred_activity)
+    if commit:
+        conn.commit()
     return cursor.lastrowid
 
 
-def log_disconnection(feeder_id, connection_id, bytes_transferred=0):
+def log_disconnection(feeder_id, connection_id, bytes_transferred=0, commit=True, deferred_activity=None):
     """Log disconnection and compute duration."""
     conn = _get_conn()
     ts = now_utc()
@@ -287,11 +339,9 @@ def log_disconnection(feeder_id, connection_id, bytes_transferred=0):
         "UPDATE feeders SET status = 'offline', last_seen = ?, updated_at = ? WHERE id = ?",
         (ts, ts, feeder_id),
     )
-    conn.execute(
-        "INSERT INTO activity_log (event_type, feeder_id, message) VALUES (?, ?, ?)",
-        ("feeder_disconnected", feeder_id, "Feeder disconnected"),
-    )
-    conn.commit()
+    _log_activity("feeder_disconnected", feeder_id, "Feeder disconnected", ts, deferred_activity)
+    if commit:
+        conn.commit()
 
 
 def update_feeder_stats(feeder_id, bytes_count, messages_count=0, positions_count=0):
@@ -312,6 +362,25 @@ def update_feeder_stats(feeder_id, bytes_count, messages_count=0, positions_coun
     conn.commit()
 
 
+def update_feeder_stats_many(rows):
+    """Batch form of update_feeder_stats; rows are (feeder_id, bytes, messages, positions).
+
+    Does not commit — the caller owns the transaction.
+    """
+    ts = now_utc()
+    _get_conn().executemany(
+        """UPDATE feeders SET
+            bytes_received = bytes_received + ?,
+            messages_received = messages_received + ?,
+            positions_received = positions_received + ?,
+            last_seen = ?,
+            status = 'active',
+            updated_at = ?
+        WHERE id = ?""",
+        [(b, m, p, ts, ts, fid) for fid, b, m, p in rows],
+    )
+
+
 def touch_feeder(feeder_id):
     """Update last_seen and ensure feeder is marked active (even with no new data)."""
     conn = _get_conn()
@@ -323,6 +392,15 @@ def touch_feeder(feeder_id):
     conn.commit()
 
 
+def touch_feeders_many(feeder_ids):
+    """Batch form of touch_feeder. Does not commit."""
+    ts = now_utc()
+    _get_conn().executemany(
+        "UPDATE feeders SET last_seen = ?, status = 'active', updated_at = ? WHERE id = ?",
+        [(ts, ts, fid) for fid in feeder_ids],
+    )
+
+
 def update_feeder_mlat(feeder_id, mlat_enabled, lat=None, lon=None, alt=None, mlat_name=None):
     """Update MLAT status, coordinates, and name for a feeder."""
     conn = _get_conn()
@@ -366,7 +444,44 @@ def update_feeder_mlat(feeder_id, mlat_enabled, lat=None, lon=None, alt=None, ml
     conn.commit()
 
 
-def mark_inactive_feeders(active_feeder_ids):
+def update_feeder_mlat_many(rows):
+    """Batch form of update_feeder_mlat; rows are (feeder_id, mlat_enabled, lat, lon, alt, mlat_name).
+
+    Does not commit.
+    """
+    ts = now_utc()
+    status_rows = []
+    coord_rows = []
+    for feeder_id, mlat_enabled, lat, lon, alt, mlat_name in rows:
+        tid = None
+        if mlat_name:
+            tid = derive_tunnel_feeder_id(feeder_id, clean_mlat_display_name(mlat_name))
+        status_rows.append((1 if mlat_enabled else 0, mlat_name, mlat_name, tid, tid, ts, feeder_id))
+        if mlat_enabled and lat is not None and lon is not None:
+            coord_rows.append((lat, lon, alt, ts, feeder_id))
+    conn = _get_conn()
+    conn.executemany(
+        """UPDATE feeders SET
+            mlat_enabled = ?,
+            name = CASE WHEN ? IS NOT NULL THEN ? ELSE name END,
+            tunnel_feeder_id = CASE WHEN ? IS NOT NULL THEN ? ELSE tunnel_feeder_id END,
+            updated_at = ?
+        WHERE id = ?""",
+        status_rows,
+    )
+    if coord_rows:
+        conn.executemany(
+            """UPDATE feeders SET
+                latitude = ?,
+                longitude = ?,
+                altitude = ?,
+                updated_at = ?
+            WHERE id = ?""",
+            coord_rows,
+        )
+
+
+def mark_inactive_feeders(active_feeder_ids, commit=True):
     """Mark feeders as stale only if not currently connected AND
     not seen in the last 5 minutes. Prevents wrong stale marking
     during service restarts while feeders are reconnecting."""
@@ -388,7 +503,8 @@ def mark_inactive_feeders(active_feeder_ids):
                AND last_seen < datetime('now', '-5 minutes')""",
             (ts,),
         )
-    conn.commit()
+    if commit:
+        conn.commit()
 
 
 def validate_output_key(raw_key: str):
@@ -450,17 +566,21 @@ def signal_drop_output(output_id: int):
 
 
 def pop_drop_signals() -> list:
-    """Fetch and clear all pending drop signals. Returns list of output_ids."""
+    """Fetch and clear all pending drop signals.
+
+    Returns list of (output_id, signaled_at) with signaled_at as a UTC
+    'YYYY-MM-DD HH:MM:SS' string (or None).
+    """
     conn = _get_conn()
-    rows = conn.execute("SELECT output_id FROM output_drop_signals").fetchall()
-    ids = [r["output_id"] for r in rows]
-    if ids:
+    rows = conn.execute("SELECT output_id, signaled_at FROM output_drop_signals").fetchall()
+    signals = [(r["output_id"], r["signaled_at"]) for r in rows]
+    if signals:
         conn.execute("DELETE FROM output_drop_signals")
         conn.commit()
-    return ids
+    return signals
 
 
-def purge_old_feeders(hours: int = 24, exclude_ids: set = None) -> int:
+def purge_old_feeders(hours: int = 24, exclude_ids: set = None, commit: bool = True) -> int:
     """Delete feeders not seen in the last N hours, excluding any currently active."""
     conn = _get_conn()
     if exclude_ids:
@@ -475,5 +595,6 @@ def purge_old_feeders(hours: int = 24, exclude_ids: set = None) -> int:
             (f"-{hours} hours",)
         )
     count = cur.rowcount
-    conn.commit()
+    if commit:
+        conn.commit()
     return count
@@ -0,0 +1,386 @@
+"""DB writer — coalesces beast-proxy writes and applies them off the event loop.
+
+The asyncio loop only enqueues small tuples. A single writer thread drains
+everything queued since its last pass, merges per-feeder deltas, and applies
+the result as one transaction (executemany for the per-feeder updates).
+Connect/disconnect events use the same queue so they stay ordered with the
+stats of the connection they close.
+
+Each step of a batch runs in its own savepoint, so one failing op only loses
+that op. Merged deltas that failed on a transient error (locked/busy DB) are
+re-applied ahead of the next batch, up to SEGMENT_ATTEMPTS times.
+"""
+
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+
+import db
+import feeder_index
+from metrics import DB_FLUSH_SECONDS
+
+_STOP = object()
+
+# writes of one merged segment before its deltas are dropped
+SEGMENT_ATTEMPTS = 5
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_thread = None
+_tokens = itertools.count(1)
+# connection token → connections.id, filled in when the connect event is written
+_connection_ids: dict = {}
+# activity_log rows held back during a reconnect storm (writer thread only)
+_deferred_activity: list = []
+# ("retry", attempts, deltas) of failed segments (and, after a failed commit,
+# ordered ops) to apply ahead of the next batch
+_retry: list = []
+
+_metrics = {
+    "batches": 0,
+    "ops": 0,
+    "errors": 0,
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+    "last_batch_size": 0,
+    "deferred_activity": 0,
+}
+
+
+# ── Producer API (called from the event loop) ─────────────────────────────────
+
+def update_feeder_stats(feeder_id, bytes_count, messages_count=0, positions_count=0):
+    """Queue a counter delta for a feeder; deltas for the same feeder are summed."""
+    _queue.put(("stats", feeder_id, bytes_count, messages_count, positions_count))
+
+
+def touch_feeder(feeder_id):
+    _queue.put(("touch", feeder_id))
+
+
+def update_feeder_mlat(feeder_id, mlat_enabled, lat=None, lon=None, alt=None, mlat_name=None):
+    """Queue an MLAT status update; the latest update per feeder wins."""
+    _queue.put(("mlat", feeder_id, mlat_enabled, lat, lon, alt, mlat_name))
+
+
+def update_feeder_mlat_many(rows):
+    """Queue several MLAT updates as one op, so they land in the same transaction.
+
+    rows: (feeder_id, mlat_enabled, lat, lon, alt, mlat_name) tuples.
+    """
+    rows = [tuple(r) for r in rows]
+    if rows:
+        _queue.put(("mlat_many", rows))
+
+
+def feeder_seen(feeder_id, changes, conn_type):
+    """Queue a reconnect resolved by feeder_index: changed identity columns + last_seen."""
+    _queue.put(("seen", feeder_id, changes, conn_type))
+
+
+def reload_feeder_index():
+    """Queue a feeder_index reload behind every write queued so far."""
+    _queue.put(("reload_index",))
+
+
+def flush(timeout=5):
+    """Block until everything queued so far is committed (call off the event loop)."""
+    if _thread is None or not _thread.is_alive():
+        return False
+    done = threading.Event()
+    _queue.put(("barrier", done))
+    return done.wait(timeout)
+
+
+def log_connection(feeder_id, ip_address, defer_activity=False):
+    """Queue a connect event. Returns a token to pass to log_disconnection().
+
+    defer_activity holds the activity_log row back until flush_activity().
+    """
+    token = next(_tokens)
+    _queue.put(("connect", token, feeder_id, ip_address, defer_activity))
+    return token
+
+
+def log_disconnection(feeder_id, token, bytes_transferred=0, defer_activity=False):
+    _queue.put(("disconnect", token, feeder_id, bytes_transferred, defer_activity))
+
+
+def flush_activity():
+    """Queue a write of all deferred activity_log rows (one executemany)."""
+    _queue.put(("flush_activity",))
+
+
+def mark_inactive_feeders(active_feeder_ids):
+    _queue.put(("mark_inactive", set(active_feeder_ids)))
+
+
+def purge_old_feeders(hours=24, exclude_ids=None):
+    """Queue a purge; the result is logged by the writer thread."""
+    _queue.put(("purge", hours, set(exclude_ids or ())))
+
+
+def metrics():
+    """Writer health: queue depth, flush latency and throughput counters."""
+    out = dict(_metrics)
+    out["queue_depth"] = _queue.qsize()
+    return out
+
+
+def reset_max_flush():
+    """Return and reset the max flush latency since the previous call."""
+    peak = _metrics["max_flush_ms"]
+    _metrics["max_flush_ms"] = 0.0
+    return peak
+
+
+# ── Writer thread ─────────────────────────────────────────────────────────────
+
+def _write_merged(stats, touches, mlat, seen):
+    """Write one segment's merged per-feeder updates. Returns feeder ids missing from the DB."""
+    touches.difference_update(stats)
+    touches.difference_update(seen)
+    missing = db.update_feeder_seen_many(seen.values()) if seen else []
+    if stats:
+        db.update_feeder_stats_many((fid, b, m, p) for fid, (b, m, p) in stats.items())
+    if touches:
+        db.touch_feeders_many(touches)
+    if mlat:
+        db.update_feeder_mlat_many(mlat.values())
+    return missing
+
+
+def _delta_ops(stats, touches, mlat, seen):
+    """A merged segment as queue ops again (one per feeder), for re-applying later."""
+    ops = [("stats", fid, b, m, p) for fid, (b, m, p) in stats.items()]
+    ops.extend(("touch", fid) for fid in touches)
+    if mlat:
+        ops.append(("mlat_many", list(mlat.values())))
+    ops.extend(("seen", fid, changes, conn_type) for fid, changes, conn_type in seen.values())
+    return ops
+
+
+def _merge(segment, op):
+    """Fold a stats/touch/mlat/seen op into segment. Returns False for any other op."""
+    stats, touches, mlat, seen = segment
+    kind = op[0]
+    if kind == "stats":
+        _, fid, b, m, p = op
+        acc = stats.get(fid)
+        if acc is None:
+            stats[fid] = [b, m, p]
+        else:
+            acc[0] += b
+            acc[1] += m
+            acc[2] += p
+    elif kind == "touch":
+        touches.add(op[1])
+    elif kind == "mlat":
+        mlat[op[1]] = op[1:]
+    elif kind == "mlat_many":
+        for row in op[1]:
+            mlat[row[0]] = row
+    elif kind == "seen":
+        _, fid, changes, conn_type = op
+        prev = seen.get(fid)
+        if prev is not None:
+            changes = {**prev[1], **changes}
+        seen[fid] = (fid, changes, conn_type)
+    else:
+        return False
+    return True
+
+
+def _new_segment():
+    return {}, set(), {}, {}
+
+
+def _step(conn, what, fn):
+    """Run fn() in a savepoint. On failure only its writes are rolled back.
+
+    Returns (ok, result); result is the exception when ok is False.
+    """
+    conn.execute("SAVEPOINT op")
+    try:
+        result = fn()
+    except Exception as e:
+        conn.execute("ROLLBACK TO op")
+        conn.execute("RELEASE op")
+        _metrics["errors"] += 1
+        print(f"[db-writer] {what} failed: {e}")
+        return False, e
+    conn.execute("RELEASE op")
+    return True, result
+
+
+def _apply(batch):
+    """Apply a drained batch as one transaction.
+
+    stats/touch/mlat/seen ops are merged per feeder between ordered ops
+    (connect, disconnect, barrier, ...); each ordered op first writes what was
+    merged before it, so a disconnect followed by a reconnect in the same
+    batch leaves the feeder online.
+
+    Every segment write and ordered op gets its own savepoint. A failing
+    ordered op is logged and dropped. A segment failing on an OperationalError
+    is re-queued as a ("retry", attempts, deltas) op, which is written on its
+    own so fresh deltas never merge into it; after SEGMENT_ATTEMPTS tries, or
+    on any other error, its deltas are dropped. If the
+    commit itself fails, the whole batch (compacted to merged deltas) is
+    re-queued and the connection-token map is restored.
+    """
+    conn = db._get_conn()
+    t0 = time.perf_counter()
+    reload_index = False
+    barriers = [op[1] for op in batch if op[0] == "barrier"]
+    segment = _new_segment()
+    missing = []
+    requeue = []       # deltas of failed segments
+    replay = []        # everything written, in order, in case the commit fails
+    opened, closed = [], {}
+    deferred = list(_deferred_activity)
+    committed = False
+
+    def write_segment(segment, attempts=0):
+        ops = _delta_ops(*segment)
+        ok, result = _step(conn, f"Update of {len(ops)} feeder row(s)", lambda: _write_merged(*segment))
+        if ok:
+            missing.extend(result)
+            if attempts:
+                replay.append(("retry", attempts, ops))
+            else:
+                replay.extend(ops)
+        elif isinstance(result, sqlite3.OperationalError) and attempts + 1 < SEGMENT_ATTEMPTS:
+            requeue.append(("retry", attempts + 1, ops))
+        else:
+            print(f"[db-writer] Dropped update of {len(ops)} feeder row(s) after {attempts + 1} attempt(s)")
+
+    try:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        purged = 0
+        for op in batch:
+            kind = op[0]
+            if _merge(segment, op):
+                continue
+            if kind == "retry":
+                retried = _new_segment()
+                for delta in op[2]:
+                    _merge(retried, delta)
+                write_segment(retried, op[1])
+                continue
+            if any(segment):
+                write_segment(segment)
+                segment = _new_segment()
+            ok = True
+            if kind == "connect":
+                _, token, fid, ip, defer = op
+                ok, connection_id = _step(conn, f"Connect of feeder {fid}", lambda: db.log_connection(
+                    fid, ip, commit=False, deferred_activity=_deferred_activity if defer else None))
+                if ok:
+                    _connection_ids[token] = connection_id
+                    opened.append(token)
+            elif kind == "disconnect":
+                _, token, fid, nbytes, defer = op
+                connection_id = _connection_ids.pop(token, None)
+                if connection_id is not None:
+                    closed[token] = connection_id
+                    ok, _ = _step(conn, f"Disconnect of feeder {fid}", lambda: db.log_disconnection(
+                        fid, connection_id, nbytes, commit=False,
+                        deferred_activity=_deferred_activity if defer else None))
+            elif kind == "flush_activity":
+                if _deferred_activity:
+                    ok, _ = _step(conn, "Deferred activity log write",
+                                  lambda: db.insert_activity_many(_deferred_activity))
+                    if ok:
+                        print(f"[db-writer] Wrote {len(_deferred_activity)} deferred activity log row(s)")
+                        _deferred_activity.clear()
+            elif kind == "mark_inactive":
+                ok, _ = _step(conn, "Stale marking", lambda: db.mark_inactive_feeders(op[1], commit=False))
+            elif kind == "purge":
+                ok, n = _step(conn, "Purge", lambda: db.purge_old_feeders(
+                    hours=op[1], exclude_ids=op[2], commit=False))
+                if ok:
+                    purged += n
+            elif kind == "reload_index":
+                reload_index = True
+            if ok and kind != "barrier":
+                replay.append(op)
+        if any(segment):
+            write_segment(segment)
+        conn.commit()
+        committed = True
+        _retry.extend(requeue)
+        if purged:
+            print(f"[proxy] Auto-purged {purged} feeder(s) not seen in 24h")
+        for fid in missing:
+            # Deleted behind our back; the next connect takes the DB path
+            print(f"[db-writer] Feeder {fid} no longer exists — dropped from identity index")
+            feeder_index.forget(fid)
+        if purged or reload_index:
+            feeder_index.load(conn)
+    except Exception as e:
+        _metrics["errors"] += 1
+        print(f"[db-writer] Batch of {len(batch)} op(s) failed: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        if not committed:
+            # Nothing was committed: undo the bookkeeping and apply it all again next pass
+            for token in opened:
+                _connection_ids.pop(token, None)
+            _connection_ids.update(closed)
+            _deferred_activity[:] = deferred
+            _retry.extend(replay)
+            _retry.extend(requeue)
+    for done in barriers:
+        done.set()
+    _metrics["deferred_activity"] = len(_deferred_activity)
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    DB_FLUSH_SECONDS.observe(elapsed_ms / 1000.0)
+    _metrics["batches"] += 1
+    _metrics["ops"] += len(batch)
+    _metrics["last_batch_size"] = len(batch)
+    _metrics["last_flush_ms"] = elapsed_ms
+    if elapsed_ms > _metrics["max_flush_ms"]:
+        _metrics["max_flush_ms"] = elapsed_ms
+
+
+def _run():
+    while True:
+        batch = [_queue.get()]
+        while True:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = any(op is _STOP for op in batch)
+        if stop:
+            batch = [op for op in batch if op is not _STOP]
+        if _retry:
+            batch[:0] = _retry
+            _retry.clear()
+        if batch:
+            _apply(batch)
+        if stop:
+            return
+
+
+def start():
+    """Start the writer thread (idempotent)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_run, name="db-writer", daemon=True)
+    _thread.start()
+
+
+def stop(timeout=10):
+    """Flush everything queued so far and stop the writer thread."""
+    if _thread is None or not _thread.is_alive():
+        return
+    _queue.put(("flush_activity",))
+    _queue.put(_STOP)
+    _thread.join(timeout)
@@ -0,0 +1,162 @@
+"""Feeder identity index — in-memory uuid/mac/ip/hostname → feeder_id.
+
+Loaded once at startup from the feeders table and kept in sync by the proxy
+itself, so a reconnecting feeder is resolved without touching SQLite.
+match() mirrors the lookup order of db.upsert_feeder() (feeder_uuid, then
+device_mac, then ip_address) and returns only the identity columns that
+actually changed; the caller queues those through db_writer. Anything the
+index cannot answer on its own — a brand-new feeder, or the NetBird
+hostname re-home of a stale record — returns None and goes through
+db.upsert_feeder() as before, after which remember() records the row.
+
+The dashboard invalidates the index after merging or deleting feeders by
+sending "feeders-changed" on the proxy control socket; the reload is queued
+behind pending DB writes so it sees them.
+"""
+
+import threading
+
+import db
+
+# Identity/enrichment columns cached per feeder (compared on every connect)
+COLUMNS = ("feeder_uuid", "device_mac", "ip_address", "hostname", "conn_type",
+           "location", "latitude", "longitude", "name")
+# Key columns with a reverse map: value → set of feeder ids
+_KEYS = ("feeder_uuid", "device_mac", "ip_address", "hostname")
+
+_lock = threading.Lock()
+_rows = {}  # feeder_id -> {column: value}
+_by = {key: {} for key in _KEYS}
+_stats = {"hits": 0, "misses": 0, "loads": 0}
+
+
+def _add_keys(feeder_id, row):
+    for key in _KEYS:
+        value = row.get(key)
+        if value:
+            _by[key].setdefault(value, set()).add(feeder_id)
+
+
+def _drop_keys(feeder_id, row):
+    for key in _KEYS:
+        value = row.get(key)
+        if not value:
+            continue
+        ids = _by[key].get(value)
+        if ids is not None:
+            ids.discard(feeder_id)
+            if not ids:
+                del _by[key][value]
+
+
+def _first(key, value):
+    # SQLite returns the lowest rowid first for these unordered single-row SELECTs
+    ids = _by[key].get(value) if value else None
+    return min(ids) if ids else None
+
+
+def load(conn=None):
+    """(Re)build the index from the feeders table. Returns the number of feeders."""
+    conn = conn or db._get_conn()
+    cols = ", ".join(COLUMNS)
+    rows = conn.execute(f"SELECT id, {cols} FROM feeders").fetchall()
+    fresh = {r["id"]: {c: r[c] for c in COLUMNS} for r in rows}
+    with _lock:
+        _rows.clear()
+        for key in _KEYS:
+            _by[key].clear()
+        for feeder_id, row in fresh.items():
+            _rows[feeder_id] = row
+            _add_keys(feeder_id, row)
+        _stats["loads"] += 1
+    return len(fresh)
+
+
+def remember(feeder_id, conn=None):
+    """Refresh one feeder's cached row from the DB (after a slow-path upsert)."""
+    conn = conn or db._get_conn()
+    r = conn.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM feeders WHERE id = ?", (feeder_id,)
+    ).fetchone()
+    with _lock:
+        old = _rows.pop(feeder_id, None)
+        if old is not None:
+            _drop_keys(feeder_id, old)
+        if r is not None:
+            row = {c: r[c] for c in COLUMNS}
+            _rows[feeder_id] = row
+            _add_keys(feeder_id, row)
+
+
+def forget(feeder_id):
+    with _lock:
+        old = _rows.pop(feeder_id, None)
+        if old is not None:
+            _drop_keys(feeder_id, old)
+
+
+def match(ip_address, hostname, conn_type, location=None, lat=None, lon=None,
+          device_mac=None, feeder_uuid=None):
+    """Resolve a connecting feeder from memory.
+
+    Returns (feeder_id, changes) where changes maps column → new value for
+    the columns db.upsert_feeder() would have changed, or None when the DB
+    path is needed. The cached row is updated in place.
+    """
+    normalized_mac = db._normalize_mac(device_mac)
+    with _lock:
+        feeder_id = None
+        if feeder_uuid:
+            feeder_id = _first("feeder_uuid", feeder_uuid)
+        if feeder_id is None and normalized_mac:
+            feeder_id = _first("device_mac", normalized_mac)
+        if feeder_id is None:
+            feeder_id = _first("ip_address", ip_address)
+        if feeder_id is None:
+            _stats["misses"] += 1
+            return None
+
+        row = _rows[feeder_id]
+        # Same COALESCE semantics as the UPDATE in db.upsert_feeder()
+        wanted = {
+            "feeder_uuid": feeder_uuid if feeder_uuid is not None else row["feeder_uuid"],
+            "device_mac": normalized_mac or row["device_mac"],
+            "ip_address": ip_address,
+            "hostname": hostname if hostname is not None else row["hostname"],
+            "conn_type": conn_type,
+            "location": location if location is not None else row["location"],
+            "latitude": lat if lat is not None else row["latitude"],
+            "longitude": lon if lon is not None else row["longitude"],
+        }
+        changes = {c: v for c, v in wanted.items() if v != row[c]}
+        if changes:
+            _drop_keys(feeder_id, row)
+            row.update(changes)
+            _add_keys(feeder_id, row)
+        _stats["hits"] += 1
+        return feeder_id, changes
+
+
+def conn_types():
+    """{feeder_id: conn_type} for every indexed feeder (for the live state table)."""
+    with _lock:
+        return {feeder_id: row["conn_type"] for feeder_id, row in _rows.items()}
+
+
+def names(feeder_ids):
+    """{feeder_id: name} for the given feeders (for MLAT client attribution)."""
+    with _lock:
+        return {fid: _rows[fid]["name"] for fid in feeder_ids if fid in _rows}
+
+
+def set_name(feeder_id, name):
+    """Record a name written by the MLAT update (db_writer applies the same value)."""
+    with _lock:
+        row = _rows.get(feeder_id)
+        if row is not None and name:
+            row["name"] = name
+
+
+def stats():
+    with _lock:
+        return dict(_stats, feeders=len(_rows))
@@ -1,11 +1,34 @@
-"""GeoIP helper — optional geolocation for public IP feeders."""
+"""GeoIP helper — optional geolocation for public IP feeders.
 
+Results are kept in a bounded LRU keyed by IP with a TTL, so reconnects from
+the same address skip the reader entirely. Addresses the database does not
+know are cached too (negative caching, shorter TTL). warmup() preloads the
+cache for known feeder IPs at startup.
+
+The database is opened once, under a lock, with GEOIP_MODE (default auto:
+the C extension when installed, else mmap), so several processes reading the
+same .mmdb share one copy in the page cache.
+"""
+
+import collections
 import os
+import threading
+import time
 
 GEOIP_ENABLED = os.environ.get("GEOIP_ENABLED", "false").lower() == "true"
 GEOIP_DB_PATH = os.environ.get("GEOIP_DB_PATH", "/app/GeoLite2-City.mmdb")
+# maxminddb open mode: auto, mmap, mmap_ext, memory or file
+GEOIP_MODE         = os.environ.get("GEOIP_MODE", "auto").strip().lower()
+GEOIP_CACHE_SIZE   = int(os.environ.get("GEOIP_CACHE_SIZE", "8192"))
+GEOIP_CACHE_TTL    = int(os.environ.get("GEOIP_CACHE_TTL", "86400"))     # found locations
+GEOIP_NEGATIVE_TTL = int(os.environ.get("GEOIP_NEGATIVE_TTL", "3600"))   # IPs not in the database
 
 _reader = None
+_reader_lock = threading.Lock()
+
+_cache = collections.OrderedDict()  # ip -> (expires_at, result or None)
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "warmed": 0}
 
 
 def _get_reader():
@@ -14,50 +37,110 @@ def _get_reader():
         return _reader
     if not GEOIP_ENABLED:
         return None
-    if not os.path.exists(GEOIP_DB_PATH):
-        print(f"[geoip] Database not found at {GEOIP_DB_PATH}")
-        return None
-    try:
-        import maxminddb
-        _reader = maxminddb.open_database(GEOIP_DB_PATH)
-        print(f"[geoip] Loaded database from {GEOIP_DB_PATH}")
-        return _reader
-    except Exception as e:
-        print(f"[geoip] Failed to load database: {e}")
+    with _reader_lock:
+        if _reader is not None:
+            return _reader
+        if not os.path.exists(GEOIP_DB_PATH):
+            print(f"[geoip] Database not found at {GEOIP_DB_PATH}")
+            return None
+        try:
+            import maxminddb
+            mode = getattr(maxminddb, f"MODE_{GEOIP_MODE.upper()}", None)
+            if mode is None:
+                print(f"[geoip] Unknown GEOIP_MODE {GEOIP_MODE!r} — using auto")
+                mode = maxminddb.MODE_AUTO
+            _reader = maxminddb.open_database(GEOIP_DB_PATH, mode)
+            print(f"[geoip] Loaded database from {GEOIP_DB_PATH} ({GEOIP_MODE})")
+            return _reader
+        except Exception as e:
+            print(f"[geoip] Failed to load database: {e}")
+            return None
+
+
+def _read(reader, ip_str):
+    """Uncached lookup: location dict, or None if the IP is not in the database."""
+    result = reader.get(ip_str)
+    if result is None:
         return None
 
+    city = result.get("city", {}).get("names", {}).get("en", "")
+    subdivisions = result.get("subdivisions", [])
+    state = subdivisions[0].get("iso_code", "") if subdivisions else ""
+    country = result.get("country", {}).get("iso_code", "")
+
+    parts = [p for p in [city, state] if p]
+    location = ", ".join(parts) if parts else country
+
+    loc = result.get("location", {})
+    lat = loc.get("latitude")
+    lon = loc.get("longitude")
+
+    return {
+        "location": location or None,
+        "latitude": lat,
+        "longitude": lon,
+    }
+
+
+def _store(ip_str, result, now):
+    ttl = GEOIP_CACHE_TTL if result is not None else GEOIP_NEGATIVE_TTL
+    with _cache_lock:
+        _cache[ip_str] = (now + ttl, result)
+        _cache.move_to_end(ip_str)
+        while len(_cache) > GEOIP_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
 
 def lookup(ip_str):
     """Lookup geolocation for an IP address.
 
     Returns dict with 'location' (str), 'latitude', 'longitude' or None.
+    The dict is shared with the cache and must not be modified.
     """
     reader = _get_reader()
     if reader is None:
         return None
 
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(ip_str)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(ip_str)
+            _stats["hits" if entry[1] is not None else "negative_hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+
     try:
-        result = reader.get(ip_str)
-        if result is None:
-            return None
+        result = _read(reader, ip_str)
+    except Exception as e:
+        # Not cached: a malformed address or reader error may not repeat
+        print(f"[geoip] Lookup failed for {ip_str}: {e}")
+        return None
+    if GEOIP_CACHE_SIZE > 0:
+        _store(ip_str, result, now)
+    return result
 
-        city = result.get("city", {}).get("names", {}).get("en", "")
-        subdivisions = result.get("subdivisions", [])
-        state = subdivisions[0].get("iso_code", "") if subdivisions else ""
-        country = result.get("country", {}).get("iso_code", "")
 
-        parts = [p for p in [city, state] if p]
-        location = ", ".join(parts) if parts else country
+def warmup(ip_addresses):
+    """Preload the cache for known feeder IPs. Returns the number of IPs cached."""
+    reader = _get_reader()
+    if reader is None or GEOIP_CACHE_SIZE <= 0:
+        return 0
+    now = time.monotonic()
+    warmed = 0
+    # Beyond the cache size the oldest entries would just be evicted again
+    for ip_str in list(dict.fromkeys(ip_addresses))[:GEOIP_CACHE_SIZE]:
+        try:
+            _store(ip_str, _read(reader, ip_str), now)
+            warmed += 1
+        except Exception:
+            continue
+    with _cache_lock:
+        _stats["warmed"] += warmed
+    return warmed
 
-        loc = result.get("location", {})
-        lat = loc.get("latitude")
-        lon = loc.get("longitude")
 
-        return {
-            "location": location or None,
-            "latitude": lat,
-            "longitude": lon,
-        }
-    except Exception as e:
-        print(f"[geoip] Lookup failed for {ip_str}: {e}")
-        return None
+def stats():
+    with _cache_lock:
+        return dict(_stats, size=len(_cache))
@@ -0,0 +1,149 @@
+"""Live state — per-feeder status and counters published to a shared mmap file.
+
+beast-proxy rewrites LIVE_STATE_PATH (on the shared /data volume) every
+LIVE_STATE_INTERVAL seconds with one fixed-size record per known feeder, so
+the dashboard can read current status, counters and rates without querying
+SQLite. The layout is mirrored by web/services/live_state.py:
+
+    header  <4sHHIIdI4x  magic b"TKLS", version, record size, sequence,
+                         record count, updated_at (unix), capacity
+    record  <IBBH16sQQQfffdd  feeder id, status, reserved, open connections,
+                         conn_type, bytes/messages/positions over the open
+                         connections, bytes/messages/positions per second,
+                         last_data (unix), connected_at (unix)
+
+Records are rewritten in place under a sequence lock: the sequence is odd
+while a write is in progress, and a reader retries when it saw an odd value
+or the value changed during its copy. When the table outgrows the file, a
+larger file is written beside it and renamed over it; readers notice the new
+inode and remap.
+
+Status is the proxy's own view: 'active' while a connection delivered a
+Beast message within LIVE_STALE_SECONDS, 'stale' while connected but quiet,
+'offline' when no connection is open.
+"""
+
+import math
+import mmap
+import os
+import struct
+import time
+
+LIVE_STATE_PATH     = os.environ.get("LIVE_STATE_PATH", "/data/live-feeders.bin")
+LIVE_STATE_INTERVAL = float(os.environ.get("LIVE_STATE_INTERVAL", "1"))   # seconds; 0 disables
+LIVE_STALE_SECONDS  = int(os.environ.get("LIVE_STALE_SECONDS", "120"))
+
+MAGIC = b"TKLS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIdI4x")
+RECORD = struct.Struct("<IBBH16sQQQfffdd")
+STATUS_CODES = {"offline": 0, "active": 1, "stale": 2}
+
+# Rates are exponentially smoothed over roughly this many seconds
+_RATE_TAU = 10.0
+
+
+class LiveStateWriter:
+    """Owns the mmap'd state file and the per-feeder rate history."""
+
+    def __init__(self, path=LIVE_STATE_PATH):
+        self.path = path
+        self._mm = None
+        self._capacity = 0
+        self._seq = 0
+        self._last = {}  # feeder_id -> [bytes, messages, positions, t, rates(3), last_msg_at]
+        self.publishes = 0
+
+    def _open(self, capacity):
+        """Create a fresh file for `capacity` records and swap it in atomically."""
+        size = HEADER.size + capacity * RECORD.size
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, RECORD.size, 0, 0, 0.0, capacity)
+        os.replace(tmp, self.path)
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mm
+        self._capacity = capacity
+        self._seq = 0
+
+    def _rates(self, feeder_id, totals, now):
+        """Smoothed per-second rates and last-message time for one feeder."""
+        prev = self._last.get(feeder_id)
+        if prev is None or any(t < p for t, p in zip(totals, prev)):
+            # New feeder or a connection closed (session counters went down): restart
+            state = [*totals, now, 0.0, 0.0, 0.0, now if totals[1] else 0.0]
+            self._last[feeder_id] = state
+            return state[4:7], state[7]
+        dt = now - prev[3]
+        if dt > 0:
+            alpha = 1.0 - math.exp(-dt / _RATE_TAU)
+            for i in range(3):
+                rate = (totals[i] - prev[i]) / dt
+                prev[4 + i] += alpha * (rate - prev[4 + i])
+            if totals[1] > prev[1]:
+                prev[7] = now
+            prev[0], prev[1], prev[2], prev[3] = totals[0], totals[1], totals[2], now
+        return prev[4:7], prev[7]
+
+    def publish(self, feeders, connections, now=None):
+        """Write the table. feeders: {feeder_id: conn_type} for every known feeder;
+        connections: open conn_info dicts (those without a feeder_id are skipped)."""
+        if now is None:
+            now = time.time()
+        live = {}
+        for c in connections:
+            fid = c.get("feeder_id")
+            if fid is None:
+                continue
+            agg = live.get(fid)
+            if agg is None:
+                agg = live[fid] = [0, 0, 0, 0, 0.0, c["connected_at"], c.get("conn_type")]
+            agg[0] += 1
+            agg[1] += c["bytes"]
+            agg[2] += c["messages"]
+            agg[3] += c["positions"]
+            agg[4] = max(agg[4], c["last_data"])
+            agg[5] = min(agg[5], c["connected_at"])
+
+        ids = sorted(set(feeders) | set(live))
+        for fid in list(self._last):
+            if fid not in live:
+                del self._last[fid]
+        if self._mm is None or len(ids) > self._capacity:
+            self._open(max(64, len(ids) * 2))
+
+        mm = self._mm
+        seq = self._seq + 1  # odd: write in progress
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, RECORD.size, seq, len(ids), now, self._capacity)
+        offset = HEADER.size
+        for fid in ids:
+            agg = live.get(fid)
+            if agg is None:
+                RECORD.pack_into(mm, offset, fid, 0, 0, 0, _ct(feeders.get(fid)),
+                                 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+            else:
+                (b_rate, m_rate, p_rate), last_msg_at = self._rates(fid, agg[1:4], now)
+                active = last_msg_at and now - last_msg_at <= LIVE_STALE_SECONDS
+                RECORD.pack_into(mm, offset, fid, STATUS_CODES["active" if active else "stale"], 0,
+                                 min(agg[0], 0xFFFF), _ct(agg[6] or feeders.get(fid)),
+                                 agg[1], agg[2], agg[3], b_rate, m_rate, p_rate, agg[4], agg[5])
+            offset += RECORD.size
+        self._seq = seq + 1  # even: consistent
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, RECORD.size, self._seq, len(ids), now, self._capacity)
+        self.publishes += 1
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def _ct(conn_type):
+    return (conn_type or "").encode()[:16]
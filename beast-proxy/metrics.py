@@ -0,0 +1,133 @@
+"""Metrics — Prometheus text exposition for beast-proxy internals.
+
+A tiny asyncio HTTP handler serves GET /metrics, plus any extra read-only
+routes the proxy registers (/series/<feeder_id>). Nothing is stored for the
+scrape: the collector passed to serve() builds the page from in-memory state
+(active connections, output clients, writer/pool counters) on each request,
+so a scrape never touches the DB. Histograms are cumulative and cheap enough
+to observe on the hot path (one bisect + two adds).
+"""
+
+import asyncio
+import bisect
+import urllib.parse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Fixed-bucket cumulative histogram (Prometheus semantics)."""
+
+    __slots__ = ("name", "help", "bounds", "counts", "sum", "count")
+
+    def __init__(self, name, help_text, bounds):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            out.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        out.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        out.append(f"{self.name}_sum {self.sum:.6f}")
+        out.append(f"{self.name}_count {self.count}")
+
+
+# Per-chunk Beast decode time in the inbound path (seconds)
+SCAN_SECONDS = Histogram(
+    "beast_proxy_chunk_scan_seconds", "Time to decode one inbound chunk.",
+    (1e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3),
+)
+# Event-loop scheduling delay measured by loop_lag_monitor (seconds)
+LOOP_LAG_SECONDS = Histogram(
+    "beast_proxy_loop_lag_seconds", "Event-loop wakeup delay of a fixed-interval sleeper.",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+# DB writer batch apply time (seconds; observed from the writer thread)
+DB_FLUSH_SECONDS = Histogram(
+    "beast_proxy_db_flush_seconds", "Time to apply one DB writer batch.",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+HISTOGRAMS = (SCAN_SECONDS, LOOP_LAG_SECONDS, DB_FLUSH_SECONDS)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Page:
+    """Builder for one exposition page; metric families are declared once."""
+
+    def __init__(self):
+        self.lines = []
+        self._declared = set()
+
+    def add(self, name, kind, help_text, value, labels=None):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+        self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def render(self):
+        for hist in HISTOGRAMS:
+            hist.render(self.lines)
+        return "\n".join(self.lines) + "\n"
+
+
+async def _handle(reader, writer, collect, routes):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain headers; the body of a GET is ignored
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request.decode("latin-1").split()
+        path, _, query = parts[1].partition("?") if len(parts) > 1 else ("", "", "")
+        route = None
+        if len(parts) > 1 and parts[0] == "GET":
+            route = next((h for prefix, h in (routes or {}).items() if path.startswith(prefix)), None)
+        if len(parts) > 1 and parts[0] == "GET" and path == "/metrics":
+            status, ctype, body = "200 OK", CONTENT_TYPE, collect().encode()
+        elif route is not None:
+            status, ctype, body = route(path, urllib.parse.parse_qs(query))
+        else:
+            status, ctype, body = "404 Not Found", "text/plain", b"not found\n"
+        head = f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+        writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionResetError, BrokenPipeError):
+        pass
+    except Exception as e:
+        print(f"[metrics] Request error: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(host, port, collect, routes=None):
+    """Start the /metrics listener; collect() returns the exposition text.
+
+    routes maps extra GET path prefixes to handler(path, query) returning
+    (status line, content type, body bytes); handlers must not block.
+    """
+    return await asyncio.start_server(lambda r, w: _handle(r, w, collect, routes), host, port)
@@ -0,0 +1,194 @@
+"""MLAT state — incremental ingestion of mlat-server's clients.json.
+
+mlat-server rewrites clients.json (one entry per connected MLAT client, with
+its source IP, name and coordinates) every few seconds. The stats flusher used
+to re-read and parse the whole file every cycle and queue an MLAT update for
+every open connection, even when nothing had changed.
+
+MlatIngester instead:
+
+  * stats the file each cycle and re-parses it only when its mtime, size or
+    inode changed, keeping the last good snapshot otherwise (a file caught
+    mid-rewrite fails to parse and is retried next cycle);
+  * indexes the clients by source IP (a list — several clients can share one
+    NAT address) and by normalized name;
+  * remembers what it last wrote for every feeder and returns rows only for
+    feeders whose state changed, so the caller writes them in one batch.
+
+Attribution of a client to a connected feeder:
+
+  1. a client whose name matches the feeder's name (or the client this feeder
+     was attributed to before) on one of the feeder's IPs, unless another
+     feeder matches the same client;
+  2. otherwise the only client left on the feeder's IPs, provided every other
+     connected feeder sharing those IPs was matched by name in step 1;
+  3. otherwise, if the IPs have clients but it is ambiguous which belongs to
+     this feeder, nothing is written for it this cycle.
+
+A feeder with no client on any of its IPs is written as MLAT disabled.
+"""
+
+import collections
+import json
+import os
+import re
+
+import db
+
+_AMBIGUOUS = object()
+
+
+def normalize_name(name):
+    """Comparable form of a feeder / MLAT client name (same rules as tunnel_feeder_id)."""
+    s = db.clean_mlat_display_name(name).lower().replace(" ", "-")
+    s = re.sub(r"[^a-z0-9\-_]", "-", s)
+    return re.sub(r"-+", "-", s).strip("-")
+
+
+class MlatIngester:
+    def __init__(self, path):
+        self.path = path
+        self._signature = None  # (mtime_ns, size, inode) of the parsed file
+        self.clients = {}       # client key -> {name, lat, lon, alt, message_rate, peer_count, ip}
+        self.by_ip = {}         # source_ip -> [client, ...]
+        self.by_name = {}       # normalized name -> [client, ...]
+        self._written = {}      # feeder_id -> (enabled, lat, lon, alt, name) last written
+        self._attributed = {}   # feeder_id -> normalized client name last attributed
+        self._connected = set() # feeder ids seen connected in the previous cycle
+        self.stats = {"polls": 0, "parses": 0, "parse_errors": 0, "rows": 0, "ambiguous": 0}
+
+    def poll(self):
+        """Re-read clients.json if it changed on disk. Returns True when the snapshot changed."""
+        self.stats["polls"] += 1
+        try:
+            st = os.stat(self.path)
+        except (FileNotFoundError, PermissionError):
+            if self._signature is None and not self.clients:
+                return False
+            self._signature = None
+            self._set_snapshot({})
+            return True
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if signature == self._signature:
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(f.read())
+            if not isinstance(data, dict):
+                raise ValueError("expected an object")
+        except (FileNotFoundError, PermissionError):
+            return False
+        except Exception as e:
+            # Usually a rewrite in progress; keep the previous snapshot and retry next cycle
+            self.stats["parse_errors"] += 1
+            print(f"[proxy] MLAT clients.json error: {e}")
+            return False
+        self._signature = signature
+        self.stats["parses"] += 1
+        self._set_snapshot(data)
+        return True
+
+    def _set_snapshot(self, data):
+        clients = {}
+        by_ip = {}
+        by_name = {}
+        for user, info in data.items():
+            if not isinstance(info, dict):
+                continue
+            ip = info.get("source_ip")
+            if not ip:
+                continue
+            client = {
+                "name": info.get("user", user),
+                "lat": info.get("lat"),
+                "lon": info.get("lon"),
+                "alt": info.get("alt"),
+                "message_rate": info.get("message_rate", 0),
+                "peer_count": info.get("peer_count", 0),
+                "ip": ip,
+            }
+            client["key"] = normalize_name(client["name"])
+            clients[user] = client
+            by_ip.setdefault(ip, []).append(client)
+            if client["key"]:
+                by_name.setdefault(client["key"], []).append(client)
+        self.clients = clients
+        self.by_ip = by_ip
+        self.by_name = by_name
+
+    def attribute(self, feeders):
+        """Map connected feeders to MLAT clients.
+
+        feeders: {feeder_id: (set of source IPs, feeder name or None)}.
+        Returns {feeder_id: client dict, None (not in MLAT) or _AMBIGUOUS}.
+        """
+        sharing = {}
+        for fid, (ips, _) in feeders.items():
+            for ip in ips:
+                sharing.setdefault(ip, set()).add(fid)
+
+        candidates = {fid: [c for ip in ips for c in self.by_ip.get(ip, ())]
+                      for fid, (ips, _) in feeders.items()}
+        result = {fid: None for fid, cands in candidates.items() if not cands}
+
+        # Pass 1: name matches (current feeder name, then the previous attribution). A client
+        # proposed by more than one feeder goes to none of them.
+        proposals = {}
+        for fid, (_, name) in feeders.items():
+            if fid in result:
+                continue
+            for key in (normalize_name(name) if name else None, self._attributed.get(fid)):
+                if not key:
+                    continue
+                named = [c for c in candidates[fid] if c["key"] == key]
+                if len(named) == 1:
+                    proposals[fid] = named[0]
+                    break
+        proposed = collections.Counter(id(c) for c in proposals.values())
+        claimed = set()
+        for fid, client in proposals.items():
+            if proposed[id(client)] == 1:
+                result[fid] = client
+                claimed.add(id(client))
+
+        # Pass 2: the single unclaimed client on IPs no other unmatched feeder uses. The
+        # unmatched set is fixed before anything is assigned, so feeder order does not matter.
+        unmatched = {fid for fid in feeders if fid not in result}
+        assigned = {}
+        for fid in unmatched:
+            ips = feeders[fid][0]
+            rivals = {o for ip in ips for o in sharing[ip] if o != fid and o in unmatched}
+            remaining = [c for c in candidates[fid] if id(c) not in claimed]
+            if len(remaining) == 1 and not rivals:
+                assigned[fid] = remaining[0]
+            else:
+                result[fid] = _AMBIGUOUS
+        result.update(assigned)
+        return result
+
+    def changes(self, feeders):
+        """Rows (feeder_id, enabled, lat, lon, alt, name) for db.update_feeder_mlat_many().
+
+        Only feeders whose MLAT state differs from what was last written are
+        returned, plus feeders that just (re)connected, whose row may have been
+        overwritten by the connect path in the meantime.
+        """
+        rows = []
+        for fid, client in self.attribute(feeders).items():
+            if client is _AMBIGUOUS:
+                self.stats["ambiguous"] += 1
+                continue
+            if client is None:
+                state = (False, None, None, None, None)
+            else:
+                state = (True, client["lat"], client["lon"], client["alt"], client["name"])
+                self._attributed[fid] = client["key"]
+            if self._written.get(fid) != state or fid not in self._connected:
+                self._written[fid] = state
+                rows.append((fid, *state))
+        self._connected = set(feeders)
+        # Forget disconnected feeders; they are rewritten on their next connect anyway
+        for fid in [f for f in self._written if f not in self._connected]:
+            del self._written[fid]
+        self.stats["rows"] += len(rows)
+        return rows
@@ -5,16 +5,35 @@ classifies connections as Tailscale/NetBird/public, and forwards data to readsb.
 """
 
 import asyncio
+import calendar
+import collections
+import concurrent.futures
+import grp
 import json
 import os
 import re
 import signal
+import socket
+import struct
 import sys
+import threading
 import time
+import urllib.parse
 
+import beast_fanout
 import db
+import db_writer
+import feeder_index
 import geoip_helper
+import live_state
+import metrics
+import mlat_state
+import rate_limit
+import splice_relay
+import timeseries
+import upstream_pool
 import vpn_resolver
+from beast_frames import BEAST_ESCAPE, BeastDecoder
 
 LISTEN_HOST        = "0.0.0.0"
 LISTEN_PORT        = int(os.environ.get("LISTEN_PORT",        "30004"))
@@ -24,16 +43,76 @@ READSB_PORT        = int(os.environ.get("READSB_PORT", "30006"))
 STATS_INTERVAL            = int(os.environ.get("STATS_INTERVAL", "30"))
 INACTIVE_FEEDER_TIMEOUT   = int(os.environ.get("INACTIVE_FEEDER_TIMEOUT", "120"))  # seconds without data → treat as offline
 MLAT_CLIENTS_PATH         = os.environ.get("MLAT_CLIENTS_PATH", "/mlat-work/clients.json")
+ENRICH_WORKERS            = int(os.environ.get("ENRICH_WORKERS", "4"))
+# Connections enriched concurrently (classify + upsert); the rest wait their turn.
+# Leaves an executor worker free for stats, output keys and drop signals.
+ENRICH_CONCURRENCY        = int(os.environ.get("ENRICH_CONCURRENCY", str(max(1, ENRICH_WORKERS - 1))))
+# Reconnect storm: STORM_THRESHOLD accepts within STORM_WINDOW seconds defers activity-log writes
+STORM_THRESHOLD           = int(os.environ.get("STORM_THRESHOLD", "50"))
+STORM_WINDOW              = float(os.environ.get("STORM_WINDOW", "10"))
+LOOP_LAG_INTERVAL         = float(os.environ.get("LOOP_LAG_INTERVAL", "0.25"))  # seconds between lag probes
+# Inbound relay: "stream" (asyncio read/write) or "splice" (Linux os.splice; opt-in, ~1.1x less CPU)
+RELAY_MODE                = os.environ.get("RELAY_MODE", "stream").strip().lower()
+# readsb upstream: "per-feeder" (one socket each) or "pooled" (frame-interleaved shared sockets)
+READSB_UPSTREAM_MODE      = os.environ.get("READSB_UPSTREAM_MODE", "per-feeder").strip().lower()
+READSB_UPSTREAM_POOL      = int(os.environ.get("READSB_UPSTREAM_POOL", "2"))
+READSB_UPSTREAM_RECEIVER_ID = os.environ.get("READSB_UPSTREAM_RECEIVER_ID", "false").lower() == "true"
+# Beast output fan-out: shared ring size and what to do with clients that fall a ring behind
+OUTPUT_RING_BYTES         = int(os.environ.get("OUTPUT_RING_BYTES", str(4 * 1024 * 1024)))
+OUTPUT_LAG_POLICY         = os.environ.get("OUTPUT_LAG_POLICY", "resync").strip().lower()
+# Seconds of recent frames replayed to a new output client (bounded by the ring; 0 = live only)
+OUTPUT_REPLAY_SECONDS     = float(os.environ.get("OUTPUT_REPLAY_SECONDS", "0"))
+# Prometheus /metrics listener (0 = disabled)
+METRICS_PORT              = int(os.environ.get("METRICS_PORT", "9105"))
+# UNIX datagram socket the dashboard pokes on output key regen ("drop <output_id>")
+# and after editing/merging/deleting feeders ("feeders-changed")
+CONTROL_SOCKET_PATH       = os.environ.get("BEAST_PROXY_CONTROL_SOCKET", "/data/beast-proxy.sock")
+# Group (name or gid) allowed to send on it; the socket is mode 0660 (owner only when unset)
+CONTROL_SOCKET_GROUP      = os.environ.get("BEAST_PROXY_CONTROL_GROUP", "").strip()
 
 # Active connections: key = writer id, value = connection info
 active_connections = {}
 total_connections = 0
 start_time = time.time()
 
-# Beast protocol: 0x1a followed by type byte
-BEAST_ESCAPE = 0x1A
-BEAST_TYPES = {0x31, 0x32, 0x33, 0x34, 0x35}
-BEAST_LONG = {0x33, 0x35}  # Mode-S long messages (contain ADS-B/DF17)
+# Blocking I/O for connection admission and periodic reads (NetBird/Tailscale
+# API, GeoIP, SQLite, files, tar1090) — keeps the event loop free for forwarding
+_enrich_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=ENRICH_WORKERS, thread_name_prefix="enrich"
+)
+
+_use_pool = READSB_UPSTREAM_MODE == "pooled"
+# Splice writes straight into a per-feeder readsb socket, so it cannot share one
+_use_splice = RELAY_MODE == "splice" and splice_relay.SPLICE_AVAILABLE and not _use_pool
+_upstream_pool = None
+
+# Serialises feeder upserts so concurrent admissions from one IP/identity
+# cannot race into duplicate rows
+_register_lock = threading.Lock()
+
+# Event-loop lag: max scheduling delay seen since the last status line
+_loop_lag = {"last_ms": 0.0, "max_ms": 0.0}
+
+# Admission: bounded enrichment, reconnect-storm detection and startup recovery timing
+_enrich_slots = asyncio.Semaphore(max(1, ENRICH_CONCURRENCY))
+_admission = {
+    "accepts": collections.deque(),  # accept times within STORM_WINDOW
+    "storm": False,
+    "storm_started": 0.0,
+    "storms": 0,
+    "waiting": 0,                    # connections queued for an enrichment slot
+    "forwarding": 0,                 # connections past the metadata prefix
+    "expected": set(),               # feeders active before this start, not yet identified
+    "expected_count": 0,
+    "forwarding_s": None,            # start → expected_count connections forwarding
+    "identified_s": None,            # start → every expected feeder identified
+}
+
+# Process-lifetime counters exported on /metrics
+_counters = {
+    "readsb_connect_errors": 0,  # per-feeder readsb connections that failed to open
+    "output_upstream_reconnects": 0,  # readsb beast-out reconnects of the output ring
+}
 
 # Optional first line on Beast TCP port (before binary Beast frames):
 #   TAKNET_FEEDER_CLAIM <uuid>\n
@@ -112,12 +191,13 @@ async def read_optional_feeder_metadata_prefix(reader):
     return metadata, lead
 
 
-def _reclassify_existing_feeders():
+def _reclassify_existing_feeders(keys=None):
     """On startup, re-check all stored feeders against live VPN peer lists.
 
     Fixes feeders that were previously mis-classified (e.g. NetBird peers
     marked as tailscale because Tailscale CIDR was checked first).
     Only reclassifies when the new classification differs from the stored one.
+    With keys (ip keys from a peer list change), only those feeders are checked.
     """
     conn = db._get_conn()
     try:
@@ -126,10 +206,12 @@ def _reclassify_existing_feeders():
         ).fetchall()
     except Exception as e:
         print(f"[proxy] Reclassify: DB read failed: {e}")
-        return
+        return 0
 
-    # Force a fresh peer list load before checking anything
-    vpn_resolver.refresh_caches()
+    # Wait for the first background peer list fetch before checking anything
+    vpn_resolver.wait_ready()
+    if keys is not None:
+        rows = [r for r in rows if vpn_resolver.ip_key(r["ip_address"] or "") in keys]
 
     corrected = 0
     for row in rows:
@@ -147,42 +229,107 @@ def _reclassify_existing_feeders():
             print(f"[proxy] Reclassified feeder {ip_address}: {stored_type} → {new_type}")
             corrected += 1
 
+    when = "on startup" if keys is None else "after VPN peer changes"
     if corrected:
         conn.commit()
-        print(f"[proxy] Reclassified {corrected} feeder(s) on startup")
-    else:
+        print(f"[proxy] Reclassified {corrected} feeder(s) {when}")
+    elif keys is None:
         print("[proxy] Reclassification: all feeders correctly classified")
+    return corrected
 
 
-def count_beast_frames(data):
-    """Count Beast message frames and position-capable messages in raw data."""
-    msgs = 0
-    positions = 0
-    i = 0
-    length = len(data)
-    while i < length - 1:
-        if data[i] == BEAST_ESCAPE:
-            next_byte = data[i + 1]
-            if next_byte == BEAST_ESCAPE:
-                i += 2
-                continue
-            if next_byte in BEAST_TYPES:
-                msgs += 1
-                if next_byte in BEAST_LONG:
-                    positions += 1
-                i += 2
-                continue
-        i += 1
-    return msgs, positions
+async def _reclassify_in_background(keys=None):
+    """Run reclassification off the event loop, then refresh the identity index.
+
+    Called once after the listeners are up, and by the VPN refresher with
+    the ip keys whose peers changed.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        corrected = await loop.run_in_executor(_enrich_executor, _reclassify_existing_feeders, keys)
+    except Exception as e:
+        print(f"[proxy] Reclassify failed: {e}")
+        return
+    if corrected:
+        db_writer.reload_feeder_index()
+
+
+def _warm_geoip():
+    """Preload GeoIP locations for every known public feeder IP (runs in the executor)."""
+    try:
+        rows = db._get_conn().execute(
+            "SELECT DISTINCT ip_address FROM feeders WHERE conn_type = 'public' AND ip_address IS NOT NULL"
+        ).fetchall()
+        t0 = time.monotonic()
+        warmed = geoip_helper.warmup(r["ip_address"] for r in rows)
+    except Exception as e:
+        print(f"[proxy] GeoIP warmup failed: {e}")
+        return
+    if warmed:
+        print(f"[proxy] GeoIP cache warmed with {warmed} feeder IP(s) in {time.monotonic() - t0:.2f}s")
+
+
+def _on_vpn_peers_changed(keys):
+    asyncio.create_task(_reclassify_in_background(keys))
+
+
+def account_inbound(conn_info, data):
+    """Count one inbound chunk: bytes, last_data and decoded Beast frames.
+
+    Returns the rate-limit wait in seconds before the next read (0 if none).
+    """
+    conn_info["bytes"] += len(data)
+    conn_info["last_data"] = time.time()
+    t0 = time.perf_counter()
+    msgs, positions = conn_info["decoder"].feed(data)
+    metrics.SCAN_SECONDS.observe(time.perf_counter() - t0)
+    conn_info["messages"] += msgs
+    conn_info["positions"] += positions
+    limiter = conn_info["limiter"]
+    if limiter is None:
+        return 0.0
+    wait = limiter.charge(len(data), msgs)
+    if rate_limit.DROP_MODE:
+        return 0.0  # over-limit chunks are discarded by over_limit() instead
+    if wait > 0:
+        conn_info["throttled"] += 1
+        conn_info["throttle_wait"] += wait
+    return wait
+
+
+def over_limit(conn_info):
+    """True if this chunk should be discarded (RATE_LIMIT_MODE=drop and a bucket is in debt)."""
+    limiter = conn_info["limiter"]
+    return limiter is not None and rate_limit.DROP_MODE and limiter.blocked()
+
+
+def drop_inbound(conn_info, data):
+    """Count a discarded over-limit chunk. Still decoded so frame sync is kept.
+
+    The caller discards only the frames completed by this chunk and keeps the
+    decoder's tail (the start of the next frame), so readsb never sees a torn frame.
+    """
+    conn_info["dropped_bytes"] += len(data)
+    conn_info["last_data"] = time.time()
+    conn_info["dropped_frames"] += conn_info["decoder"].feed(data)[0]
 
 
 async def forward_stream(reader, writer, conn_info, direction, lead_in=b""):
     """Forward data between two streams, tracking bytes and Beast messages.
 
+    Inbound chunks are counted in place by the connection's BeastDecoder;
+    "positions" are DF17/18 airborne-position squitters (TC 9–18).
+    With RATE_LIMIT_MODE=drop, inbound is forwarded and dropped in whole
+    frames: the decoder's incomplete trailing frame is held back until the
+    next read completes it, as UpstreamChannel.send/skip do on the pooled path.
     lead_in: bytes to send first on inbound (e.g. first Beast byte when no claim line).
     """
+    inbound = direction == "inbound"
+    framed = inbound and conn_info["limiter"] is not None and rate_limit.DROP_MODE
+    decoder = conn_info["decoder"] if inbound else None
+    hold = b""
     try:
-        pending = lead_in if direction == "inbound" else b""
+        pending = lead_in if inbound else b""
         while True:
             data = await reader.read(8192)
             if pending:
@@ -190,117 +337,394 @@ async def forward_stream(reader, writer, conn_info, direction, lead_in=b""):
                 pending = b""
             if not data:
                 break
-            writer.write(data)
-            await writer.drain()
-            if direction == "inbound":
-                conn_info["bytes"] += len(data)
-                conn_info["last_data"] = time.time()
-                msgs, positions = count_beast_frames(data)
-                conn_info["messages"] += msgs
-                conn_info["positions"] += positions
+            if framed and over_limit(conn_info):
+                drop_inbound(conn_info, data)
+                hold = (hold + data)[len(hold) + len(data) - decoder.tail_len:]
+                continue
+            wait = account_inbound(conn_info, data) if inbound else 0.0
+            if framed:
+                data = hold + data
+                cut = len(data) - decoder.tail_len
+                hold = data[cut:]
+                data = data[:cut]
+            if data:
+                writer.write(data)
+                await writer.drain()
+            if wait:
+                await asyncio.sleep(wait)
     except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError):
         pass
     except Exception as e:
         print(f"[proxy] Forward error ({direction}): {e}")
 
 
-async def handle_client(reader, writer):
-    """Handle a single feeder connection."""
-    global total_connections
-    total_connections += 1
+async def splice_inbound(reader, writer, readsb_writer, conn_info, lead_in=b""):
+    """Inbound forwarding via splice_relay (RELAY_MODE=splice); same accounting as forward_stream.
 
-    peername = writer.get_extra_info("peername")
-    if not peername:
-        writer.close()
-        return
+    Spliced bytes are never seen by Python, so over-limit traffic is always
+    back-pressured here (RATE_LIMIT_MODE=drop does not apply).
+    """
+    relay = splice_relay.SpliceRelay(
+        reader, writer, readsb_writer, lambda data: account_inbound(conn_info, data)
+    )
+    conn_info["relay"] = relay
+    try:
+        await relay.run(lead_in)
+    except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        print(f"[proxy] Forward error (inbound splice): {e}")
+    finally:
+        conn_info["relay"] = None
 
-    ip_address = peername[0]
-    print(f"[proxy] New connection from {ip_address}")
 
-    conn_type = vpn_resolver.classify_connection(ip_address)
-    hostname = None
-    location = None
-    lat = None
-    lon = None
+def _pool_source_key(conn_info, feeder_uuid):
+    """Receiver identity on the pooled upstream: feeder UUID, else the resolved feeder id, else the IP."""
+    if feeder_uuid:
+        return f"uuid:{feeder_uuid}"
+    if conn_info["feeder_id"] is not None:
+        return f"feeder:{conn_info['feeder_id']}"
+    return f"ip:{conn_info['ip']}"
+
 
+async def forward_pooled(reader, conn_info, feeder_uuid=None, lead_in=b""):
+    """Inbound forwarding onto the shared readsb upstream pool (READSB_UPSTREAM_MODE=pooled).
+
+    Only complete Beast frames are written, so feeders interleave on frame
+    boundaries; readsb sends nothing back on this path. The receiver ID is
+    keyed on the feeder's identity, so it is the same across reconnects.
+    """
+    channel = _upstream_pool.channel(_pool_source_key(conn_info, feeder_uuid))
+    # Without a UUID, switch from the IP to the feeder id once enrichment resolves it
+    by_ip = not feeder_uuid and conn_info["feeder_id"] is None
+    decoder = conn_info["decoder"]
+    try:
+        pending = lead_in
+        while True:
+            data = await reader.read(8192)
+            if by_ip and conn_info["feeder_id"] is not None:
+                channel.rekey(_pool_source_key(conn_info, None))
+                by_ip = False
+            if pending:
+                data = pending + (data or b"")
+                pending = b""
+            if not data:
+                break
+            if over_limit(conn_info):
+                drop_inbound(conn_info, data)
+                channel.skip(data, decoder.tail_len)
+                continue
+            wait = account_inbound(conn_info, data)
+            await channel.send(data, decoder.tail_len)
+            if wait:
+                await asyncio.sleep(wait)
+    except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        print(f"[proxy] Forward error (inbound pooled): {e}")
+    finally:
+        channel.close()
+
+
+def close_feeder_connection(conn_info):
+    """Close a feeder connection, including any splice relay holding a dup of its socket."""
+    relay = conn_info.get("relay")
+    if relay is not None:
+        relay.close()
+    w = conn_info.get("writer")
+    if w and not w.is_closing():
+        w.close()
+
+
+def _classify_feeder(ip_address):
+    """Classify and locate a feeder IP (blocking; runs in the enrichment executor).
+
+    Returns dict with conn_type, hostname, location, lat, lon.
+    """
+    info = {"conn_type": vpn_resolver.classify_connection(ip_address),
+            "hostname": None, "location": None, "lat": None, "lon": None}
+    conn_type = info["conn_type"]
     if conn_type in ("tailscale", "netbird"):
-        hostname = vpn_resolver.resolve_hostname(ip_address, conn_type)
-        print(f"[proxy] {ip_address} classified as {conn_type}, hostname: {hostname}")
+        info["hostname"] = vpn_resolver.resolve_hostname(ip_address, conn_type)
+        print(f"[proxy] {ip_address} classified as {conn_type}, hostname: {info['hostname']}")
+    elif conn_type == "site":
+        info["location"] = vpn_resolver.site_name(ip_address)
+        print(f"[proxy] {ip_address} classified as site {info['location']}")
     else:
         geo = geoip_helper.lookup(ip_address)
         if geo:
-            location = geo.get("location")
-            lat = geo.get("latitude")
-            lon = geo.get("longitude")
-        print(f"[proxy] {ip_address} classified as public, location: {location}")
-
-    metadata, lead = await read_optional_feeder_metadata_prefix(reader)
-    claim_key = metadata.get("claim_key")
-    device_mac = metadata.get("device_mac")
-    feeder_uuid = metadata.get("feeder_uuid")
-
-    feeder_id = db.upsert_feeder(
-        ip_address,
-        hostname,
-        conn_type,
-        location,
-        lat,
-        lon,
-        device_mac=device_mac,
-        feeder_uuid=feeder_uuid,
+            info["location"] = geo.get("location")
+            info["lat"] = geo.get("latitude")
+            info["lon"] = geo.get("longitude")
+        print(f"[proxy] {ip_address} classified as public, location: {info['location']}")
+    return info
+
+
+def _register_feeder(ip_address, info, metadata):
+    """Resolve or create the feeder row and apply any claim key (blocking). Returns feeder ID.
+
+    Known feeders resolve from feeder_index and only their changed columns are
+    queued to db_writer; new feeders go through db.upsert_feeder().
+    """
+    with _register_lock:
+        hit = feeder_index.match(
+            ip_address,
+            info["hostname"],
+            info["conn_type"],
+            info["location"],
+            info["lat"],
+            info["lon"],
+            device_mac=metadata.get("device_mac"),
+            feeder_uuid=metadata.get("feeder_uuid"),
+        )
+        if hit is not None:
+            feeder_id, changes = hit
+            db_writer.feeder_seen(feeder_id, changes, info["conn_type"])
+        else:
+            # The DB path must see reconnects still queued in the writer
+            db_writer.flush()
+            feeder_id = db.upsert_feeder(
+                ip_address,
+                info["hostname"],
+                info["conn_type"],
+                info["location"],
+                info["lat"],
+                info["lon"],
+                device_mac=metadata.get("device_mac"),
+                feeder_uuid=metadata.get("feeder_uuid"),
+            )
+            feeder_index.remember(feeder_id)
+        claim_key = metadata.get("claim_key")
+        if claim_key:
+            try:
+                db.try_apply_feeder_claim(feeder_id, claim_key)
+            except Exception as e:
+                print(f"[proxy] Feeder claim apply error: {e}")
+    return feeder_id
+
+
+def _note_accept(now):
+    """Track accept rate; enter storm mode when STORM_THRESHOLD accepts land within STORM_WINDOW."""
+    accepts = _admission["accepts"]
+    accepts.append(now)
+    while accepts and accepts[0] < now - STORM_WINDOW:
+        accepts.popleft()
+    if not _admission["storm"] and len(accepts) >= STORM_THRESHOLD:
+        _admission["storm"] = True
+        _admission["storm_started"] = now
+        _admission["storms"] += 1
+        print(f"[proxy] Reconnect storm: {len(accepts)} connects in {STORM_WINDOW:.0f}s — "
+              f"enriching {ENRICH_CONCURRENCY} at a time, deferring activity log")
+
+
+def _check_storm_end(now):
+    """Leave storm mode once the accept rate is below half the threshold and nobody is queued."""
+    if not _admission["storm"]:
+        return
+    accepts = _admission["accepts"]
+    while accepts and accepts[0] < now - STORM_WINDOW:
+        accepts.popleft()
+    if len(accepts) < STORM_THRESHOLD // 2 and _admission["waiting"] == 0:
+        _admission["storm"] = False
+        db_writer.flush_activity()
+        print(f"[proxy] Reconnect storm over after {now - _admission['storm_started']:.1f}s")
+
+
+def _note_forwarding():
+    _admission["forwarding"] += 1
+    if (_admission["forwarding_s"] is None and _admission["expected_count"]
+            and _admission["forwarding"] >= _admission["expected_count"]):
+        _admission["forwarding_s"] = time.time() - start_time
+        print(f"[proxy] Startup: {_admission['forwarding']} connections forwarding "
+              f"{_admission['forwarding_s']:.1f}s after start")
+
+
+def _note_identified(feeder_id):
+    expected = _admission["expected"]
+    if feeder_id in expected:
+        expected.discard(feeder_id)
+        if not expected and _admission["identified_s"] is None:
+            _admission["identified_s"] = time.time() - start_time
+            print(f"[proxy] Startup: all {_admission['expected_count']} previously active feeders "
+                  f"identified {_admission['identified_s']:.1f}s after start")
+
+
+async def _enrich_connection(conn_info, metadata):
+    """Resolve a connection's identity off the event loop and attach it to conn_info.
+
+    Forwarding is already running; counters accumulate until feeder_id is
+    set and are flushed on the next stats cycle. At most ENRICH_CONCURRENCY
+    connections are classified/upserted at once, so a reconnect storm queues
+    here instead of flooding the executor.
+    """
+    loop = asyncio.get_running_loop()
+    ip_address = conn_info["ip"]
+    _admission["waiting"] += 1
+    try:
+        await _enrich_slots.acquire()
+    finally:
+        _admission["waiting"] -= 1
+    try:
+        info = await loop.run_in_executor(_enrich_executor, _classify_feeder, ip_address)
+        conn_info["conn_type"] = info["conn_type"]
+        conn_info["hostname"] = info["hostname"]
+        conn_info["location"] = info["location"]
+        feeder_id = await loop.run_in_executor(_enrich_executor, _register_feeder, ip_address, info, metadata)
+    finally:
+        _enrich_slots.release()
+    conn_info["connection_id"] = db_writer.log_connection(
+        feeder_id, ip_address, defer_activity=_admission["storm"]
     )
-    if claim_key:
-        try:
-            db.try_apply_feeder_claim(feeder_id, claim_key)
-        except Exception as e:
-            print(f"[proxy] Feeder claim apply error: {e}")
-    connection_id = db.log_connection(feeder_id, ip_address)
+    conn_info["feeder_id"] = feeder_id
+    _note_identified(feeder_id)
+
 
-    conn_info = {
-        "feeder_id": feeder_id,
-        "connection_id": connection_id,
+def _close_connection_record(conn_info, enrich_task=None):
+    """Flush a finished connection's remaining counters and log the disconnect."""
+    if enrich_task is not None and not enrich_task.cancelled() and enrich_task.exception():
+        print(f"[proxy] Enrichment failed for {conn_info['ip']}: {enrich_task.exception()}")
+    feeder_id = conn_info["feeder_id"]
+    if feeder_id is None:
+        return
+    unflushed_bytes = conn_info["bytes"] - conn_info["bytes_flushed"]
+    unflushed_msgs = conn_info["messages"] - conn_info["messages_flushed"]
+    unflushed_pos = conn_info["positions"] - conn_info["positions_flushed"]
+    if unflushed_bytes > 0 or unflushed_msgs > 0:
+        db_writer.update_feeder_stats(feeder_id, unflushed_bytes, unflushed_msgs, unflushed_pos)
+    counts = _take_sample(conn_info)
+    if any(counts):
+        timeseries.record(feeder_id, counts)
+    db_writer.log_disconnection(feeder_id, conn_info["connection_id"], conn_info["bytes"],
+                                defer_activity=_admission["storm"])
+
+
+def new_conn_info(ip_address, writer):
+    """Return a fresh per-connection state dict for a feeder connection.
+
+    The limiter is attached by handle_client once the feeder is known; the
+    relay paths read every key here, so callers outside handle_client (the
+    benches) should build their state with this too.
+    """
+    now = time.time()
+    return {
+        "feeder_id": None,
+        "connection_id": None,
         "ip": ip_address,
-        "conn_type": conn_type,
-        "hostname": hostname,
-        "connected_at": time.time(),
+        "conn_type": None,
+        "hostname": None,
+        "location": None,
+        "connected_at": now,
         "bytes": 0,
         "bytes_flushed": 0,
         "messages": 0,
         "messages_flushed": 0,
         "positions": 0,
         "positions_flushed": 0,
-        "last_data": time.time(),
+        "bytes_sampled": 0,
+        "messages_sampled": 0,
+        "positions_sampled": 0,
+        "decoder": BeastDecoder(),
+        "last_data": now,
         "writer": writer,
+        "relay": None,
+        "limiter": None,
+        "throttled": 0,
+        "throttle_wait": 0.0,
+        "dropped_bytes": 0,
+        "dropped_frames": 0,
     }
+
+
+async def handle_client(reader, writer):
+    """Handle a single feeder connection.
+
+    Forwarding to readsb starts as soon as the optional metadata prefix has
+    been read; VPN classification, GeoIP and the feeder upsert run in the
+    enrichment executor (ENRICH_CONCURRENCY at a time) and are attached to
+    conn_info when they resolve.
+    """
+    global total_connections
+    total_connections += 1
+
+    peername = writer.get_extra_info("peername")
+    if not peername:
+        writer.close()
+        return
+
+    ip_address = peername[0]
+    if not rate_limit.admit_ip(ip_address):
+        print(f"[proxy] Rejected {ip_address}: over {rate_limit.MAX_CONNECTIONS_PER_IP} connections per IP")
+        writer.close()
+        return
+    print(f"[proxy] New connection from {ip_address}")
+    _note_accept(time.time())
+
+    conn_info = new_conn_info(ip_address, writer)
     active_connections[id(writer)] = conn_info
 
     readsb_reader = None
     readsb_writer = None
+    enrich_task = None
+    feeder_uuid = None
 
     try:
-        readsb_reader, readsb_writer = await asyncio.open_connection(READSB_HOST, READSB_PORT)
+        metadata, lead = await read_optional_feeder_metadata_prefix(reader)
+        if metadata.get("feeder_uuid"):
+            if not rate_limit.admit_feeder(metadata["feeder_uuid"]):
+                print(f"[proxy] Rejected {ip_address}: feeder {metadata['feeder_uuid']} over "
+                      f"{rate_limit.MAX_CONNECTIONS_PER_FEEDER} connections")
+                return
+            feeder_uuid = metadata["feeder_uuid"]
+        conn_info["limiter"] = rate_limit.limiter_for(ip_address, feeder_uuid)
+        enrich_task = asyncio.create_task(_enrich_connection(conn_info, metadata))
+
+        if _use_pool:
+            print(f"[proxy] Forwarding {ip_address} → readsb:{READSB_PORT} (pooled)")
+            _note_forwarding()
+            await forward_pooled(reader, conn_info, feeder_uuid, lead_in=lead)
+            return
+
+        try:
+            readsb_reader, readsb_writer = await asyncio.open_connection(READSB_HOST, READSB_PORT)
+        except OSError as e:
+            _counters["readsb_connect_errors"] += 1
+            print(f"[proxy] Cannot connect to readsb: {e}")
+            return
         print(f"[proxy] Forwarding {ip_address} → readsb:{READSB_PORT}")
+        _note_forwarding()
 
+        if _use_splice:
+            inbound = splice_inbound(reader, writer, readsb_writer, conn_info, lead_in=lead)
+        else:
+            inbound = forward_stream(reader, readsb_writer, conn_info, "inbound", lead_in=lead)
         await asyncio.gather(
-            forward_stream(reader, readsb_writer, conn_info, "inbound", lead_in=lead),
+            inbound,
             forward_stream(readsb_reader, writer, conn_info, "outbound"),
         )
-    except (ConnectionRefusedError, OSError) as e:
-        print(f"[proxy] Cannot connect to readsb: {e}")
+    except (ConnectionResetError, BrokenPipeError):
+        pass
+    except OSError as e:
+        print(f"[proxy] Connection error from {ip_address}: {e}")
     except asyncio.CancelledError:
         pass
     finally:
-        unflushed_bytes = conn_info["bytes"] - conn_info["bytes_flushed"]
-        unflushed_msgs = conn_info["messages"] - conn_info["messages_flushed"]
-        unflushed_pos = conn_info["positions"] - conn_info["positions_flushed"]
-        if unflushed_bytes > 0 or unflushed_msgs > 0:
-            db.update_feeder_stats(feeder_id, unflushed_bytes, unflushed_msgs, unflushed_pos)
-
-        db.log_disconnection(feeder_id, connection_id, conn_info["bytes"])
-
         active_connections.pop(id(writer), None)
-        display = hostname or location or ip_address
-        print(f"[proxy] Disconnected: {display} ({conn_type})")
+        rate_limit.release_ip(ip_address)
+        if feeder_uuid is not None:
+            rate_limit.release_feeder(feeder_uuid)
+        if conn_info["limiter"] is not None:
+            conn_info["limiter"].close()
+        if conn_info["throttled"] or conn_info["dropped_bytes"]:
+            print(f"[proxy] Rate limit for {ip_address}: throttled {conn_info['throttled']}x "
+                  f"({conn_info['throttle_wait']:.1f}s), dropped {conn_info['dropped_bytes']} bytes "
+                  f"/ {conn_info['dropped_frames']} frames")
+        if enrich_task is not None and not enrich_task.done():
+            # Identity not resolved yet — finish the record once it is
+            enrich_task.add_done_callback(lambda t: _close_connection_record(conn_info, t))
+        else:
+            _close_connection_record(conn_info, enrich_task)
+        display = conn_info["hostname"] or conn_info["location"] or ip_address
+        print(f"[proxy] Disconnected: {display} ({conn_info['conn_type'] or 'unclassified'})")
 
         if readsb_writer and not readsb_writer.is_closing():
             readsb_writer.close()
@@ -311,47 +735,178 @@ async def handle_client(reader, writer):
 TAR1090_URL = os.environ.get("TAR1090_URL", "http://tar1090:80/data/aircraft.json")
 
 
-def get_readsb_aircraft_count():
-    """Fetch aircraft count from tar1090 HTTP endpoint."""
+# Aircraft counts from tar1090, for /metrics only. The body (several MB with
+# busy traffic) is streamed and counted with bytes.count() instead of parsed:
+# readsb writes every aircraft object starting with {"hex": and a current
+# position as a top-level ,"lat": key (the nested lastPosition object starts
+# with {"lat": and so is not counted).
+_AIRCRAFT_KEY = b'{"hex":'
+_POSITION_KEY = b',"lat":'
+_aircraft = {"total": 0, "with_pos": 0, "fetched_at": 0.0, "fetch_ms": 0.0, "failures": 0}
+
+
+async def _count_aircraft(url):
+    """Stream tar1090's aircraft.json and return (aircraft, aircraft with position)."""
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    reader, writer = await asyncio.open_connection(host, port)
     try:
-        import urllib.request
-        with urllib.request.urlopen(TAR1090_URL, timeout=5) as resp:
-            data = json.loads(resp.read())
-        aircraft = data.get("aircraft", [])
-        with_pos = sum(1 for a in aircraft if "lat" in a and "lon" in a)
-        return len(aircraft), with_pos
-    except Exception:
-        return 0, 0
-
-
-def get_mlat_clients():
-    """Read mlat-server clients.json for connected feeders with coordinates.
-    Returns dict keyed by source_ip."""
+        # HTTP/1.0: no chunked encoding and no compression to undo
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n"
+                     f"Accept-Encoding: identity\r\n\r\n".encode())
+        await writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(status.decode(errors="replace").strip() or "empty response")
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        total = with_pos = 0
+        tail = b""
+        # Shorter than either key, so a key is never counted in two reads
+        keep = min(len(_AIRCRAFT_KEY), len(_POSITION_KEY)) - 1
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            data = tail + chunk
+            total += data.count(_AIRCRAFT_KEY)
+            with_pos += data.count(_POSITION_KEY)
+            tail = data[-keep:]
+        return total, with_pos
+    finally:
+        writer.close()
+
+
+async def aircraft_counter():
+    """Refresh the tar1090 aircraft counts every STATS_INTERVAL without blocking the loop."""
+    failing = False
+    while True:
+        t0 = time.perf_counter()
+        try:
+            total, with_pos = await asyncio.wait_for(_count_aircraft(TAR1090_URL), timeout=5)
+            _aircraft.update(total=total, with_pos=with_pos, fetched_at=time.time(),
+                             fetch_ms=(time.perf_counter() - t0) * 1000)
+            failing = False
+        except Exception as e:
+            if not failing:
+                print(f"[proxy] tar1090 aircraft count failed: {e!r}")
+            failing = True
+            _aircraft["failures"] += 1
+        await asyncio.sleep(STATS_INTERVAL)
+
+
+_mlat = mlat_state.MlatIngester(MLAT_CLIENTS_PATH)
+
+
+def _sync_mlat():
+    """Queue MLAT updates for connected feeders whose mlat-server state changed."""
+    feeders = {}
+    for conn_info in active_connections.values():
+        fid = conn_info["feeder_id"]
+        if fid is not None:
+            feeders.setdefault(fid, set()).add(conn_info["ip"])
+    names = feeder_index.names(feeders)
+    rows = _mlat.changes({fid: (ips, names.get(fid)) for fid, ips in feeders.items()})
+    if rows:
+        db_writer.update_feeder_mlat_many(rows)
+        for fid, enabled, _, _, _, name in rows:
+            if enabled:
+                feeder_index.set_name(fid, name)
+
+
+async def loop_lag_monitor():
+    """Measure how late the event loop wakes a fixed-interval sleeper."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag_ms = max(0.0, (loop.time() - t0 - LOOP_LAG_INTERVAL) * 1000.0)
+        metrics.LOOP_LAG_SECONDS.observe(lag_ms / 1000.0)
+        _loop_lag["last_ms"] = lag_ms
+        if lag_ms > _loop_lag["max_ms"]:
+            _loop_lag["max_ms"] = lag_ms
+
+
+async def live_state_publisher():
+    """Publish per-feeder live state to the shared mmap file every LIVE_STATE_INTERVAL."""
+    writer = live_state.LiveStateWriter()
+    print(f"[proxy] Publishing live feeder state to {writer.path} every {live_state.LIVE_STATE_INTERVAL:g}s")
     try:
-        with open(MLAT_CLIENTS_PATH, "r") as f:
-            data = json.load(f)
-        clients = {}
-        for user, info in data.items():
-            ip = info.get("source_ip")
-            if ip:
-                clients[ip] = {
-                    "name": info.get("user", user),
-                    "lat": info.get("lat"),
-                    "lon": info.get("lon"),
-                    "alt": info.get("alt"),
-                    "message_rate": info.get("message_rate", 0),
-                    "peer_count": info.get("peer_count", 0),
-                }
-        return clients
-    except (FileNotFoundError, PermissionError):
-        return {}
-    except Exception as e:
-        print(f"[proxy] MLAT clients.json error: {e}")
-        return {}
+        while True:
+            try:
+                writer.publish(feeder_index.conn_types(), list(active_connections.values()))
+            except OSError as e:
+                print(f"[proxy] Live state publish failed: {e}")
+                await asyncio.sleep(30)
+            await asyncio.sleep(live_state.LIVE_STATE_INTERVAL)
+    finally:
+        writer.close()
+
+
+def _take_sample(conn_info):
+    """(bytes, messages, positions) since the connection's previous time-series sample."""
+    counts = (conn_info["bytes"] - conn_info["bytes_sampled"],
+              conn_info["messages"] - conn_info["messages_sampled"],
+              conn_info["positions"] - conn_info["positions_sampled"])
+    conn_info["bytes_sampled"] = conn_info["bytes"]
+    conn_info["messages_sampled"] = conn_info["messages"]
+    conn_info["positions_sampled"] = conn_info["positions"]
+    return counts
+
+
+def _save_timeseries():
+    """Drop series of feeders that no longer exist, then persist (runs in the executor)."""
+    timeseries.prune(feeder_index.conn_types())
+    try:
+        timeseries.save()
+    except (OSError, struct.error) as e:
+        print(f"[timeseries] Save failed: {e}")
+
+
+async def timeseries_sampler():
+    """Record every feeder's traffic into its time-series rings once per sample step."""
+    loop = asyncio.get_running_loop()
+    step = timeseries.SAMPLE_INTERVAL
+    next_save = time.monotonic() + timeseries.TIMESERIES_SAVE_INTERVAL
+    while True:
+        # Sample just after each step boundary so a sample lands in its own slot
+        await asyncio.sleep(step - time.time() % step + 0.05)
+        now = time.time()
+        per_feeder = {}
+        for conn_info in list(active_connections.values()):
+            feeder_id = conn_info["feeder_id"]
+            if feeder_id is None:
+                continue  # still enriching; counted once identified
+            counts = _take_sample(conn_info)
+            prev = per_feeder.get(feeder_id)
+            per_feeder[feeder_id] = counts if prev is None else tuple(map(sum, zip(prev, counts)))
+        for feeder_id, counts in per_feeder.items():
+            # Slot of the step that just ended
+            timeseries.record(feeder_id, counts, now - 0.1)
+        if time.monotonic() >= next_save:
+            next_save = time.monotonic() + timeseries.TIMESERIES_SAVE_INTERVAL
+            await loop.run_in_executor(_enrich_executor, _save_timeseries)
+
+
+def _series_route(path, query):
+    """GET /series/<feeder_id>?resolution=10s|1m|10m — one feeder's throughput history."""
+    try:
+        feeder_id = int(path.rsplit("/", 1)[1])
+    except ValueError:
+        return "400 Bad Request", "text/plain", b"bad feeder id\n"
+    result = timeseries.query(feeder_id, query.get("resolution", ["10s"])[0])
+    if result is None:
+        return "400 Bad Request", "text/plain", b"unknown resolution\n"
+    return "200 OK", "application/json", json.dumps(result, separators=(",", ":")).encode()
 
 
 async def stats_flusher():
     """Periodically flush stats for all active connections."""
+    loop = asyncio.get_running_loop()
     cycles = 0
     while True:
         await asyncio.sleep(STATS_INTERVAL)
@@ -359,83 +914,88 @@ async def stats_flusher():
 
         # Close connections that haven't sent data in INACTIVE_FEEDER_TIMEOUT (e.g. physically offline)
         now = time.time()
+        _check_storm_end(now)
         for conn_info in list(active_connections.values()):
             if (now - conn_info["last_data"]) > INACTIVE_FEEDER_TIMEOUT:
                 w = conn_info.get("writer")
                 if w and not w.is_closing():
                     display = conn_info.get("hostname") or conn_info.get("ip") or "?"
                     print(f"[proxy] Feeder idle timeout ({INACTIVE_FEEDER_TIMEOUT}s): closing {display}")
-                    w.close()
+                    close_feeder_connection(conn_info)
 
-        # Read MLAT client data (includes coordinates)
-        mlat_clients = get_mlat_clients()
+        # Re-read mlat-server clients.json only if it changed on disk
+        await loop.run_in_executor(_enrich_executor, _mlat.poll)
 
         # Flush counters for all active feeders
         for conn_info in list(active_connections.values()):
             feeder_id = conn_info["feeder_id"]
-            ip = conn_info["ip"]
-
+            if feeder_id is None:
+                continue  # still enriching; counters carry over to the next cycle
             unflushed_bytes = conn_info["bytes"] - conn_info["bytes_flushed"]
             unflushed_msgs = conn_info["messages"] - conn_info["messages_flushed"]
             unflushed_pos = conn_info["positions"] - conn_info["positions_flushed"]
 
             if unflushed_bytes > 0 or unflushed_msgs > 0:
-                db.update_feeder_stats(feeder_id, unflushed_bytes, unflushed_msgs, unflushed_pos)
+                db_writer.update_feeder_stats(feeder_id, unflushed_bytes, unflushed_msgs, unflushed_pos)
                 conn_info["bytes_flushed"] = conn_info["bytes"]
                 conn_info["messages_flushed"] = conn_info["messages"]
                 conn_info["positions_flushed"] = conn_info["positions"]
             else:
-                db.touch_feeder(feeder_id)
-
-            # Update MLAT status and coordinates from mlat-server
-            mlat_info = mlat_clients.get(ip)
-            if mlat_info:
-                db.update_feeder_mlat(feeder_id, True,
-                                      mlat_info.get("lat"),
-                                      mlat_info.get("lon"),
-                                      mlat_info.get("alt"),
-                                      mlat_info.get("name"))
-            else:
-                db.update_feeder_mlat(feeder_id, False)
+                db_writer.touch_feeder(feeder_id)
 
-        # Get aircraft count from readsb
-        total_ac, with_pos = get_readsb_aircraft_count()
+        # MLAT status and coordinates: only feeders whose state changed, in one batch
+        _sync_mlat()
 
         # Mark feeders with no active connection as stale
         # (only if not seen in last 5 minutes — see mark_inactive_feeders)
-        active_feeder_ids = {c["feeder_id"] for c in active_connections.values()}
-        db.mark_inactive_feeders(active_feeder_ids)
+        active_feeder_ids = {c["feeder_id"] for c in active_connections.values()
+                             if c["feeder_id"] is not None}
+        db_writer.mark_inactive_feeders(active_feeder_ids)
 
         # Status line
         count = len(active_connections)
-        mlat_count = len(mlat_clients)
+        mlat_count = len(_mlat.clients)
+        writer_stats = db_writer.metrics()
+        lag_max_ms = _loop_lag["max_ms"]
+        _loop_lag["max_ms"] = 0.0
+        out_clients = [c for clients in _output_clients.values() for c in clients]
+        out_lag_kib = max((c.lag_bytes for c in out_clients), default=0) / 1024
         uptime = int(time.time() - start_time)
         hours, remainder = divmod(uptime, 3600)
         minutes, seconds = divmod(remainder, 60)
         print(
             f"[proxy] Status: {count} feeders ({mlat_count} mlat), "
-            f"{total_ac} aircraft ({with_pos} with pos), "
-            f"uptime {hours}h{minutes}m{seconds}s"
+            f"uptime {hours}h{minutes}m{seconds}s, "
+            f"db queue {writer_stats['queue_depth']} "
+            f"(flush {writer_stats['last_flush_ms']:.1f}ms, max {db_writer.reset_max_flush():.1f}ms), "
+            f"loop lag max {lag_max_ms:.1f}ms, "
+            f"enrich queue {_admission['waiting']}{' (storm)' if _admission['storm'] else ''}, "
+            f"{len(out_clients)} output clients (max lag {out_lag_kib:.0f} KiB)"
         )
-
-        vpn_resolver.refresh_caches()
+        limited = [c for c in active_connections.values() if c["throttled"] or c["dropped_bytes"]]
+        rejected = rate_limit.stats()
+        if limited or rejected["rejected_ip"] or rejected["rejected_feeder"]:
+            print(
+                f"[proxy] Rate limits: {len(limited)} feeder(s) limited, "
+                f"{sum(c['dropped_bytes'] for c in limited)} bytes dropped, "
+                f"rejected {rejected['rejected_ip']} by IP cap / {rejected['rejected_feeder']} by feeder cap"
+            )
 
         # Auto-purge feeders not seen in 24 hours (skip any that are currently active)
         # Also skip during startup grace period
         if cycles > 3:
-            try:
-                active_feeder_ids = {c["feeder_id"] for c in active_connections.values()}
-                purged = db.purge_old_feeders(hours=24, exclude_ids=active_feeder_ids)
-                if purged:
-                    print(f"[proxy] Auto-purged {purged} feeder(s) not seen in 24h")
-            except Exception as e:
-                print(f"[proxy] Auto-purge error: {e}")
+            active_feeder_ids = {c["feeder_id"] for c in active_connections.values()
+                                 if c["feeder_id"] is not None}
+            db_writer.purge_old_feeders(hours=24, exclude_ids=active_feeder_ids)
 
-        # Check for key-regen drop signals
+        # Key-regen drop signals that did not arrive on the control socket
+        # (proxy restarting, socket unreachable). Clients that connected after
+        # the signal already hold the new key and are left alone.
         try:
-            for oid in db.pop_drop_signals():
-                _drop_output_ids.add(oid)
-                print(f"[output] Drop signal received for output_id={oid}")
+            for oid, signaled_at in await loop.run_in_executor(_enrich_executor, db.pop_drop_signals):
+                before = _signal_epoch(signaled_at)
+                if drop_output(oid, before + 1 if before is not None else time.time()):
+                    print(f"[output] Drop signal received for output_id={oid} (db)")
         except Exception as e:
             print(f"[output] Drop signal check error: {e}")
 
@@ -445,30 +1005,89 @@ async def stats_flusher():
 # continuous beast raw stream sourced from readsb. Multiple simultaneous
 # connections are supported via asyncio tasks.
 
-# Dict of output_id -> set of asyncio.Queue (one per active connection)
+# Shared ring every output client reads from (one writer, one cursor per client)
+_output_ring = beast_fanout.BeastRing(OUTPUT_RING_BYTES)
+# Dict of output_id -> set of beast_fanout.OutputClient (one per active connection)
 _output_clients: dict = {}
-# Set of output_ids whose connections should be dropped (regen signal)
-_drop_output_ids: set = set()
+
+
+def _signal_epoch(signaled_at):
+    """SQLite CURRENT_TIMESTAMP (UTC text) → epoch seconds, or None."""
+    if not signaled_at:
+        return None
+    try:
+        return calendar.timegm(time.strptime(signaled_at[:19], "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return None
+
+
+def drop_output(output_id, before):
+    """Cancel every client of output_id that connected before `before`. Returns count."""
+    dropped = 0
+    for client in list(_output_clients.get(output_id, ())):
+        if client.connected_at < before:
+            client.drop()
+            dropped += 1
+    return dropped
+
+
+def _on_control_datagram(sock):
+    """Handle pending control datagrams (non-blocking; called by the loop reader)."""
+    while True:
+        try:
+            data = sock.recv(256)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"[output] Control socket error: {e}")
+            return
+        parts = data.decode("ascii", errors="replace").split()
+        if len(parts) == 2 and parts[0] == "drop" and parts[1].isdigit():
+            oid = int(parts[1])
+            n = drop_output(oid, time.time())
+            print(f"[output] Drop signal received for output_id={oid} (socket, {n} client(s))")
+        elif parts == ["feeders-changed"]:
+            print("[proxy] Feeders changed on dashboard — reloading identity index")
+            db_writer.reload_feeder_index()
+
+
+def _open_control_socket(loop):
+    """Bind the control socket and register it with the loop; None if unavailable."""
+    try:
+        if os.path.exists(CONTROL_SOCKET_PATH):
+            os.unlink(CONTROL_SOCKET_PATH)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(CONTROL_SOCKET_PATH)
+        if CONTROL_SOCKET_GROUP:
+            group = CONTROL_SOCKET_GROUP
+            os.chown(CONTROL_SOCKET_PATH, -1, int(group) if group.isdigit() else grp.getgrnam(group).gr_gid)
+            os.chmod(CONTROL_SOCKET_PATH, 0o660)
+        else:
+            os.chmod(CONTROL_SOCKET_PATH, 0o600)
+        sock.setblocking(False)
+    except (OSError, KeyError) as e:
+        print(f"[output] Control socket {CONTROL_SOCKET_PATH} unavailable: {e} — drop signals via DB only")
+        return None
+    loop.add_reader(sock.fileno(), _on_control_datagram, sock)
+    return sock
 
 
 async def _broadcast_beast_to_output_clients():
     """Continuously read from readsb beast-out port and broadcast to all output clients."""
+    connected_before = False
     while True:
         try:
             reader, _ = await asyncio.open_connection(READSB_HOST, READSB_PORT)
             print(f"[output] Connected to readsb beast-out at {READSB_HOST}:{READSB_PORT}")
+            if connected_before:
+                _counters["output_upstream_reconnects"] += 1
+            connected_before = True
+            _output_ring.restart()
             while True:
-                data = await reader.read(4096)
+                data = await reader.read(65536)
                 if not data:
                     break
-                for output_id, queues in list(_output_clients.items()):
-                    dead = set()
-                    for q in list(queues):
-                        try:
-                            q.put_nowait(data)
-                        except asyncio.QueueFull:
-                            dead.add(q)
-                    queues -= dead
+                _output_ring.append(data)
         except Exception as e:
             print(f"[output] readsb connection lost: {e} — retrying in 5s")
             await asyncio.sleep(5)
@@ -492,7 +1111,8 @@ async def _handle_output_client(reader, writer):
             return
 
         # Validate and consume key
-        output = db.validate_output_key(raw_key)
+        loop = asyncio.get_running_loop()
+        output = await loop.run_in_executor(_enrich_executor, db.validate_output_key, raw_key)
         if not output:
             print(f"[output] {peer[0]} invalid or already-used key — rejected")
             writer.write(b"REJECTED\n")
@@ -513,29 +1133,31 @@ async def _handle_output_client(reader, writer):
         writer.write(b"OK\n")
         await writer.drain()
 
-        q: asyncio.Queue = asyncio.Queue(maxsize=256)
-        if output_id not in _output_clients:
-            _output_clients[output_id] = set()
-        _output_clients[output_id].add(q)
+        client = beast_fanout.OutputClient(
+            _output_ring, writer, OUTPUT_LAG_POLICY, label=peer[0],
+            replay_seconds=OUTPUT_REPLAY_SECONDS,
+        )
+        if client.replayed_bytes:
+            print(f"[output] {peer[0]} replaying {client.replayed_bytes} bytes of recent frames")
+        _output_clients.setdefault(output_id, set()).add(client)
+        stream_task = client.start()
 
         try:
-            while True:
-                # Check if this output's key was regenerated (drop signal)
-                if output_id in _drop_output_ids:
-                    print(f"[output] {peer[0]} dropped — key regenerated for output {output_id}")
-                    break
-                try:
-                    data = await asyncio.wait_for(q.get(), timeout=5)
-                    writer.write(data)
-                    await writer.drain()
-                except asyncio.TimeoutError:
-                    continue  # loop back to check drop signal
+            await stream_task
+        except asyncio.CancelledError:
+            # drop_output() cancels the stream task; anything else is shutdown
+            if not client.dropped:
+                raise
+            print(f"[output] {peer[0]} dropped — key regenerated for output {output_id}")
         except (ConnectionResetError, BrokenPipeError):
             pass
         finally:
-            if output_id in _output_clients:
-                _output_clients[output_id].discard(q)
-            _drop_output_ids.discard(output_id)
+            stream_task.cancel()
+            clients = _output_clients.get(output_id)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del _output_clients[output_id]
             print(f"[output] {peer[0]} disconnected")
 
     except Exception as e:
@@ -547,6 +1169,163 @@ async def _handle_output_client(reader, writer):
             pass
 
 
+def collect_metrics():
+    """Build the /metrics page from in-memory state (no DB access)."""
+    page = metrics.Page()
+    now = time.time()
+    page.add("beast_proxy_uptime_seconds", "gauge", "Seconds since the proxy started.",
+             f"{now - start_time:.0f}")
+    page.add("beast_proxy_connections_total", "counter", "Feeder connections accepted.",
+             total_connections)
+    page.add("beast_proxy_active_connections", "gauge", "Open feeder connections.",
+             len(active_connections))
+
+    # Per-feeder counters (summed over that feeder's open connections); use rate() for B/s
+    feeders = {}
+    for c in list(active_connections.values()):
+        key = (c["feeder_id"], c["ip"], c["conn_type"] or "unclassified")
+        acc = feeders.get(key)
+        if acc is None:
+            acc = feeders[key] = [0, 0, 0, 0, 0, 0, 0.0, collections.Counter(), collections.Counter()]
+        acc[0] += 1
+        acc[1] += c["bytes"]
+        acc[2] += c["messages"]
+        acc[3] += c["positions"]
+        acc[4] += c["dropped_bytes"]
+        acc[5] += c["throttled"]
+        acc[6] = max(acc[6], now - c["last_data"])
+        # Message-type breakdown of the connection's BeastDecoder
+        hist = c["decoder"].histogram()
+        acc[7].update(hist["df"])
+        acc[8].update(hist["adsb"])
+    rows = []
+    for (feeder_id, ip, conn_type), acc in feeders.items():
+        acc[6] = f"{acc[6]:.1f}"
+        rows.append(({"feeder_id": feeder_id if feeder_id is not None else "", "ip": ip,
+                      "conn_type": conn_type}, acc))
+    # One family at a time, so each family's samples are contiguous in the exposition
+    for i, name, kind, help_text in (
+        (0, "beast_proxy_feeder_connections", "gauge", "Open connections per feeder."),
+        (1, "beast_proxy_feeder_bytes_total", "counter", "Bytes received from the feeder."),
+        (2, "beast_proxy_feeder_messages_total", "counter", "Beast frames received."),
+        (3, "beast_proxy_feeder_positions_total", "counter", "Airborne position squitters received."),
+        (4, "beast_proxy_feeder_dropped_bytes_total", "counter", "Bytes discarded by rate limits."),
+        (5, "beast_proxy_feeder_throttled_total", "counter", "Reads delayed by rate limits."),
+        (6, "beast_proxy_feeder_idle_seconds", "gauge", "Seconds since the feeder last sent data."),
+    ):
+        for labels, acc in rows:
+            page.add(name, kind, help_text, acc[i], labels)
+    for i, label, name, help_text in (
+        (7, "df", "beast_proxy_feeder_frames_by_df_total", "Mode-S frames received, by downlink format."),
+        (8, "kind", "beast_proxy_feeder_adsb_messages_total", "DF17/18 messages received, by ADS-B type code class."),
+    ):
+        for labels, acc in rows:
+            for value, n in acc[i].items():
+                page.add(name, "counter", help_text, n, {**labels, label: value})
+
+    # Beast output fan-out
+    out_clients = [c for clients in _output_clients.values() for c in clients]
+    page.add("beast_proxy_output_clients", "gauge", "Connected Beast output clients.", len(out_clients))
+    page.add("beast_proxy_output_ring_bytes_total", "counter", "Bytes appended to the output ring.",
+             _output_ring.head)
+    page.add("beast_proxy_output_upstream_reconnects_total", "counter",
+             "readsb beast-out reconnects of the output ring.", _counters["output_upstream_reconnects"])
+    out_rows = [({"output_id": output_id, "peer": client.label}, client)
+                for output_id, clients in list(_output_clients.items()) for client in clients]
+    for attr, name, kind, help_text in (
+        ("lag_bytes", "beast_proxy_output_lag_bytes", "gauge", "Bytes an output client is behind."),
+        ("bytes_sent", "beast_proxy_output_sent_bytes_total", "counter", "Bytes sent to an output client."),
+        ("overruns", "beast_proxy_output_overruns_total", "counter", "Times an output client fell a ring behind."),
+    ):
+        for labels, client in out_rows:
+            page.add(name, kind, help_text, getattr(client, attr), labels)
+
+    # readsb upstream
+    page.add("beast_proxy_readsb_connect_errors_total", "counter",
+             "Per-feeder readsb connections that failed to open.", _counters["readsb_connect_errors"])
+    if _upstream_pool is not None:
+        pool_stats = list(enumerate(_upstream_pool.stats()))
+        for key, name, kind, help_text in (
+            ("connected", "beast_proxy_upstream_connected", "gauge", "Pooled readsb connection is up."),
+            ("reconnects", "beast_proxy_upstream_reconnects_total", "counter", "Pooled readsb reconnects."),
+            ("channels", "beast_proxy_upstream_channels", "gauge", "Feeders on a pooled connection."),
+            ("backlog_bytes", "beast_proxy_upstream_backlog_bytes", "gauge", "Bytes buffered while readsb is down."),
+            ("dropped_bytes", "beast_proxy_upstream_dropped_bytes_total", "counter", "Backlog bytes dropped."),
+        ):
+            for i, st in pool_stats:
+                page.add(name, kind, help_text, int(st[key]), {"conn": i})
+
+    # DB writer and event loop
+    writer_stats = db_writer.metrics()
+    page.add("beast_proxy_db_queue_depth", "gauge", "Ops waiting for the DB writer.", writer_stats["queue_depth"])
+    page.add("beast_proxy_db_batches_total", "counter", "DB writer batches applied.", writer_stats["batches"])
+    page.add("beast_proxy_db_ops_total", "counter", "DB writer ops applied.", writer_stats["ops"])
+    page.add("beast_proxy_db_errors_total", "counter", "DB writer batches that failed.", writer_stats["errors"])
+    page.add("beast_proxy_loop_lag_last_seconds", "gauge", "Most recent event-loop lag sample.",
+             f"{_loop_lag['last_ms'] / 1000.0:.6f}")
+
+    page.add("beast_proxy_enrich_waiting", "gauge", "Connections waiting for an enrichment slot.",
+             _admission["waiting"])
+    page.add("beast_proxy_reconnect_storm", "gauge", "1 while a reconnect storm is in progress.",
+             int(_admission["storm"]))
+    page.add("beast_proxy_reconnect_storms_total", "counter", "Reconnect storms detected.", _admission["storms"])
+    page.add("beast_proxy_deferred_activity_rows", "gauge", "Activity log rows held back during a storm.",
+             writer_stats["deferred_activity"])
+    if _admission["forwarding_s"] is not None:
+        page.add("beast_proxy_startup_forwarding_seconds", "gauge",
+                 "Start until previously active feeders were all forwarding.", f"{_admission['forwarding_s']:.3f}")
+    if _admission["identified_s"] is not None:
+        page.add("beast_proxy_startup_identified_seconds", "gauge",
+                 "Start until previously active feeders were all identified.", f"{_admission['identified_s']:.3f}")
+
+    index_stats = feeder_index.stats()
+    page.add("beast_proxy_feeder_index_size", "gauge", "Feeders in the identity index.", index_stats["feeders"])
+    page.add("beast_proxy_feeder_index_lookups_total", "counter", "Feeder identity lookups.",
+             index_stats["hits"], {"result": "hit"})
+    page.add("beast_proxy_feeder_index_lookups_total", "counter", "Feeder identity lookups.",
+             index_stats["misses"], {"result": "miss"})
+
+    if geoip_helper.GEOIP_ENABLED:
+        geo = geoip_helper.stats()
+        page.add("beast_proxy_geoip_cache_size", "gauge", "Entries in the GeoIP lookup cache.", geo["size"])
+        page.add("beast_proxy_geoip_lookups_total", "counter", "GeoIP lookups by cache result.",
+                 geo["hits"], {"result": "hit"})
+        page.add("beast_proxy_geoip_lookups_total", "counter", "GeoIP lookups by cache result.",
+                 geo["negative_hits"], {"result": "negative_hit"})
+        page.add("beast_proxy_geoip_lookups_total", "counter", "GeoIP lookups by cache result.",
+                 geo["misses"], {"result": "miss"})
+        page.add("beast_proxy_geoip_cache_evictions_total", "counter", "GeoIP cache entries evicted.",
+                 geo["evictions"])
+
+    page.add("beast_proxy_aircraft", "gauge", "Aircraft in tar1090's aircraft.json.",
+             _aircraft["total"], {"position": "any"})
+    page.add("beast_proxy_aircraft", "gauge", "Aircraft in tar1090's aircraft.json.",
+             _aircraft["with_pos"], {"position": "yes"})
+    page.add("beast_proxy_aircraft_fetch_seconds", "gauge", "Duration of the last aircraft.json count.",
+             f"{_aircraft['fetch_ms'] / 1000:.3f}")
+    page.add("beast_proxy_aircraft_fetched_timestamp_seconds", "gauge",
+             "Unix time of the last successful aircraft.json count.", f"{_aircraft['fetched_at']:.0f}")
+    page.add("beast_proxy_aircraft_fetch_failures_total", "counter", "Failed aircraft.json counts.",
+             _aircraft["failures"])
+
+    mlat = _mlat.stats
+    page.add("beast_proxy_mlat_clients", "gauge", "Clients in the last parsed mlat-server clients.json.",
+             len(_mlat.clients))
+    page.add("beast_proxy_mlat_parses_total", "counter", "Times clients.json was re-parsed after a change.",
+             mlat["parses"])
+    page.add("beast_proxy_mlat_updates_total", "counter", "Feeder MLAT rows queued for the database.",
+             mlat["rows"])
+    page.add("beast_proxy_mlat_ambiguous_total", "counter", "Feeder cycles skipped as ambiguous (shared IP).",
+             mlat["ambiguous"])
+
+    limits = rate_limit.stats()
+    page.add("beast_proxy_rejected_connections_total", "counter", "Connections refused by caps.",
+             limits["rejected_ip"], {"cap": "ip"})
+    page.add("beast_proxy_rejected_connections_total", "counter", "Connections refused by caps.",
+             limits["rejected_feeder"], {"cap": "feeder"})
+    return page.render()
+
+
 async def main():
     """Start the Beast TCP proxy server."""
     print("=" * 60)
@@ -555,15 +1334,41 @@ async def main():
     print(f"  Output listener:  {LISTEN_HOST}:{OUTPUT_LISTEN_PORT}")
     print(f"  Forwarding to:    {READSB_HOST}:{READSB_PORT}")
     print(f"  Stats interval:   {STATS_INTERVAL}s")
+    print(f"  Inbound relay:    {'splice' if _use_splice else 'stream'}"
+          + (" (splice unavailable)" if RELAY_MODE == "splice" and not _use_splice else ""))
+    print("  readsb upstream:  "
+          + (f"pooled x{READSB_UPSTREAM_POOL}"
+             + (", receiver IDs" if READSB_UPSTREAM_RECEIVER_ID else "") if _use_pool else "per-feeder"))
     print(f"  Inactive timeout: {INACTIVE_FEEDER_TIMEOUT}s (no data → offline)")
+    print(f"  Rate limits:      {rate_limit.describe()}")
+    print("  Metrics:          " + (f"{LISTEN_HOST}:{METRICS_PORT}/metrics" if METRICS_PORT else "disabled"))
     print(f"  MLAT clients:     {MLAT_CLIENTS_PATH}")
     print(f"  Tailscale: {'enabled' if vpn_resolver.TAILSCALE_ENABLED else 'disabled'}")
     print(f"  NetBird:   {'enabled' if vpn_resolver.NETBIRD_ENABLED else 'disabled'}")
-    print(f"  GeoIP:     {'enabled' if geoip_helper.GEOIP_ENABLED else 'disabled'}")
+    print(f"  Sites:     {vpn_resolver.SITE_CIDRS or 'none'}")
+    print("  GeoIP:     " + (f"enabled ({geoip_helper.GEOIP_MODE}, cache {geoip_helper.GEOIP_CACHE_SIZE})"
+                               if geoip_helper.GEOIP_ENABLED else "disabled"))
     print("=" * 60)
 
+    global _upstream_pool
+
     db.init_db()
-    _reclassify_existing_feeders()
+    db_writer.start()
+    asyncio.create_task(vpn_resolver.refresher(_on_vpn_peers_changed))
+    if _use_pool:
+        _upstream_pool = upstream_pool.UpstreamPool(
+            READSB_HOST, READSB_PORT,
+            size=READSB_UPSTREAM_POOL,
+            receiver_ids=READSB_UPSTREAM_RECEIVER_ID,
+        )
+        _upstream_pool.start()
+    print(f"[proxy] Feeder identity index: {feeder_index.load()} feeder(s)")
+    print(f"[proxy] Time series: loaded {timeseries.load()} feeder(s) from {timeseries.TIMESERIES_PATH}")
+    # Feeders that were forwarding before this start; used to time recovery
+    _admission["expected"] = {
+        r["id"] for r in db._get_conn().execute("SELECT id FROM feeders WHERE status = 'active'")
+    }
+    _admission["expected_count"] = len(_admission["expected"])
 
     # Feeder input server
     feeder_server = await asyncio.start_server(handle_client, LISTEN_HOST, LISTEN_PORT)
@@ -571,13 +1376,35 @@ async def main():
     output_server = await asyncio.start_server(_handle_output_client, LISTEN_HOST, OUTPUT_LISTEN_PORT)
 
     asyncio.create_task(stats_flusher())
+    asyncio.create_task(aircraft_counter())
+    asyncio.create_task(loop_lag_monitor())
+    asyncio.create_task(timeseries_sampler())
+    if live_state.LIVE_STATE_INTERVAL > 0:
+        asyncio.create_task(live_state_publisher())
     asyncio.create_task(_broadcast_beast_to_output_clients())
+    asyncio.create_task(_reclassify_in_background())
+    loop = asyncio.get_running_loop()
+    if geoip_helper.GEOIP_ENABLED:
+        loop.run_in_executor(_enrich_executor, _warm_geoip)
+    control_sock = _open_control_socket(loop)
+    if METRICS_PORT:
+        try:
+            await metrics.serve(LISTEN_HOST, METRICS_PORT, collect_metrics,
+                                routes={"/series/": _series_route})
+        except OSError as e:
+            print(f"[metrics] Cannot listen on {METRICS_PORT}: {e} — metrics disabled")
 
     async with feeder_server, output_server:
-        await asyncio.gather(
-            feeder_server.serve_forever(),
-            output_server.serve_forever(),
-        )
+        try:
+            await asyncio.gather(
+                feeder_server.serve_forever(),
+                output_server.serve_forever(),
+            )
+        finally:
+            if control_sock is not None:
+                asyncio.get_running_loop().remove_reader(control_sock.fileno())
+                control_sock.close()
+            _save_timeseries()
 
 
 if __name__ == "__main__":
@@ -596,5 +1423,6 @@ if __name__ == "__main__":
     except asyncio.CancelledError:
         pass
     finally:
+        db_writer.stop()
         loop.close()
         print("[proxy] Shutdown complete.")
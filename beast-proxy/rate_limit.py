@@ -0,0 +1,194 @@
+"""Rate limiting — token buckets and connection caps for feeder traffic.
+
+Every feeder connection gets a ConnLimiter holding up to four token buckets:
+bytes/s and frames/s for the connection itself, and bytes/s and frames/s
+shared by every connection of the same feeder identity (feeder_uuid when the
+feeder sent one, otherwise its IP). Charging a chunk is O(1) per bucket.
+
+Buckets may go into debt: a chunk is always charged in full after it has been
+read (frames are only known once decoded), and the debt is the time the
+caller waits before reading more — TCP then back-pressures the feeder. With
+RATE_LIMIT_MODE=drop, chunks arriving while a bucket is in debt are
+discarded instead of forwarded.
+
+Concurrent connections are capped per source IP and per feeder_uuid.
+All settings are environment variables; 0 disables a limit.
+"""
+
+import collections
+import os
+import time
+
+FEEDER_RATE_BYTES          = int(os.environ.get("FEEDER_RATE_BYTES", "0"))            # per connection
+FEEDER_RATE_FRAMES         = int(os.environ.get("FEEDER_RATE_FRAMES", "0"))
+FEEDER_IDENTITY_RATE_BYTES = int(os.environ.get("FEEDER_IDENTITY_RATE_BYTES", "0"))   # per feeder_uuid / IP
+FEEDER_IDENTITY_RATE_FRAMES = int(os.environ.get("FEEDER_IDENTITY_RATE_FRAMES", "0"))
+RATE_LIMIT_BURST_SECONDS   = float(os.environ.get("RATE_LIMIT_BURST_SECONDS", "2"))
+# "backpressure" (stop reading until the bucket refills) or "drop" (discard over-limit chunks)
+RATE_LIMIT_MODE            = os.environ.get("RATE_LIMIT_MODE", "backpressure").strip().lower()
+MAX_CONNECTIONS_PER_IP     = int(os.environ.get("MAX_CONNECTIONS_PER_IP", "0"))
+MAX_CONNECTIONS_PER_FEEDER = int(os.environ.get("MAX_CONNECTIONS_PER_FEEDER", "0"))
+
+DROP_MODE = RATE_LIMIT_MODE == "drop"
+
+_ip_conns = collections.Counter()
+_feeder_conns = collections.Counter()
+# identity key -> [refcount, bytes bucket or None, frames bucket or None]
+_identity_buckets = {}
+
+_stats = {"rejected_ip": 0, "rejected_feeder": 0}
+
+
+class TokenBucket:
+    """Classic token bucket that allows debt; refilled lazily on each call."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.rate = float(rate)
+        self.burst = max(self.rate * burst_seconds, 1.0)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        self.tokens = tokens if tokens < self.burst else self.burst
+        self.stamp = now
+
+    def charge(self, n, now):
+        """Take n tokens; returns seconds until the bucket is out of debt (0 if not in debt)."""
+        self._refill(now)
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def deficit(self, now):
+        self._refill(now)
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class ConnLimiter:
+    """The buckets that apply to one connection."""
+
+    __slots__ = ("_byte_buckets", "_frame_buckets", "_identity")
+
+    def __init__(self, identity):
+        self._identity = identity
+        self._byte_buckets = []
+        self._frame_buckets = []
+        if FEEDER_RATE_BYTES > 0:
+            self._byte_buckets.append(TokenBucket(FEEDER_RATE_BYTES))
+        if FEEDER_RATE_FRAMES > 0:
+            self._frame_buckets.append(TokenBucket(FEEDER_RATE_FRAMES))
+        if FEEDER_IDENTITY_RATE_BYTES > 0 or FEEDER_IDENTITY_RATE_FRAMES > 0:
+            entry = _identity_buckets.get(identity)
+            if entry is None:
+                entry = _identity_buckets[identity] = [
+                    0,
+                    TokenBucket(FEEDER_IDENTITY_RATE_BYTES) if FEEDER_IDENTITY_RATE_BYTES > 0 else None,
+                    TokenBucket(FEEDER_IDENTITY_RATE_FRAMES) if FEEDER_IDENTITY_RATE_FRAMES > 0 else None,
+                ]
+            entry[0] += 1
+            if entry[1] is not None:
+                self._byte_buckets.append(entry[1])
+            if entry[2] is not None:
+                self._frame_buckets.append(entry[2])
+
+    def charge(self, nbytes, nframes, now=None):
+        """Charge a forwarded chunk; returns the wait (seconds) before reading more."""
+        if now is None:
+            now = time.monotonic()
+        wait = 0.0
+        for bucket in self._byte_buckets:
+            w = bucket.charge(nbytes, now)
+            if w > wait:
+                wait = w
+        if nframes:
+            for bucket in self._frame_buckets:
+                w = bucket.charge(nframes, now)
+                if w > wait:
+                    wait = w
+        return wait
+
+    def blocked(self, now=None):
+        """True while any bucket is in debt (drop mode discards chunks meanwhile)."""
+        if now is None:
+            now = time.monotonic()
+        for bucket in self._byte_buckets:
+            if bucket.deficit(now) > 0:
+                return True
+        for bucket in self._frame_buckets:
+            if bucket.deficit(now) > 0:
+                return True
+        return False
+
+    def close(self):
+        entry = _identity_buckets.get(self._identity)
+        if entry is not None:
+            entry[0] -= 1
+            if entry[0] <= 0:
+                del _identity_buckets[self._identity]
+
+
+def enabled():
+    return (FEEDER_RATE_BYTES > 0 or FEEDER_RATE_FRAMES > 0
+            or FEEDER_IDENTITY_RATE_BYTES > 0 or FEEDER_IDENTITY_RATE_FRAMES > 0)
+
+
+def limiter_for(ip_address, feeder_uuid=None):
+    """ConnLimiter for a new connection, or None when no rate limit is configured."""
+    if not enabled():
+        return None
+    return ConnLimiter(feeder_uuid or ip_address)
+
+
+# ── Connection caps ───────────────────────────────────────────────────────────
+
+def admit_ip(ip_address):
+    """Count a new connection from ip_address; False (not counted) if over the cap."""
+    if MAX_CONNECTIONS_PER_IP > 0 and _ip_conns[ip_address] >= MAX_CONNECTIONS_PER_IP:
+        _stats["rejected_ip"] += 1
+        return False
+    _ip_conns[ip_address] += 1
+    return True
+
+
+def release_ip(ip_address):
+    _ip_conns[ip_address] -= 1
+    if _ip_conns[ip_address] <= 0:
+        del _ip_conns[ip_address]
+
+
+def admit_feeder(feeder_uuid):
+    """Count a new connection for feeder_uuid; False (not counted) if over the cap."""
+    if MAX_CONNECTIONS_PER_FEEDER > 0 and _feeder_conns[feeder_uuid] >= MAX_CONNECTIONS_PER_FEEDER:
+        _stats["rejected_feeder"] += 1
+        return False
+    _feeder_conns[feeder_uuid] += 1
+    return True
+
+
+def release_feeder(feeder_uuid):
+    _feeder_conns[feeder_uuid] -= 1
+    if _feeder_conns[feeder_uuid] <= 0:
+        del _feeder_conns[feeder_uuid]
+
+
+def stats():
+    return dict(_stats)
+
+
+def describe():
+    """One-line summary of the configured limits for the startup banner."""
+    parts = []
+    if FEEDER_RATE_BYTES or FEEDER_RATE_FRAMES:
+        parts.append(f"conn {FEEDER_RATE_BYTES or '-'} B/s, {FEEDER_RATE_FRAMES or '-'} frames/s")
+    if FEEDER_IDENTITY_RATE_BYTES or FEEDER_IDENTITY_RATE_FRAMES:
+        parts.append(f"feeder {FEEDER_IDENTITY_RATE_BYTES or '-'} B/s, "
+                     f"{FEEDER_IDENTITY_RATE_FRAMES or '-'} frames/s")
+    if parts:
+        parts.append(RATE_LIMIT_MODE)
+    if MAX_CONNECTIONS_PER_IP:
+        parts.append(f"max {MAX_CONNECTIONS_PER_IP}/IP")
+    if MAX_CONNECTIONS_PER_FEEDER:
+        parts.append(f"max {MAX_CONNECTIONS_PER_FEEDER}/feeder")
+    return ", ".join(parts) if parts else "off"
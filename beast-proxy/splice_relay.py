@@ -0,0 +1,132 @@
+"""Splice relay — Linux os.splice() forwarding of a feeder socket into readsb.
+
+The feeder's bytes go socket → pipe → readsb socket with os.splice(), so the
+forwarding itself never copies the payload into Python. Accounting stays
+exact, which means it is not zero-copy: each read first peeks (MSG_PEEK) the
+bytes waiting on the socket into a Python bytes object, then splices exactly
+the number of bytes that were peeked, and only those are passed to the
+accounting callback. A positive return value from the callback is a
+rate-limit wait: the relay stops reading for that many seconds.
+
+What splice saves is the asyncio transport, the StreamReader buffer and the
+write to readsb, not the copy the accounting needs. bench/bench_relay.py
+measured about 1.1x less CPU than the stream relay with accounting on
+(~31 vs ~34 ms/MiB) and about 2.5x with accounting off, so the mode is
+opt-in (RELAY_MODE=splice) and "stream" stays the default.
+
+Both sockets are driven through dup()ed descriptors, so the asyncio
+transports (still used for the readsb → feeder direction) keep ownership of
+the originals. The feeder transport's reading is paused for the lifetime of
+the relay.
+"""
+
+import asyncio
+import os
+import socket
+
+SPLICE_AVAILABLE = hasattr(os, "splice") and hasattr(os, "pipe2")
+
+# Max bytes peeked/spliced per wakeup (default Linux pipe capacity is 64 KiB)
+SPLICE_CHUNK = 65536
+
+if SPLICE_AVAILABLE:
+    _SPLICE_FLAGS = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+
+
+def _dup_socket(transport):
+    sock = transport.get_extra_info("socket")
+    dup = socket.socket(fileno=os.dup(sock.fileno()))
+    dup.setblocking(False)
+    return dup
+
+
+async def _send_all(loop, sock, data, writable):
+    """Write bytes to a non-blocking socket, waiting on `writable` when full."""
+    view = memoryview(data)
+    while view:
+        try:
+            sent = sock.send(view)
+        except BlockingIOError:
+            await _wait(loop, sock, writable, loop.add_writer, loop.remove_writer)
+            continue
+        view = view[sent:]
+
+
+async def _wait(loop, sock, event, add, remove):
+    event.clear()
+    add(sock.fileno(), event.set)
+    try:
+        await event.wait()
+    finally:
+        remove(sock.fileno())
+
+
+class SpliceRelay:
+    """One feeder → readsb splice relay. Call run(); close() ends it early."""
+
+    def __init__(self, reader, feeder_writer, readsb_writer, on_data):
+        self._reader = reader
+        self._feeder_transport = feeder_writer.transport
+        self._readsb_transport = readsb_writer.transport
+        self._on_data = on_data
+        self._src = None
+        self._dst = None
+
+    def close(self):
+        """Shut the feeder socket down; the relay sees EOF and returns."""
+        if self._src is not None:
+            try:
+                self._src.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    async def run(self, lead_in=b""):
+        loop = asyncio.get_running_loop()
+        self._feeder_transport.pause_reading()
+        # Bytes the StreamReader buffered past the metadata prefix go first
+        buffered = bytes(self._reader._buffer)
+        self._reader._buffer.clear()
+        pipe_r, pipe_w = os.pipe2(os.O_NONBLOCK)
+        self._src = src = _dup_socket(self._feeder_transport)
+        self._dst = dst = _dup_socket(self._readsb_transport)
+        readable = asyncio.Event()
+        writable = asyncio.Event()
+        try:
+            head = lead_in + buffered
+            if head:
+                await _send_all(loop, dst, head, writable)
+                wait = self._on_data(head)
+                if wait:
+                    await asyncio.sleep(wait)
+
+            loop.add_reader(src.fileno(), readable.set)
+            try:
+                while True:
+                    try:
+                        data = src.recv(SPLICE_CHUNK, socket.MSG_PEEK)
+                    except BlockingIOError:
+                        readable.clear()
+                        await readable.wait()
+                        continue
+                    if not data:
+                        break
+                    moved = os.splice(src.fileno(), pipe_w, len(data), flags=_SPLICE_FLAGS)
+                    if moved < len(data):
+                        data = data[:moved]
+                    wait = self._on_data(data)
+                    left = moved
+                    while left:
+                        try:
+                            left -= os.splice(pipe_r, dst.fileno(), left, flags=_SPLICE_FLAGS)
+                        except BlockingIOError:
+                            await _wait(loop, dst, writable, loop.add_writer, loop.remove_writer)
+                    if wait:
+                        await asyncio.sleep(wait)
+            finally:
+                loop.remove_reader(src.fileno())
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+            src.close()
+            dst.close()
+            self._src = self._dst = None
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import db  # noqa: E402
+import db_writer  # noqa: E402
+
+
+class _CommitFails(sqlite3.Connection):
+    fail = False
+
+    def commit(self):
+        if _CommitFails.fail:
+            raise sqlite3.OperationalError("disk I/O error")
+        super().commit()
+
+
+class ApplyTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, "test.db")
+        db.DB_PATH = self._path
+        db._local.conn = None
+        db.init_db()
+        self.fid = db.upsert_feeder("10.0.0.1", "alpha", "public")
+        db._get_conn().commit()
+        db_writer._connection_ids.clear()
+        db_writer._deferred_activity.clear()
+        db_writer._retry.clear()
+
+    def tearDown(self):
+        db._local.conn.close()
+        db._local.conn = None
+        _CommitFails.fail = False
+        self._dir.cleanup()
+
+    def _feeder(self):
+        return db._get_conn().execute(
+            "SELECT bytes_received, messages_received, positions_received, status FROM feeders WHERE id = ?",
+            (self.fid,),
+        ).fetchone()
+
+    def _connections(self):
+        return db._get_conn().execute(
+            "SELECT id, disconnected_at, bytes_transferred FROM connections ORDER BY id"
+        ).fetchall()
+
+    def test_stats_are_summed_per_feeder(self):
+        db_writer._apply([
+            ("stats", self.fid, 100, 3, 1),
+            ("touch", self.fid),
+            ("stats", self.fid, 50, 2, 0),
+        ])
+        row = self._feeder()
+        self.assertEqual(tuple(row[:3]), (150, 5, 1))
+        self.assertEqual(row["status"], "active")
+
+    def test_reconnect_in_one_batch_leaves_feeder_online(self):
+        db_writer._apply([
+            ("connect", 1, self.fid, "10.0.0.1", False),
+            ("stats", self.fid, 10, 1, 0),
+            ("disconnect", 1, self.fid, 10, False),
+            ("connect", 2, self.fid, "10.0.0.1", False),
+            ("stats", self.fid, 20, 2, 0),
+        ])
+        self.assertEqual(self._feeder()["status"], "active")
+        rows = self._connections()
+        self.assertEqual(len(rows), 2)
+        self.assertIsNotNone(rows[0]["disconnected_at"])
+        self.assertIsNone(rows[1]["disconnected_at"])
+        self.assertEqual(db_writer._connection_ids, {2: rows[1]["id"]})
+
+    def test_failed_segment_is_requeued_and_ordered_ops_survive(self):
+        real = db.update_feeder_stats_many
+        with mock.patch.object(db, "update_feeder_stats_many", side_effect=sqlite3.OperationalError("locked")):
+            db_writer._apply([
+                ("stats", self.fid, 100, 3, 1),
+                ("stats", self.fid, 50, 2, 0),
+                ("connect", 1, self.fid, "10.0.0.1", False),
+            ])
+        self.assertEqual(tuple(self._feeder()[:3]), (0, 0, 0))
+        self.assertEqual(len(self._connections()), 1)
+        self.assertIn(1, db_writer._connection_ids)
+        self.assertEqual(db_writer._retry, [("retry", 1, [("stats", self.fid, 150, 5, 1)])])
+
+        self.assertIs(db.update_feeder_stats_many, real)
+        batch = db_writer._retry[:]
+        db_writer._retry.clear()
+        db_writer._apply(batch)
+        self.assertEqual(tuple(self._feeder()[:3]), (150, 5, 1))
+
+    def test_failing_segment_is_dropped_after_max_attempts(self):
+        with mock.patch.object(db, "update_feeder_stats_many", side_effect=sqlite3.OperationalError("locked")):
+            db_writer._apply([("stats", self.fid, 100, 3, 1)])
+            for attempt in range(2, db_writer.SEGMENT_ATTEMPTS):
+                batch = db_writer._retry[:]
+                db_writer._retry.clear()
+                db_writer._apply(batch + [("stats", self.fid, 1, 0, 0)])
+                self.assertEqual(db_writer._retry[0], ("retry", attempt, [("stats", self.fid, 100, 3, 1)]))
+            batch = db_writer._retry[:]
+            db_writer._retry.clear()
+            db_writer._apply(batch)
+        # The oldest segment gave up; the fresh deltas were kept apart and are still pending
+        self.assertTrue(all(op[2] == [("stats", self.fid, 1, 0, 0)] for op in db_writer._retry))
+
+        batch = db_writer._retry[:]
+        db_writer._retry.clear()
+        db_writer._apply(batch)
+        self.assertEqual(tuple(self._feeder()[:3]), (db_writer.SEGMENT_ATTEMPTS - 2, 0, 0))
+
+    def test_non_transient_segment_error_is_not_retried(self):
+        with mock.patch.object(db, "update_feeder_stats_many", side_effect=sqlite3.IntegrityError("constraint")):
+            db_writer._apply([("stats", self.fid, 100, 3, 1), ("touch", self.fid)])
+        self.assertEqual(db_writer._retry, [])
+
+    def test_failed_commit_restores_tokens_and_replays(self):
+        db_writer._apply([("connect", 1, self.fid, "10.0.0.1", False)])
+        first = db_writer._connection_ids[1]
+
+        db._local.conn.close()
+        db._local.conn = sqlite3.connect(self._path, factory=_CommitFails)
+        db._local.conn.row_factory = sqlite3.Row
+        _CommitFails.fail = True
+        db_writer._apply([
+            ("stats", self.fid, 10, 1, 0),
+            ("disconnect", 1, self.fid, 10, False),
+            ("connect", 2, self.fid, "10.0.0.1", False),
+            ("stats", self.fid, 5, 1, 0),
+        ])
+        self.assertEqual(db_writer._connection_ids, {1: first})
+        self.assertEqual(len(self._connections()), 1)
+
+        _CommitFails.fail = False
+        batch = db_writer._retry[:]
+        db_writer._retry.clear()
+        db_writer._apply(batch)
+        rows = self._connections()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["bytes_transferred"], 10)
+        self.assertIsNone(rows[1]["disconnected_at"])
+        self.assertEqual(tuple(self._feeder()[:3]), (15, 2, 0))
+        self.assertEqual(list(db_writer._connection_ids), [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import mlat_state  # noqa: E402
+
+
+def _ingester(clients):
+    ing = mlat_state.MlatIngester("/nonexistent/clients.json")
+    ing._set_snapshot(clients)
+    return ing
+
+
+class AttributeOrderTest(unittest.TestCase):
+    def _both_orders(self, clients, feeders):
+        forward = _ingester(clients).attribute(dict(feeders))
+        backward = _ingester(clients).attribute(dict(reversed(list(feeders.items()))))
+        self.assertEqual(forward, backward)
+        return forward
+
+    def test_two_unmatched_feeders_one_client(self):
+        clients = {"site-x": {"source_ip": "10.0.0.1", "user": "site-x"}}
+        feeders = {1: ({"10.0.0.1"}, "alpha"), 2: ({"10.0.0.1"}, "bravo")}
+        result = self._both_orders(clients, feeders)
+        self.assertIs(result[1], mlat_state._AMBIGUOUS)
+        self.assertIs(result[2], mlat_state._AMBIGUOUS)
+
+    def test_named_feeder_leaves_single_client_for_the_other(self):
+        clients = {
+            "alpha": {"source_ip": "10.0.0.1", "user": "alpha"},
+            "other": {"source_ip": "10.0.0.1", "user": "other"},
+        }
+        feeders = {1: ({"10.0.0.1"}, "alpha"), 2: ({"10.0.0.1"}, "bravo")}
+        result = self._both_orders(clients, feeders)
+        self.assertEqual(result[1]["name"], "alpha")
+        self.assertEqual(result[2]["name"], "other")
+
+    def test_same_name_on_shared_ip_is_ambiguous(self):
+        clients = {"alpha": {"source_ip": "10.0.0.1", "user": "alpha"}}
+        feeders = {1: ({"10.0.0.1"}, "alpha"), 2: ({"10.0.0.1"}, "alpha")}
+        result = self._both_orders(clients, feeders)
+        self.assertIs(result[1], mlat_state._AMBIGUOUS)
+        self.assertIs(result[2], mlat_state._AMBIGUOUS)
+
+    def test_feeder_without_client_is_disabled(self):
+        clients = {"alpha": {"source_ip": "10.0.0.1", "user": "alpha"}}
+        feeders = {1: ({"10.0.0.1"}, None), 2: ({"10.0.0.2"}, None)}
+        result = self._both_orders(clients, feeders)
+        self.assertEqual(result[1]["name"], "alpha")
+        self.assertIsNone(result[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
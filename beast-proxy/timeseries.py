@@ -0,0 +1,219 @@
+"""Time series — per-feeder throughput history in fixed-size rings.
+
+Every feeder that sends data gets three resolutions of bytes / messages /
+positions counts, each an array('I') ring indexed by (time // step) % slots:
+
+    10s  × 360   (1 hour)
+    1m   × 1440  (24 hours)
+    10m  × 4320  (30 days)
+
+A sample adds the counts since the previous sample to the current slot of
+every resolution; slots skipped while a feeder was silent are zeroed when
+the ring next advances. Memory is constant per feeder (about 72 KiB) and
+nothing is written to SQLite.
+
+The rings are saved to TIMESERIES_PATH every TIMESERIES_SAVE_INTERVAL seconds
+and on shutdown (write to a temp file, then rename), and loaded at startup:
+
+    header  <4sHI  magic b"TKTS", version, feeder count
+    feeder  <I     feeder id, then per resolution:
+            <q     epoch (time // step) of the newest slot
+            3 × slots × uint32 little-endian (bytes, messages, positions)
+"""
+
+import array
+import os
+import struct
+import sys
+import threading
+import time
+
+TIMESERIES_PATH          = os.environ.get("TIMESERIES_PATH", "/data/feeder-timeseries.bin")
+TIMESERIES_SAVE_INTERVAL = int(os.environ.get("TIMESERIES_SAVE_INTERVAL", "300"))
+
+# (name, step seconds, slots)
+RESOLUTIONS = (("10s", 10, 360), ("1m", 60, 1440), ("10m", 600, 4320))
+SAMPLE_INTERVAL = RESOLUTIONS[0][1]
+METRICS = ("bytes", "messages", "positions")
+
+MAGIC = b"TKTS"
+VERSION = 2
+_HEADER = struct.Struct("<4sHI")
+_ID = struct.Struct("<I")
+_EPOCH = struct.Struct("<q")
+_MAX = 0xFFFFFFFF
+
+
+class _Ring:
+    """One resolution: a ring of `slots` counts per metric plus the newest slot's epoch."""
+
+    __slots__ = ("step", "slots", "epoch", "data")
+
+    def __init__(self, step, slots):
+        self.step = step
+        self.slots = slots
+        self.epoch = None
+        self.data = [array.array("I", bytes(4 * slots)) for _ in METRICS]
+
+    def _advance(self, epoch):
+        if self.epoch is None or epoch - self.epoch >= self.slots:
+            for arr in self.data:
+                arr[:] = array.array("I", bytes(4 * self.slots))
+        elif epoch > self.epoch:
+            for e in range(self.epoch + 1, epoch + 1):
+                i = e % self.slots
+                for arr in self.data:
+                    arr[i] = 0
+        else:
+            return  # same slot (or a clock step backwards): keep adding to the newest
+        self.epoch = epoch
+
+    def add(self, now, counts):
+        self._advance(int(now // self.step))
+        i = self.epoch % self.slots
+        for arr, n in zip(self.data, counts):
+            if n:
+                arr[i] = min(arr[i] + n, _MAX)
+
+    def points(self, now):
+        """[(slot start unix time, bytes, messages, positions), ...] oldest first, up to now."""
+        end = int(now // self.step)
+        out = []
+        for e in range(end - self.slots + 1, end + 1):
+            if self.epoch is None or e > self.epoch or e <= self.epoch - self.slots:
+                out.append((e * self.step, 0, 0, 0))
+            else:
+                i = e % self.slots
+                out.append((e * self.step, *(arr[i] for arr in self.data)))
+        return out
+
+
+class FeederSeries:
+    __slots__ = ("rings",)
+
+    def __init__(self):
+        self.rings = [_Ring(step, slots) for _, step, slots in RESOLUTIONS]
+
+    def add(self, now, counts):
+        for ring in self.rings:
+            ring.add(now, counts)
+
+
+_series = {}  # feeder_id -> FeederSeries
+_lock = threading.Lock()  # guards _series and the rings (event loop vs the save executor)
+
+
+def record(feeder_id, counts, now=None):
+    """Add (bytes, messages, positions) since the last sample for one feeder."""
+    if now is None:
+        now = time.time()
+    with _lock:
+        s = _series.get(feeder_id)
+        if s is None:
+            s = _series[feeder_id] = FeederSeries()
+        s.add(now, counts)
+
+
+def prune(known_ids):
+    """Drop the series of feeders not in known_ids (deleted or merged away)."""
+    with _lock:
+        for feeder_id in [f for f in _series if f not in known_ids]:
+            del _series[feeder_id]
+
+
+def query(feeder_id, resolution="10s", now=None):
+    """JSON-ready series for one feeder, or None if the resolution is unknown."""
+    for index, (name, step, slots) in enumerate(RESOLUTIONS):
+        if name == resolution:
+            break
+    else:
+        return None
+    if now is None:
+        now = time.time()
+    with _lock:
+        s = _series.get(feeder_id)
+        points = s.rings[index].points(now) if s is not None else []
+    return {
+        "feeder_id": feeder_id,
+        "resolution": name,
+        "step": step,
+        "metrics": list(METRICS),
+        # Counts per slot; divide by step for a rate
+        "points": [list(p) for p in points],
+    }
+
+
+def _to_le(arr):
+    """Little-endian form of a private copy of a ring array (swapped in place when needed)."""
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def save(path=TIMESERIES_PATH):
+    """Write all rings to `path` atomically. Returns the number of feeders saved."""
+    # The lock is held for the list of series and then for one feeder's copy at a time,
+    # so record() and query() on the event loop never wait for more than one feeder
+    with _lock:
+        series = list(_series.items())
+    snapshot = []
+    for feeder_id, s in series:
+        with _lock:
+            snapshot.append((feeder_id, [(ring.epoch, [arr[:] for arr in ring.data]) for ring in s.rings]))
+    parts = [_HEADER.pack(MAGIC, VERSION, len(snapshot))]
+    for feeder_id, rings in snapshot:
+        parts.append(_ID.pack(feeder_id))
+        for epoch, data in rings:
+            parts.append(_EPOCH.pack(epoch if epoch is not None else -1))
+            parts.extend(_to_le(arr) for arr in data)
+    count = len(snapshot)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.writelines(parts)
+    os.replace(tmp, path)
+    return count
+
+
+def load(path=TIMESERIES_PATH):
+    """Load rings saved by save(). Returns the number of feeders loaded (0 if none/invalid)."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return 0
+    if len(raw) < _HEADER.size:
+        return 0
+    magic, version, count = _HEADER.unpack_from(raw, 0)
+    if magic != MAGIC or version != VERSION:
+        print(f"[timeseries] Ignoring {path}: unknown format")
+        return 0
+    per_feeder = _ID.size + sum(_EPOCH.size + 4 * slots * len(METRICS) for _, _, slots in RESOLUTIONS)
+    if len(raw) != _HEADER.size + count * per_feeder:
+        print(f"[timeseries] Ignoring {path}: size does not match {count} feeder(s)")
+        return 0
+    view = memoryview(raw)
+    offset = _HEADER.size
+    loaded = {}
+    for _ in range(count):
+        (feeder_id,) = _ID.unpack_from(raw, offset)
+        offset += _ID.size
+        s = FeederSeries()
+        for ring in s.rings:
+            (epoch,) = _EPOCH.unpack_from(raw, offset)
+            offset += _EPOCH.size
+            ring.epoch = epoch if epoch >= 0 else None
+            for arr in ring.data:
+                n = 4 * ring.slots
+                arr[:] = array.array("I", view[offset:offset + n].tobytes())
+                if sys.byteorder != "little":
+                    arr.byteswap()
+                offset += n
+        loaded[feeder_id] = s
+    with _lock:
+        _series.update(loaded)
+    return len(loaded)
+
+
+def stats():
+    with _lock:
+        return {"feeders": len(_series)}
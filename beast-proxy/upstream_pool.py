@@ -0,0 +1,195 @@
+"""Upstream pool — multiplex all feeder streams onto a few readsb connections.
+
+Each feeder gets a channel on one of READSB_UPSTREAM_POOL long-lived
+connections. A channel only ever writes whole Beast frames: the incomplete
+tail of each read (as reported by the feeder's BeastDecoder) is held back
+until the next read completes it, so streams from different feeders
+interleave strictly on frame boundaries.
+
+With receiver IDs enabled, a 0x1a 0xe3 receiver-ID frame is written whenever
+a connection switches from one feeder's frames to another's, so readsb can
+still attribute messages per feeder.
+
+When a readsb connection drops, writes are buffered (bounded, oldest dropped)
+and replayed after the reconnect; feeders stay connected throughout.
+"""
+
+import asyncio
+import collections
+import hashlib
+
+from beast_frames import BEAST_ESCAPE, BEAST_RECEIVER_ID
+
+# Per-connection transport buffer above which writers wait for drain()
+_HIGH_WATER = 256 * 1024
+
+
+def receiver_id_frame(key):
+    """Beast receiver-ID frame (0x1a 0xe3 + 8-byte id) derived from a string key."""
+    rid = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return bytes([BEAST_ESCAPE, BEAST_RECEIVER_ID]) + rid.replace(b"\x1a", b"\x1a\x1a")
+
+
+class _UpstreamConn:
+    """One long-lived connection to readsb with reconnect and a bounded backlog."""
+
+    def __init__(self, pool, index):
+        self._pool = pool
+        self.index = index
+        self.channels = 0
+        self._writer = None
+        self._last_source = None
+        self._backlog = collections.deque()  # (receiver_id_frame, bytes)
+        self._backlog_bytes = 0
+        self.reconnects = 0
+        self.dropped_bytes = 0
+        self.bytes_written = 0
+        self._task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        pool = self._pool
+        delay = 1
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(pool.host, pool.port)
+            except (ConnectionRefusedError, OSError) as e:
+                print(f"[upstream] #{self.index} cannot connect to readsb: {e} — retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            delay = 1
+            self._writer = writer
+            self._last_source = None
+            print(f"[upstream] #{self.index} connected to readsb:{pool.port}")
+            self._flush_backlog()
+            try:
+                # readsb does not send on its Beast input port; EOF means it went away
+                while await reader.read(4096):
+                    pass
+            except (ConnectionResetError, OSError):
+                pass
+            self._writer = None
+            self.reconnects += 1
+            print(f"[upstream] #{self.index} readsb connection lost — reconnecting")
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    def _flush_backlog(self):
+        while self._backlog and self.connected:
+            rid, chunk = self._backlog.popleft()
+            self._backlog_bytes -= len(chunk)
+            self._write_now(rid, (chunk,))
+
+    def _write_now(self, rid, pieces):
+        if rid is not None and rid != self._last_source:
+            self._writer.write(rid)
+            self._last_source = rid
+        self._writer.writelines(pieces)
+        self.bytes_written += sum(len(p) for p in pieces)
+
+    def _buffer(self, rid, pieces):
+        chunk = b"".join(pieces)
+        self._backlog.append((rid, chunk))
+        self._backlog_bytes += len(chunk)
+        limit = self._pool.backlog_limit
+        while self._backlog_bytes > limit and self._backlog:
+            _, old = self._backlog.popleft()
+            self._backlog_bytes -= len(old)
+            self.dropped_bytes += len(old)
+
+    async def write(self, rid, pieces):
+        """Write frame-aligned pieces; buffers while readsb is unreachable."""
+        if not self.connected:
+            self._buffer(rid, pieces)
+            return
+        self._write_now(rid, pieces)
+        if self._writer.transport.get_write_buffer_size() > _HIGH_WATER:
+            try:
+                await self._writer.drain()
+            except (ConnectionResetError, BrokenPipeError, OSError):
+                pass
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "channels": self.channels,
+            "reconnects": self.reconnects,
+            "bytes_written": self.bytes_written,
+            "backlog_bytes": self._backlog_bytes,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+class UpstreamChannel:
+    """A feeder's handle on a pooled upstream connection."""
+
+    def __init__(self, conn, rid):
+        self._conn = conn
+        self._rid = rid
+        self._hold = b""
+
+    async def send(self, data, tail_len):
+        """Forward `data`, holding back the last `tail_len` stream bytes (an incomplete frame)."""
+        hold = self._hold
+        k = len(hold) + len(data) - tail_len
+        if k <= len(hold):
+            pieces = [hold[:k]] if k > 0 else []
+            self._hold = hold[k:] + data
+        else:
+            cut = k - len(hold)
+            pieces = [hold, memoryview(data)[:cut]] if hold else [memoryview(data)[:cut]]
+            self._hold = data[cut:]
+        if pieces:
+            await self._conn.write(self._rid, pieces)
+
+    def rekey(self, source_key):
+        """Attribute the following frames to another receiver ID (no-op without receiver IDs)."""
+        if self._rid is not None:
+            self._rid = receiver_id_frame(source_key)
+
+    def skip(self, data, tail_len):
+        """Discard `data` (an over-limit chunk) and anything held, keeping only the
+        last `tail_len` stream bytes — the start of the next, still incomplete frame."""
+        if tail_len <= 0:
+            self._hold = b""
+        elif tail_len <= len(data):
+            self._hold = data[len(data) - tail_len:]
+        else:
+            self._hold = (self._hold + data)[-tail_len:]
+
+    def close(self):
+        """Detach from the pool; an incomplete trailing frame is discarded."""
+        self._hold = b""
+        self._conn.channels -= 1
+
+
+class UpstreamPool:
+    def __init__(self, host, port, size=2, receiver_ids=False, backlog_limit=4 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.receiver_ids = receiver_ids
+        self.backlog_limit = backlog_limit
+        self._conns = [_UpstreamConn(self, i) for i in range(max(1, size))]
+
+    def start(self):
+        for conn in self._conns:
+            conn.start()
+
+    def channel(self, source_key):
+        """Attach a feeder to the least-loaded connection."""
+        conn = min(self._conns, key=lambda c: c.channels)
+        conn.channels += 1
+        rid = receiver_id_frame(source_key) if self.receiver_ids else None
+        return UpstreamChannel(conn, rid)
+
+    def stats(self):
+        return [conn.stats() for conn in self._conns]
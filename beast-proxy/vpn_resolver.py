@@ -1,10 +1,30 @@
-"""VPN resolver — identifies and resolves hostnames for Tailscale and NetBird peers."""
-
+"""VPN resolver — identifies and resolves hostnames for Tailscale and NetBird peers.
+
+Classification is a longest-prefix match over every configured range:
+TAILSCALE_CIDR and NETBIRD_CIDR each accept a comma-separated list, and
+SITE_CIDRS adds named site ranges ("hq=10.1.0.0/16,10.2.0.0/16;lab=172.16.0.0/12")
+that classify as conn_type 'site'. All ranges are compiled once into a
+PrefixTable — sorted, disjoint integer intervals (IPv4 and IPv6 on one number
+line) — so a lookup is one inet_pton and one bisect.
+
+Peer lists come from the NetBird management API (one keep-alive session)
+and the local tailscaled socket (one persistent connection). The refresher
+task fetches them on their own schedules (NETBIRD_REFRESH_INTERVAL,
+TAILSCALE_REFRESH_INTERVAL) with conditional requests, swaps each new map in
+atomically and reports which peers changed. Lookups only ever read the
+current map, so classification never waits on HTTP.
+"""
+
+import asyncio
+import bisect
+import concurrent.futures
+import hashlib
 import http.client
 import ipaddress
 import json
 import os
 import socket
+import threading
 import time
 
 import requests
@@ -19,161 +39,449 @@ NETBIRD_API_URL       = os.environ.get("NETBIRD_API_URL", "http://localhost:3307
 NETBIRD_API_TOKEN     = os.environ.get("NETBIRD_API_TOKEN", "")
 NETBIRD_CIDR          = os.environ.get("NETBIRD_CIDR", "100.64.0.0/10")
 
-# Pre-parse CIDR networks
-_tailscale_net = ipaddress.ip_network(TAILSCALE_CIDR, strict=False) if TAILSCALE_ENABLED else None
-_netbird_net   = ipaddress.ip_network(NETBIRD_CIDR,   strict=False) if NETBIRD_ENABLED  else None
-
-# Peer list caches — keyed by IP → {hostname, name}
-# Refreshed as a full list every _CACHE_TTL seconds to avoid per-IP API calls
-_CACHE_TTL = 60  # seconds
+# Named site ranges: "name=cidr[,cidr...];name=cidr..."
+SITE_CIDRS            = os.environ.get("SITE_CIDRS", "")
 
-_netbird_peers: dict  = {}   # ip → peer dict
-_netbird_cache_ts: float = 0.0
+# Peer list refresh schedule (seconds); NetBird lists can be several MB
+NETBIRD_REFRESH_INTERVAL   = int(os.environ.get("NETBIRD_REFRESH_INTERVAL", "300"))
+TAILSCALE_REFRESH_INTERVAL = int(os.environ.get("TAILSCALE_REFRESH_INTERVAL", "60"))
 
-_tailscale_peers: dict = {}  # ip → peer dict
-_tailscale_cache_ts: float = 0.0
+_RETRY_SECONDS = 30
+_HTTP_TIMEOUT = 10
 
+# IPv6 addresses live above every IPv4 address on the table's number line
+_V6 = 1 << 128
+# Among ranges of the same prefix length: site beats NetBird beats Tailscale
+_PRIORITY = {"site": 0, "netbird": 1, "tailscale": 2}
 
-# ── NetBird ───────────────────────────────────────────────────────────────────
 
-def _refresh_netbird():
-    """Refresh full NetBird peer list from management API."""
-    global _netbird_peers, _netbird_cache_ts
-    if not NETBIRD_API_TOKEN:
-        return
+def ip_key(ip_str):
+    """Integer key for an IP string (IPv4-mapped IPv6 folds to IPv4), or None."""
+    ip_str = ip_str.split("%", 1)[0]
     try:
-        resp = requests.get(
-            f"{NETBIRD_API_URL}/api/peers",
-            headers={"Authorization": f"Bearer {NETBIRD_API_TOKEN}",
-                     "Content-Type": "application/json"},
-            timeout=5,
-        )
-        if resp.status_code == 200:
-            peers = resp.json()
-            mapping = {}
-            for p in peers:
-                ip = p.get("ip", "")
-                if ip:
-                    mapping[ip] = p
-                for extra_ip in p.get("ip_addresses", []):
-                    if extra_ip and extra_ip != ip:
-                        mapping[extra_ip] = p
-            _netbird_peers = mapping
-            _netbird_cache_ts = time.monotonic()
-    except Exception as e:
-        print(f"[vpn] NetBird peer refresh failed: {e}")
-
-
-def _get_netbird_peer(ip_str):
-    """Return NetBird peer dict for an IP, or None."""
-    if not NETBIRD_ENABLED or not NETBIRD_API_TOKEN:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip_str), "big")
+    except OSError:
+        pass
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_str), "big")
+    except (OSError, ValueError):
         return None
-    if time.monotonic() - _netbird_cache_ts > _CACHE_TTL:
-        _refresh_netbird()
-    return _netbird_peers.get(ip_str)
+    if value >> 32 == 0xFFFF:
+        return value & 0xFFFFFFFF
+    return value | _V6
+
+
+def _split_cidrs(spec):
+    return [c.strip() for c in spec.split(",") if c.strip()]
+
+
+def _parse_sites(spec):
+    """SITE_CIDRS → [(name, [cidr, ...]), ...]."""
+    sites = []
+    for part in spec.split(";"):
+        name, sep, cidrs = part.partition("=")
+        if sep and name.strip():
+            sites.append((name.strip(), _split_cidrs(cidrs)))
+    return sites
+
+
+class PrefixTable:
+    """Longest-prefix match over many CIDRs, as sorted disjoint intervals.
+
+    Each interval maps to the tuple of values whose ranges cover it, most
+    specific first (ties broken by the order given by `priority`), so a
+    caller can still fall back from the best match to a broader one.
+    """
+
+    __slots__ = ("_starts", "_ends", "_values")
+
+    def __init__(self, entries, priority=None):
+        """entries: iterable of (cidr, value); invalid CIDRs are skipped with a warning."""
+        ranges = []
+        for cidr, value in entries:
+            try:
+                net = ipaddress.ip_network(cidr, strict=False)
+            except ValueError:
+                print(f"[vpn] Ignoring invalid CIDR {cidr!r} for {value}")
+                continue
+            base = _V6 if net.version == 6 else 0
+            start = int(net.network_address) | base
+            ranges.append((start, start + net.num_addresses - 1, net.prefixlen, value))
+
+        rank = priority or {}
+        cuts = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+        self._starts, self._ends, self._values = [], [], []
+        for lo, hi in zip(cuts, cuts[1:]):
+            covering = sorted((r for r in ranges if r[0] <= lo and hi - 1 <= r[1]),
+                              key=lambda r: (-r[2], rank.get(r[3], len(rank))))
+            values = tuple(dict.fromkeys(r[3] for r in covering))
+            if not values:
+                continue
+            if self._values and self._values[-1] == values and self._ends[-1] == lo - 1:
+                self._ends[-1] = hi - 1
+            else:
+                self._starts.append(lo)
+                self._ends.append(hi - 1)
+                self._values.append(values)
+
+    def lookup(self, key):
+        """Values covering an integer key, most specific first; () if none."""
+        i = bisect.bisect_right(self._starts, key) - 1
+        if i >= 0 and key <= self._ends[i]:
+            return self._values[i]
+        return ()
+
+    def __len__(self):
+        return len(self._starts)
+
+
+_sites = _parse_sites(SITE_CIDRS)
+_site_table = PrefixTable((cidr, name) for name, cidrs in _sites for cidr in cidrs)
+
+_range_entries = [(cidr, "site") for _, cidrs in _sites for cidr in cidrs]
+if NETBIRD_ENABLED:
+    _range_entries += [(cidr, "netbird") for cidr in _split_cidrs(NETBIRD_CIDR)]
+if TAILSCALE_ENABLED:
+    _range_entries += [(cidr, "tailscale") for cidr in _split_cidrs(TAILSCALE_CIDR)]
+_ranges = PrefixTable(_range_entries, _PRIORITY)
+
+
+class _PeerTable:
+    """Peer map (ip key → peer dict) for one VPN, replaced wholesale on refresh.
+
+    Lookups read whatever map is current — a stale one is still served while
+    the refresher fetches the next (stale-while-revalidate). refresh() runs
+    on the refresher's worker thread; the new map is swapped in with a single
+    assignment, and only peers whose hostname or address changed are
+    reported to the caller.
+    """
+
+    def __init__(self, name, source, interval, hostname_of):
+        self.name = name
+        self._source = source
+        self.interval = interval
+        self._hostname_of = hostname_of
+        self._peers = {}
+        self.due = 0.0          # monotonic time of the next scheduled fetch
+        self.fetched_at = 0.0
+        self.refreshes = 0
+        self.not_modified = 0
+        self.failures = 0
+        self._ready = threading.Event()
+
+    def get(self, key):
+        return self._peers.get(key)
+
+    def refresh(self):
+        """Fetch and swap in a new peer map. Returns the set of changed ip keys."""
+        try:
+            return self._refresh()
+        finally:
+            self._ready.set()
+
+    def _refresh(self):
+        try:
+            peers = self._source.fetch()
+        except Exception as e:
+            self.failures += 1
+            # Retry sooner than the regular schedule after a failure
+            self.due = time.monotonic() + min(self.interval, _RETRY_SECONDS)
+            print(f"[vpn] {self.name} peer refresh failed: {e}")
+            return set()
+        self.fetched_at = time.monotonic()
+        self.due = self.fetched_at + self.interval
+        if peers is None:
+            self.not_modified += 1
+            return set()
+
+        old, name_of = self._peers, self._hostname_of
+        if self.refreshes == 0:
+            # First list: nothing to compare against (startup reclassifies everything)
+            changed = set()
+            print(f"[vpn] {self.name}: {len(peers)} peer address(es)")
+        else:
+            changed = {
+                key for key in old.keys() | peers.keys()
+                if key not in old or key not in peers or name_of(old[key]) != name_of(peers[key])
+            }
+            if changed:
+                print(f"[vpn] {self.name}: {len(peers)} peer address(es), {len(changed)} changed")
+        self._peers = peers
+        self.refreshes += 1
+        return changed
+
+    def wait_ready(self, timeout):
+        return self._ready.wait(timeout)
+
+    def __len__(self):
+        return len(self._peers)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP/1.1 over a UNIX socket; http.client keeps it open between requests."""
+
+    def __init__(self, path, timeout):
+        super().__init__("local-tailscaled.sock", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+# ── NetBird ───────────────────────────────────────────────────────────────────
+
+class _NetBirdSource:
+    """/api/peers over one keep-alive requests.Session, with conditional GETs."""
+
+    def __init__(self):
+        self._session = None
+        self._validators = {}   # If-None-Match / If-Modified-Since for the next request
+
+    def fetch(self):
+        """Peer map keyed by ip key, or None when the server answered 304."""
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.headers.update({"Authorization": f"Bearer {NETBIRD_API_TOKEN}",
+                                          "Accept": "application/json"})
+        try:
+            resp = self._session.get(f"{NETBIRD_API_URL}/api/peers",
+                                     headers=self._validators, timeout=_HTTP_TIMEOUT)
+        except requests.RequestException:
+            self._session.close()
+            self._session = None
+            raise
+        if resp.status_code == 304:
+            return None
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        self._validators = _validators(resp.headers)
+        mapping = {}
+        for p in resp.json():
+            for addr in [p.get("ip", "")] + list(p.get("ip_addresses", [])):
+                key = ip_key(addr) if addr else None
+                if key is not None:
+                    mapping[key] = p
+        return mapping
+
+
+def _netbird_hostname(peer):
+    return peer.get("name") or peer.get("hostname", "")
 
 
 # ── Tailscale ─────────────────────────────────────────────────────────────────
 
-def _refresh_tailscale():
-    """Refresh full Tailscale peer list from local socket API."""
-    global _tailscale_peers, _tailscale_cache_ts
-    if not os.path.exists(TAILSCALE_API_SOCKET):
-        return
+class _TailscaleSource:
+    """/localapi/v0/status over one persistent UNIX-socket connection.
+
+    tailscaled sends no validators, so an unchanged status is recognised by
+    its digest and not parsed again.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._validators = {}
+        self._digest = None
+
+    def _get(self):
+        headers = dict(self._validators, **{"Sec-Tailscale": "localapi"})
+        # One retry: a kept-alive connection may have been closed by tailscaled
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = _UnixHTTPConnection(TAILSCALE_API_SOCKET, _HTTP_TIMEOUT)
+            try:
+                self._conn.request("GET", "/localapi/v0/status", headers=headers)
+                resp = self._conn.getresponse()
+                return resp, resp.read()
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+    def fetch(self):
+        """Peer map keyed by ip key, or None when the status is unchanged."""
+        if not os.path.exists(TAILSCALE_API_SOCKET):
+            return None
+        resp, body = self._get()
+        if resp.status == 304:
+            return None
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
+        self._validators = _validators(resp.headers)
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if digest == self._digest:
+            return None
+        data = json.loads(body)
+        mapping = {}
+        for peer in data.get("Peer", {}).values():
+            for addr in peer.get("TailscaleIPs", []):
+                key = ip_key(addr)
+                if key is not None:
+                    mapping[key] = peer
+        self._digest = digest
+        return mapping
+
+
+def _tailscale_hostname(peer):
+    return peer.get("HostName", "")
+
+
+def _validators(headers):
+    """Conditional-request headers for the next fetch, from a 200 response's headers."""
+    out = {}
+    if headers.get("ETag"):
+        out["If-None-Match"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        out["If-Modified-Since"] = headers["Last-Modified"]
+    return out
+
+
+_netbird_peers   = _PeerTable("NetBird", _NetBirdSource(), NETBIRD_REFRESH_INTERVAL, _netbird_hostname)
+_tailscale_peers = _PeerTable("Tailscale", _TailscaleSource(), TAILSCALE_REFRESH_INTERVAL,
+                              _tailscale_hostname)
+
+# Only the enabled VPNs are ever looked up or refreshed
+_peer_tables = {}
+if NETBIRD_ENABLED and NETBIRD_API_TOKEN:
+    _peer_tables["netbird"] = _netbird_peers
+if TAILSCALE_ENABLED:
+    _peer_tables["tailscale"] = _tailscale_peers
+
+
+def _get_peer(conn_type, key):
+    table = _peer_tables.get(conn_type)
+    return table.get(key) if table is not None else None
+
+
+# ── Refresher ─────────────────────────────────────────────────────────────────
+
+_loop = None
+_wake = None
+
+
+async def refresher(on_change=None):
+    """Refresh enabled peer lists on their schedules, for the proxy's lifetime.
+
+    Fetches run one at a time on a dedicated worker thread so the event loop
+    and the enrichment executor never wait on the VPN APIs. on_change(keys)
+    is called on the loop with the ip keys whose peer appeared, vanished or
+    was renamed.
+    """
+    global _loop, _wake
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="vpn-refresh")
     try:
-        class _SockConn(http.client.HTTPConnection):
-            def connect(self):
-                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                self.sock.connect(TAILSCALE_API_SOCKET)
-
-        conn = _SockConn("local-tailscaled.sock")
-        conn.request("GET", "/localapi/v0/status", headers={"Sec-Tailscale": "localapi"})
-        resp = conn.getresponse()
-        if resp.status == 200:
-            data = json.loads(resp.read())
-            mapping = {}
-            for peer in data.get("Peer", {}).values():
-                for addr in peer.get("TailscaleIPs", []):
-                    mapping[addr] = peer
-            _tailscale_peers = mapping
-            _tailscale_cache_ts = time.monotonic()
-    except Exception as e:
-        print(f"[vpn] Tailscale peer refresh failed: {e}")
-
-
-def _get_tailscale_peer(ip_str):
-    """Return Tailscale peer dict for an IP, or None."""
-    if not TAILSCALE_ENABLED:
-        return None
-    if time.monotonic() - _tailscale_cache_ts > _CACHE_TTL:
-        _refresh_tailscale()
-    return _tailscale_peers.get(ip_str)
+        while _peer_tables:
+            for table in list(_peer_tables.values()):
+                if time.monotonic() >= table.due:
+                    changed = await _loop.run_in_executor(executor, table.refresh)
+                    if changed and on_change is not None:
+                        on_change(changed)
+            delay = min(t.due for t in _peer_tables.values()) - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(_wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            _wake.clear()
+    finally:
+        _loop = _wake = None
+        executor.shutdown(wait=False)
 
 
 # ── Classification ────────────────────────────────────────────────────────────
 
 def classify_connection(ip_str):
-    """Classify an IP as 'netbird', 'tailscale', or 'public'.
+    """Classify an IP as 'netbird', 'tailscale', 'site', or 'public'.
 
-    NetBird is checked first because it is the primary VPN. An explicit peer
-    match always wins over a CIDR-only match. When both CIDRs overlap (both
-    default to 100.64.0.0/10) and neither API returns a match, NetBird is
-    preferred in the fallback.
+    An explicit peer match always wins over a range-only match, NetBird
+    first (primary VPN). Otherwise the most specific configured range
+    decides; when equally specific ranges overlap (both VPN CIDRs default
+    to 100.64.0.0/10), site is preferred, then NetBird.
     """
-    try:
-        addr = ipaddress.ip_address(ip_str)
-    except ValueError:
+    key = ip_key(ip_str)
+    if key is None:
         return "public"
+    candidates = _ranges.lookup(key)
+    if not candidates:
+        return "public"
+    for conn_type in ("netbird", "tailscale"):
+        if conn_type in candidates and _get_peer(conn_type, key):
+            return conn_type
+    return candidates[0]
 
-    in_netbird_range    = NETBIRD_ENABLED    and _netbird_net    and addr in _netbird_net
-    in_tailscale_range  = TAILSCALE_ENABLED  and _tailscale_net  and addr in _tailscale_net
-
-    # Explicit peer match — NetBird first (primary VPN)
-    if in_netbird_range and _get_netbird_peer(ip_str):
-        return "netbird"
-
-    if in_tailscale_range and _get_tailscale_peer(ip_str):
-        return "tailscale"
-
-    # CIDR-only fallback — NetBird preferred
-    if in_netbird_range:
-        return "netbird"
-    if in_tailscale_range:
-        return "tailscale"
 
-    return "public"
+def site_name(ip_str):
+    """Name of the most specific SITE_CIDRS range containing the IP, or None."""
+    key = ip_key(ip_str)
+    names = _site_table.lookup(key) if key is not None else ()
+    return names[0] if names else None
 
 
 def resolve_hostname(ip_str, conn_type):
     """Resolve hostname for a given IP based on connection type."""
+    key = ip_key(ip_str)
+    if key is None:
+        return None
     if conn_type == "netbird":
-        peer = _get_netbird_peer(ip_str)
+        peer = _get_peer("netbird", key)
         if peer:
             return peer.get("name") or peer.get("hostname", "")
     elif conn_type == "tailscale":
-        peer = _get_tailscale_peer(ip_str)
+        peer = _get_peer("tailscale", key)
         if peer:
             return peer.get("HostName", "")
     return None
 
 
+def wait_ready(timeout=10):
+    """Block until every enabled peer list has been fetched once (or timeout)."""
+    deadline = time.monotonic() + timeout
+    for table in _peer_tables.values():
+        table.wait_ready(max(0.0, deadline - time.monotonic()))
+
+
 def refresh_caches():
-    """Force refresh of all VPN peer caches."""
-    global _netbird_cache_ts, _tailscale_cache_ts
-    _netbird_cache_ts = 0.0
-    _tailscale_cache_ts = 0.0
+    """Refresh all VPN peer lists now instead of at their next scheduled time.
+
+    Only schedules the fetch when the refresher is running; without it
+    (one-off scripts) the lists are fetched synchronously.
+    """
+    for table in _peer_tables.values():
+        table.due = 0.0
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+    else:
+        for table in _peer_tables.values():
+            table.refresh()
 
 
 def get_vpn_summary():
     """Return summary of VPN configuration for status display."""
+    now = time.monotonic()
+
+    def _peers(table):
+        age = now - table.fetched_at if table.fetched_at else None
+        return {"peers": len(table), "refresh_interval": table.interval,
+                "refreshes": table.refreshes, "not_modified": table.not_modified,
+                "failures": table.failures,
+                "age_seconds": round(age, 1) if age is not None else None}
+
     return {
         "tailscale": {
             "enabled": TAILSCALE_ENABLED,
             "cidr": TAILSCALE_CIDR,
+            **_peers(_tailscale_peers),
         },
         "netbird": {
             "enabled": NETBIRD_ENABLED,
             "cidr": NETBIRD_CIDR,
             "api_url": NETBIRD_API_URL if NETBIRD_ENABLED else None,
+            **_peers(_netbird_peers),
         },
+        "sites": {name: cidrs for name, cidrs in _sites},
+        "ranges": len(_ranges),
     }
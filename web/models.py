@@ -2,11 +2,16 @@
 
 import json
 import os
+import socket
 import sqlite3
 import uuid
 from datetime import datetime, timezone
 
+from services import live_state
+
 DB_PATH = os.environ.get("DB_PATH", "/data/aggregator.db")
+# beast-proxy control socket on the shared /data volume (output drop notifications)
+BEAST_PROXY_CONTROL_SOCKET = os.environ.get("BEAST_PROXY_CONTROL_SOCKET", "/data/beast-proxy.sock")
 
 # settings.key for System Health UI: CoT phase timing on this page
 SETTINGS_KEY_COT_PHASE_TIMING_UI = "cot_phase_timing_ui"
@@ -331,12 +336,14 @@ def enrich_feeder_mlat_display(feeder):
 class FeederModel:
     @staticmethod
     def get_all(status_filter=None, conn_type_filter=None):
+        """Feeder rows; status and live counters come from beast-proxy's live table when available."""
+        live = live_state.read()
         conn = get_db()
         query = "SELECT * FROM feeders"
         params = []
         conditions = []
 
-        if status_filter and status_filter != "all":
+        if status_filter and status_filter != "all" and live is None:
             conditions.append("status = ?")
             params.append(status_filter)
         if conn_type_filter and conn_type_filter != "all":
@@ -349,7 +356,12 @@ class FeederModel:
 
         rows = conn.execute(query, params).fetchall()
         conn.close()
-        return dict_rows(rows)
+        feeders = dict_rows(rows)
+        if live is not None:
+            feeders = live_state.overlay(feeders, live)
+            if status_filter and status_filter != "all":
+                feeders = [f for f in feeders if f.get("status") == status_filter]
+        return feeders
 
     @staticmethod
     def get_by_id(feeder_id):
@@ -380,7 +392,12 @@ class FeederModel:
 
     @staticmethod
     def get_stats():
+        live = live_state.read()
         conn = get_db()
+        if live is not None:
+            rows = dict_rows(conn.execute("SELECT id, status, conn_type FROM feeders").fetchall())
+            conn.close()
+            return live_state.stats(live_state.overlay(rows, live))
         total = conn.execute("SELECT COUNT(*) as c FROM feeders").fetchone()["c"]
         active = conn.execute("SELECT COUNT(*) as c FROM feeders WHERE status='active'").fetchone()["c"]
         stale = conn.execute("SELECT COUNT(*) as c FROM feeders WHERE status='stale'").fetchone()["c"]
@@ -434,6 +451,8 @@ class FeederModel:
         conn.execute(f"UPDATE feeders SET {', '.join(fields)} WHERE id = ?", values)
         conn.commit()
         conn.close()
+        # beast-proxy's identity index caches names for MLAT attribution
+        notify_beast_proxy("feeders-changed")
         return True
 
     @staticmethod
@@ -442,6 +461,7 @@ class FeederModel:
         conn.execute("DELETE FROM feeders WHERE id = ?", (feeder_id,))
         conn.commit()
         conn.close()
+        notify_beast_proxy("feeders-changed")
 
     @staticmethod
     def purge_old(hours=24):
@@ -454,6 +474,8 @@ class FeederModel:
         count = cur.rowcount
         conn.commit()
         conn.close()
+        if count:
+            notify_beast_proxy("feeders-changed")
         return count
 
     @staticmethod
@@ -466,6 +488,8 @@ class FeederModel:
         count = cur.rowcount
         conn.commit()
         conn.close()
+        if count:
+            notify_beast_proxy("feeders-changed")
         return count
         return True
 
@@ -577,6 +601,25 @@ def _set_feeder_stale_snapshot(conn, feeder_id: int, last_messages: int, ts_utc:
     )
 
 
+def _sync_live_status(conn, live):
+    """Copy beast-proxy's live status into feeders.status, touching only rows that differ.
+
+    Offline is left to beast-proxy itself (it writes it on disconnect), so a
+    feeder that is not connected keeps whatever status the DB has.
+    """
+    rows = conn.execute("SELECT id, status FROM feeders").fetchall()
+    changes = [
+        (live[r["id"]]["status"], r["id"]) for r in rows
+        if r["id"] in live and live[r["id"]]["status"] != "offline"
+        and live[r["id"]]["status"] != r["status"]
+    ]
+    if changes:
+        conn.executemany(
+            "UPDATE feeders SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", changes
+        )
+        conn.commit()
+
+
 def mark_stale_feeders():
     """Mark feeders as stale/active based on recent message rate instead of VPN state.
 
@@ -588,8 +631,16 @@ def mark_stale_feeders():
       - Refresh the snapshot to the current counters/time.
     This way a feeder that remains connected at VPN level but stops sending ADS-B messages will
     eventually move from active -> stale, and one that resumes traffic will move back to active.
+
+    While beast-proxy publishes its live state table, its per-connection view replaces the
+    snapshots: statuses are copied from it and no settings rows are written.
     """
     conn = get_db()
+    live = live_state.read()
+    if live is not None:
+        _sync_live_status(conn, live)
+        conn.close()
+        return
     now_ts = datetime.now(timezone.utc).timestamp()
 
     rows = conn.execute(
@@ -1979,8 +2030,21 @@ class OutputCotCertModel:
             return None
 
 
+def notify_beast_proxy(message: str) -> None:
+    """Best-effort datagram to beast-proxy's control socket (ignored if the proxy is down)."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+            s.sendto(message.encode(), BEAST_PROXY_CONTROL_SOCKET)
+    except OSError:
+        pass
+
+
 def signal_drop_output(output_id: int):
-    """Signal beast-proxy to drop active connections for this output_id."""
+    """Signal beast-proxy to drop active connections for this output_id.
+
+    The DB row is the durable fallback (polled each stats cycle); the
+    datagram on the control socket makes the drop immediate.
+    """
     conn = get_db()
     conn.execute(
         "INSERT OR REPLACE INTO output_drop_signals (output_id) VALUES (?)",
@@ -1988,3 +2052,4 @@ def signal_drop_output(output_id: int):
     )
     conn.commit()
     conn.close()
+    notify_beast_proxy(f"drop {int(output_id)}")
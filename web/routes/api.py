@@ -34,6 +34,8 @@ INSTALL_DIR = os.environ.get("INSTALL_DIR", "/opt/taknet-aggregator")
 AIRCRAFT_JSON_URL = os.environ.get("AIRCRAFT_JSON_URL", "http://tar1090:80/data/aircraft.json")
 # Shared volume mount where feeder/merger write connection status (read-only in dashboard)
 ADSBHUB_STATUS_PATH = os.environ.get("ADSBHUB_STATUS_PATH", "/app/var/adsbhub-status")
+# beast-proxy's HTTP listener (/metrics, /series/<feeder_id>) on the compose network
+BEAST_PROXY_API_URL = os.environ.get("BEAST_PROXY_API_URL", "http://beast-proxy:9105")
 
 _start_time = time.time()
 
@@ -393,7 +395,7 @@ def feeder_merge(feeder_id):
     if int(into_id) == feeder_id:
         return jsonify({"error": "Cannot merge a feeder into itself"}), 400
 
-    from models import get_db
+    from models import get_db, notify_beast_proxy
     conn = get_db()
     try:
         # Re-parent connection history
@@ -409,6 +411,8 @@ def feeder_merge(feeder_id):
         # Delete the duplicate
         conn.execute("DELETE FROM feeders WHERE id = ?", (feeder_id,))
         conn.commit()
+        # beast-proxy caches feeder identities; have it reload
+        notify_beast_proxy("feeders-changed")
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -444,6 +448,25 @@ def feeder_connections(feeder_id):
     return jsonify({"connections": connections})
 
 
+@bp.route("/feeders/<int:feeder_id>/series")
+@network_admin_required
+def feeder_series(feeder_id):
+    """Throughput history for a feeder (10s/1h, 1m/24h or 10m/30d) from beast-proxy."""
+    row = FeederModel.get_by_id(feeder_id)
+    if not row or not user_can_access_feeder(row, current_user.username, current_user.role):
+        return jsonify({"error": "Feeder not found"}), 404
+    resolution = request.args.get("resolution", "10s")
+    if resolution not in ("10s", "1m", "10m"):
+        return jsonify({"error": "resolution must be 10s, 1m or 10m"}), 400
+    try:
+        r = http_requests.get(f"{BEAST_PROXY_API_URL}/series/{feeder_id}",
+                              params={"resolution": resolution}, timeout=3)
+        r.raise_for_status()
+        return jsonify(r.json())
+    except Exception as e:
+        return jsonify({"error": f"beast-proxy unavailable: {e}"}), 503
+
+
 # ── Aircraft ─────────────────────────────────────────────────────────────────
 
 @bp.route("/aircraft")
@@ -0,0 +1,147 @@
+"""Live feeder state — reader for the mmap table beast-proxy publishes.
+
+beast-proxy rewrites /data/live-feeders.bin about once a second with one
+record per known feeder: status, open connections, counters over the open
+connections, smoothed rates and last_data. The layout and the sequence lock
+are described in beast-proxy/live_state.py; the structs below must match it.
+
+read() returns {feeder_id: record dict}, or None when the file is missing,
+has an unknown layout, or is older than LIVE_STATE_MAX_AGE (beast-proxy not
+running) — callers then fall back to the feeders table.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+LIVE_STATE_PATH    = os.environ.get("LIVE_STATE_PATH", "/data/live-feeders.bin")
+LIVE_STATE_MAX_AGE = float(os.environ.get("LIVE_STATE_MAX_AGE", "10"))
+
+MAGIC = b"TKLS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIdI4x")
+RECORD = struct.Struct("<IBBH16sQQQfffdd")
+STATUSES = ("offline", "active", "stale")
+
+_lock = threading.Lock()
+_map = None      # (mmap, inode)
+_cache = None    # (sequence, updated_at, records) of the last successful read
+
+
+def _mapping():
+    """Current mmap of the state file, remapped when beast-proxy replaced it."""
+    global _map
+    try:
+        st = os.stat(LIVE_STATE_PATH)
+    except OSError:
+        return None
+    if _map is not None and _map[1] == st.st_ino and len(_map[0]) == st.st_size:
+        return _map[0]
+    if _map is not None:
+        _map[0].close()
+        _map = None
+    if st.st_size < HEADER.size:
+        return None
+    with open(LIVE_STATE_PATH, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _map = (mm, st.st_ino)
+    return mm
+
+
+def _decode(raw, count):
+    records = {}
+    for (fid, status, _, conns, conn_type, nbytes, msgs, positions,
+         byte_rate, msg_rate, pos_rate, last_data, connected_at) in RECORD.iter_unpack(raw[:count * RECORD.size]):
+        records[fid] = {
+            "status": STATUSES[status] if status < len(STATUSES) else "offline",
+            "conn_type": conn_type.rstrip(b"\0").decode(errors="replace") or None,
+            "connections": conns,
+            "bytes": nbytes,
+            "messages": msgs,
+            "positions": positions,
+            "byte_rate": round(byte_rate, 1),
+            "msg_rate": round(msg_rate, 2),
+            "pos_rate": round(pos_rate, 2),
+            "last_data": last_data or None,
+            "connected_at": connected_at or None,
+        }
+    return records
+
+
+def read():
+    """{feeder_id: live record} from beast-proxy, or None when unavailable or stale."""
+    global _cache
+    with _lock:
+        try:
+            mm = _mapping()
+        except (OSError, ValueError):
+            return None
+        if mm is None:
+            return None
+        for _ in range(5):
+            magic, version, rsize, seq, count, updated_at, capacity = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION or rsize != RECORD.size:
+                return None
+            if seq & 1:
+                time.sleep(0.001)
+                continue
+            if _cache is not None and _cache[0] == seq and _cache[1] == updated_at:
+                records = _cache[2]
+                break
+            end = HEADER.size + min(count, capacity) * RECORD.size
+            if end > len(mm):
+                return None
+            raw = mm[HEADER.size:end]
+            if HEADER.unpack_from(mm, 0)[3] != seq:
+                continue  # rewritten during the copy
+            records = _decode(raw, min(count, capacity))
+            _cache = (seq, updated_at, records)
+            break
+        else:
+            return None
+    if time.time() - updated_at > LIVE_STATE_MAX_AGE:
+        return None
+    return records
+
+
+def overlay(feeders, live):
+    """Copy of feeder rows with live counters from `live` attached.
+
+    The live status replaces the DB status only for connected feeders; for the
+    rest beast-proxy publishes "offline", while the DB keeps the last status
+    it recorded (see models._sync_live_status), and the DB is what counts.
+    """
+    out = []
+    for f in feeders:
+        rec = live.get(f.get("id"))
+        if rec is not None:
+            f = dict(f)
+            if rec["connections"]:
+                f["status"] = rec["status"]
+            f["live"] = rec
+        out.append(f)
+    return out
+
+
+def stats(feeders):
+    """FeederModel.get_stats() shape for feeder rows already passed through overlay()."""
+    counts = {"active": 0, "stale": 0, "offline": 0}
+    by_ct = {}
+    for f in feeders:
+        counts[f["status"]] = counts.get(f["status"], 0) + 1
+        ct = f["conn_type"]
+        if ct not in by_ct:
+            by_ct[ct] = {"conn_type": ct, "count": 0, "active_count": 0}
+        by_ct[ct]["count"] += 1
+        if f["status"] == "active":
+            by_ct[ct]["active_count"] += 1
+    return {
+        "total": len(feeders),
+        "active": counts["active"],
+        "stale": counts["stale"],
+        "offline": counts["offline"],
+        # GROUP BY conn_type order, as in the feeders-table query
+        "breakdown": sorted(by_ct.values(), key=lambda b: (b["conn_type"] is not None, b["conn_type"] or "")),
+    }
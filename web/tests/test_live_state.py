@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import models  # noqa: E402
+from services import live_state  # noqa: E402
+
+
+def _live(status, connections):
+    return {"status": status, "conn_type": "public", "connections": connections, "bytes": 0,
+            "messages": 0, "positions": 0, "byte_rate": 0.0, "msg_rate": 0.0, "pos_rate": 0.0,
+            "last_data": None, "connected_at": None}
+
+
+class LiveOverlayTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        models.DB_PATH = os.path.join(self._dir.name, "test.db")
+        models._initialized = False
+        conn = models.get_db()
+        conn.executemany(
+            "INSERT INTO feeders (id, name, conn_type, status, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)",
+            [
+                (1, "connected", "public", "active"),
+                (2, "quiet", "netbird", "stale"),       # disconnected; beast-proxy publishes offline
+                (3, "gone", "public", "offline"),
+                (4, "unknown", "tailscale", "active"),  # not in the live table at all
+            ],
+        )
+        conn.commit()
+        conn.close()
+        self.live = {1: _live("active", 1), 2: _live("offline", 0), 3: _live("offline", 0)}
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_stats_match_with_and_without_live_state(self):
+        with mock.patch.object(live_state, "read", return_value=None):
+            without = models.FeederModel.get_stats()
+        with mock.patch.object(live_state, "read", return_value=self.live):
+            with_live = models.FeederModel.get_stats()
+        self.assertEqual(with_live, without)
+        self.assertEqual(without["stale"], 1)
+
+    def test_status_comes_from_live_only_for_connected_feeders(self):
+        self.live[1] = _live("stale", 1)
+        with mock.patch.object(live_state, "read", return_value=self.live):
+            feeders = {f["id"]: f for f in models.FeederModel.get_all()}
+            stale = models.FeederModel.get_all(status_filter="stale")
+            stats = models.FeederModel.get_stats()
+        self.assertEqual({fid: f["status"] for fid, f in feeders.items()},
+                         {1: "stale", 2: "stale", 3: "offline", 4: "active"})
+        self.assertEqual(sorted(f["id"] for f in stale), [1, 2])
+        self.assertEqual((stats["active"], stats["stale"], stats["offline"]), (1, 2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()